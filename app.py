@@ -1,107 +1,136 @@
-from flask import Flask, flash, render_template, request, redirect, url_for, session
+from flask import Flask, Response, flash, render_template, request, redirect, url_for, session, jsonify, send_file
+from werkzeug.middleware.proxy_fix import ProxyFix
+import json
 import sqlite3
 import os
-import matplotlib.pyplot as plt
-import numpy as np
-import pandas as pd
-import folium
-import io
-import base64
-from werkzeug.security import generate_password_hash, check_password_hash
+import threading
+from collections import OrderedDict
 from datetime import datetime
+from urllib.parse import urlencode
+from db import get_db_connection, connect, close_db, close_pool
+from migrations import run_migrations, pending_migrations
+from cache import LRUCache, bump_data_version, get_data_version
+from http_cache import cached_page, version_token
+from charts import ChartService, CHART_FORMATS
+from pagination import paginate
+from exports import (EXPORTS, EXPORT_FORMATS, COLUMNAR_FORMATS, columnar_available, selected_filters, export_response,
+                     accepts_gzip, gzip_chunks, iter_batches)
+from site_index import SiteIndex, parse_bbox, DEFAULT_MARKER_LIMIT
+from site_tiles import valid_tile, tile_features, features_query, iter_geojson
+from site_geo import MAX_DISTANCE_KM, MAX_NEAREST, sites_in_bbox, sites_within, nearest_sites
+from price_analytics import refresh_mineral_stats, load_price_analytics
+from compare import COMPARE_METRICS, build_comparison
+from country_summaries import COUNTRY_QUERY, refresh_country_summaries, load_country_summary
+from search import SEARCH_SOURCES, search
+from insights import FEED_PAGE_SIZE, fetch_insights, fetch_insight
+from price_series import RESOLUTIONS, DEFAULT_POINTS, parse_time, series_minerals, series_range, query_series
+from jobs import JOB_KINDS, FINISHED_STATUSES, JobQueue
+from lazy_imports import warm_up
+from instrumentation import init_instrumentation, metrics, profiler, timed
+from auth import (AuthBusy, LOGIN_QUERY, admin_required, role_required, current_role, is_admin, role_cache,
+                  hash_password, verify_password, is_password_hash, ip_limiter, username_limiter, account_limiter)
 # -------------------------
 # App Setup
 # -------------------------
 app = Flask(__name__)
-app.secret_key = "super_secret_key_123"  # Change this to something unique!
+app.secret_key = os.environ.get("SECRET_KEY", "super_secret_key_123")  # Change this to something unique!
+
+# Behind a reverse proxy, set PROXY_FIX_HOPS to the number of proxies in
+# front of the app, so request.remote_addr (which the login rate limits
+# key on) is the client's address from X-Forwarded-For, not the proxy's.
+PROXY_FIX_HOPS = int(os.environ.get("PROXY_FIX_HOPS", 0))
+if PROXY_FIX_HOPS:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=PROXY_FIX_HOPS, x_proto=PROXY_FIX_HOPS)
 
 # -------------------------
 # Database Connection Helper
 # -------------------------
-def get_db_connection():
-    db_path = os.path.join("Data", "userdata.db")
-    conn = sqlite3.connect(db_path, timeout=10)
-    conn.row_factory = sqlite3.Row
-    return conn
+# get_db_connection() hands out one pooled connection per request (see db.py);
+# it goes back to the pool when the app context is torn down.
+app.teardown_appcontext(close_db)
 
 
-# ----------------------------------------
-# Connect to SQLite database
-db_path = os.path.join("Data", "userdata.db")
-conn = sqlite3.connect(db_path)
-cur = conn.cursor()
-
-# Drop the old mineral_prices table
-cur.execute("DROP TABLE IF EXISTS mineral_prices")
+# -------------------------
+# Instrumentation
+# -------------------------
+# Per-request DB, template, chart and map timings; see instrumentation.py.
+init_instrumentation(app)
 
-# Create the new table using MineralName
-cur.execute("""
-    CREATE TABLE mineral_prices (
-        PriceID INTEGER PRIMARY KEY AUTOINCREMENT,
-        MineralName TEXT NOT NULL,
-        Year INTEGER NOT NULL,
-        PriceUSD_per_tonne REAL NOT NULL
-    )
-""")
-
-# ----------------------------------------
-# Define historical pricing data
-# ----------------------------------------
-historical_prices = [
-    ("Cobalt",    2023, 50229.0),
-    ("Cobalt",    2024, 49822.0),
-    ("Cobalt",    2025, 52000.0),
-    ("Graphite",  2023, 729.0),
-    ("Graphite",  2024, 821.0),
-    ("Graphite",  2025, 800.0),
-    ("Lithium",   2023, 64093.0),
-    ("Lithium",   2024, 69273.0),
-    ("Lithium",   2025, 70000.0),
-    ("Manganese", 2023, 1980.0),
-    ("Manganese", 2024, 2300.0),
-    ("Manganese", 2025, 2200.0)
-]
-
-# ----------------------------------------
-# Insert data while preventing duplicates
-# ----------------------------------------
-for name, year, price in historical_prices:
-    cur.execute("""
-        SELECT 1 FROM mineral_prices
-        WHERE MineralName = ? AND Year = ?
-    """, (name, year))
-    
-    if not cur.fetchone():
-        cur.execute("""
-            INSERT INTO mineral_prices (MineralName, Year, PriceUSD_per_tonne)
-            VALUES (?, ?, ?)
-        """, (name, year, price))
 
-# ----------------------------------------
-# Finalize and close connection
-# ----------------------------------------
-conn.commit()
+# -------------------------
+# Schema Migrations
+# -------------------------
+# Read-only when the schema is current; see migrations.py.
+conn = connect()
+run_migrations(conn)
 conn.close()
 
 
+# -------------------------
+# Background Job Queue
+# -------------------------
+# Heavy exports and data reloads run on this process's job workers (see
+# jobs.py); JOB_WORKERS=0 leaves them queued for another process to run.
+job_queue = JobQueue()
+
+
+# -------------------------
+# Per-Process Setup
+# -------------------------
+# Importing this module does the one-off work (migrations, module-level
+# caches), starts no threads and leaves the heavy libraries unloaded (see
+# lazy_imports.py), so a preforking server can import it once and fork. Everything that must not cross a fork - pooled SQLite
+# connections and the job worker threads - is set up per process here.
+
+def init_worker():
+    """Prepares a freshly started or forked serving process."""
+    close_pool()   # drop any connections inherited from the parent
+    job_queue.start()
+    warm_up()      # no-op for modules the parent already imported
+
+
+def shutdown_worker():
+    """Lets running jobs finish and closes the pool before the process exits."""
+    job_queue.stop()
+    close_pool()
+    metrics.save_snapshot(force=True)
+
+
+@app.before_request
+def ensure_worker_started():
+    # Covers servers without a post-fork hook (the dev server, flask run);
+    # job_queue.start() returns at once when this process already started it
+    job_queue.start()
+
+
 # -------------------------
 # Routes
 # -------------------------
 
 # --- ROLE-BASED HOME ---
+# Role names (roles.RoleName) to the role part of the shared page URLs
+ROLE_SLUGS = {'Administrator': 'admin', 'Investor': 'investor', 'Researcher': 'researcher'}
+
+
+def role_slug():
+    """The logged-in user's role as used in URLs, or None."""
+    role = current_role()
+    return ROLE_SLUGS.get(role['RoleName']) if role else None
+
+
 @app.route('/home')
 def home():
     if 'username' not in session:
         return redirect(url_for('login'))
 
-    role_id = session.get('role_id')
+    role = role_slug()
     username = session['username']
 
-    if role_id == 1:
+    if role == 'admin':
         return render_template('admin_home.html', username=username)
-    elif role_id == 2:
+    elif role == 'investor':
         return render_template('investor_home.html', username=username, role='investor')
-    elif role_id == 3:
+    elif role == 'researcher':
         return render_template('researcher_home.html', username=username, role='researcher')
     else:
         return render_template('error.html', message="Unknown role.")
@@ -133,7 +162,12 @@ def register_user():
                                timestamp=datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
 
     # Hash the password securely
-    password_hash = generate_password_hash(password)
+    try:
+        password_hash = hash_password(password)
+    except AuthBusy:
+        return render_template('login.html',
+                               error="The server is busy. Please try again in a moment.",
+                               timestamp=datetime.now().strftime("%Y-%m-%d %H:%M:%S")), 503
 
     conn = get_db_connection()
     cur = conn.cursor()
@@ -172,37 +206,59 @@ def register_user():
 # Admin: Manage Users
 # -------------------------
 @app.route('/admin/users', methods=['GET'])
+@admin_required
 def view_users():
     conn = get_db_connection()
-    users = conn.execute("SELECT * FROM users").fetchall()
+    page = paginate(conn, 'users', request.args)
     conn.close()
-    return render_template('admin_users_menu.html', users=users)
+    return render_template('admin_users_menu.html', users=page.rows, page=page)
 
 @app.route('/admin/users/add', methods=['POST'])
+@admin_required
 def add_user():
     username = request.form['username']
     password = request.form['password']
     role_id = request.form['role_id']
+    try:
+        password_hash = hash_password(password)
+    except AuthBusy:
+        flash("The server is busy. Please try again in a moment.", "error")
+        return redirect(url_for('view_users'))
     conn = get_db_connection()
-    conn.execute("INSERT INTO users (Username, PasswordHash, RoleID) VALUES (?, ?, ?)", (username, password, role_id))
+    conn.execute("INSERT INTO users (Username, PasswordHash, RoleID) VALUES (?, ?, ?)",
+                 (username, password_hash, role_id))
     conn.commit()
     conn.close()
     flash(f"User '{username}' added successfully.", "success")
     return redirect(url_for('view_users'))
 
 @app.route('/admin/users/edit/<int:user_id>', methods=['POST'])
+@admin_required
 def edit_user(user_id):
     username = request.form['username']
-    password = request.form['password']
+    password = request.form.get('password', '')
     role_id = request.form['role_id']
+    # A blank password (or the stored hash, from an older form) keeps the current one
+    password_hash = None
+    if password and not is_password_hash(password):
+        try:
+            password_hash = hash_password(password)
+        except AuthBusy:
+            flash("The server is busy. Please try again in a moment.", "error")
+            return redirect(url_for('view_users'))
     conn = get_db_connection()
-    conn.execute("UPDATE users SET Username = ?, PasswordHash = ?, RoleID = ? WHERE UserID = ?", (username, password, role_id, user_id))
+    if password_hash:
+        conn.execute("UPDATE users SET Username = ?, PasswordHash = ?, RoleID = ? WHERE UserID = ?",
+                     (username, password_hash, role_id, user_id))
+    else:
+        conn.execute("UPDATE users SET Username = ?, RoleID = ? WHERE UserID = ?", (username, role_id, user_id))
     conn.commit()
     conn.close()
     flash(f"User '{username}' updated successfully.", "info")
     return redirect(url_for('view_users'))
 
 @app.route('/admin/users/delete/<int:user_id>', methods=['POST'])
+@admin_required
 def delete_user(user_id):
     conn = get_db_connection()
     try:
@@ -218,13 +274,15 @@ def delete_user(user_id):
 # Admin: Manage Minerals
 # -------------------------
 @app.route('/admin/minerals', methods=['GET'])
+@admin_required
 def view_minerals():
     conn = get_db_connection()
-    minerals = conn.execute("SELECT * FROM minerals").fetchall()
+    page = paginate(conn, 'minerals', request.args)
     conn.close()
-    return render_template('admin_minerals_menu.html', minerals=minerals)
+    return render_template('admin_minerals_menu.html', minerals=page.rows, page=page)
 
 @app.route('/admin/minerals/add', methods=['POST'])
+@admin_required
 def add_mineral():
     name = request.form['name']
     description = request.form['description']
@@ -234,12 +292,14 @@ def add_mineral():
         "INSERT INTO minerals (MineralName, Description, MarketPriceUSD_per_tonne) VALUES (?, ?, ?)",
         (name, description, price)
     )
+    bump_data_version(conn, 'minerals')
     conn.commit()
     conn.close()
     flash(f"Mineral '{name}' added successfully.", "success")
     return redirect(url_for('view_minerals'))
 
 @app.route('/admin/minerals/edit/<int:mineral_id>', methods=['POST'])
+@admin_required
 def edit_mineral(mineral_id):
     name = request.form['name']
     description = request.form['description']
@@ -249,14 +309,17 @@ def edit_mineral(mineral_id):
             "UPDATE minerals SET MineralName = ?, Description = ?, MarketPriceUSD_per_tonne = ? WHERE MineralID = ?",
             (name, description, price, mineral_id)
         )
+        bump_data_version(conn, 'minerals')
         conn.commit()
         flash(f"Mineral '{name}' updated successfully.", "info")
     return redirect(url_for('view_minerals'))
 
 @app.route('/admin/minerals/delete/<int:mineral_id>', methods=['POST'])
+@admin_required
 def delete_mineral(mineral_id):
     conn = get_db_connection()
     conn.execute("DELETE FROM minerals WHERE MineralID = ?", (mineral_id,))
+    bump_data_version(conn, 'minerals')
     conn.commit()
     conn.close()
     flash(f"Mineral deleted successfully.", "success")
@@ -267,29 +330,34 @@ def delete_mineral(mineral_id):
 # -------------------------
 
 @app.route('/admin/countries', methods=['GET'])
+@admin_required
 def view_countries():
     conn = get_db_connection()
-    countries = conn.execute("SELECT * FROM countries").fetchall()
+    page = paginate(conn, 'countries', request.args)
     conn.close()
-    return render_template('admin_countries_menu.html', countries=countries)
+    return render_template('admin_countries_menu.html', countries=page.rows, page=page)
 
 @app.route('/admin/countries/add', methods=['POST'])
+@admin_required
 def add_country():
     name = request.form['name']
     gdp = request.form['gdp']
     revenue = request.form['revenue']
     projects = request.form['projects']
     conn = get_db_connection()
-    conn.execute(
+    cursor = conn.execute(
         "INSERT INTO countries (CountryName, GDP_BillionUSD, MiningRevenue_BillionUSD, KeyProjects) VALUES (?, ?, ?, ?)",
         (name, gdp, revenue, projects)
     )
+    refresh_country_summaries(conn, cursor.lastrowid)
+    bump_data_version(conn, 'countries')
     conn.commit()
     conn.close()
     flash(f"Country '{name}' added successfully.", "success")
     return redirect(url_for('view_countries'))
 
 @app.route('/admin/countries/edit/<int:country_id>', methods=['POST'])
+@admin_required
 def edit_country(country_id):
     name = request.form['name']
     gdp = request.form['gdp']
@@ -300,15 +368,19 @@ def edit_country(country_id):
         "UPDATE countries SET CountryName = ?, GDP_BillionUSD = ?, MiningRevenue_BillionUSD = ?, KeyProjects = ? WHERE CountryID = ?",
         (name, gdp, revenue, projects, country_id)
     )
+    bump_data_version(conn, 'countries')
     conn.commit()
     conn.close()
     flash(f"Country '{name}' updated successfully.", "info")
     return redirect(url_for('view_countries'))
 
 @app.route('/admin/countries/delete/<int:country_id>', methods=['POST'])
+@admin_required
 def delete_country(country_id):
     conn = get_db_connection()
     conn.execute("DELETE FROM countries WHERE CountryID = ?", (country_id,))
+    refresh_country_summaries(conn, country_id)
+    bump_data_version(conn, 'countries')
     conn.commit()
     conn.close()
     flash(f"Country deleted successfully.", "success")
@@ -319,12 +391,14 @@ def delete_country(country_id):
 # -------------------------
 
 @app.route('/admin/sites', methods=['GET'])
+@admin_required
 def view_sites():
     with get_db_connection() as conn:
-        sites = conn.execute("SELECT * FROM sites").fetchall()
-    return render_template('admin_sites_menu.html', sites=sites)
+        page = paginate(conn, 'sites', request.args)
+    return render_template('admin_sites_menu.html', sites=page.rows, page=page)
 
 @app.route('/admin/sites/add', methods=['POST'])
+@admin_required
 def add_site():
     name = request.form['name']
     country_id = request.form['country_id']
@@ -337,11 +411,14 @@ def add_site():
             "INSERT INTO sites (SiteName, CountryID, MineralID, Latitude, Longitude, Production_tonnes) VALUES (?, ?, ?, ?, ?, ?)",
             (name, country_id, mineral_id, lat, lon, production)
         )
+        refresh_country_summaries(conn, country_id)
+        bump_data_version(conn, 'sites')
         conn.commit()
         flash(f"Site '{name}' added successfully.", "success")
     return redirect(url_for('view_sites'))
 
 @app.route('/admin/sites/edit/<int:site_id>', methods=['POST'])
+@admin_required
 def edit_site(site_id):
     name = request.form['name']
     country_id = request.form['country_id']
@@ -350,18 +427,26 @@ def edit_site(site_id):
     lon = request.form['longitude']
     production = request.form['production']
     with get_db_connection() as conn:
+        old = conn.execute("SELECT CountryID FROM sites WHERE SiteID = ?", (site_id,)).fetchone()
         conn.execute(
             "UPDATE sites SET SiteName = ?, CountryID = ?, MineralID = ?, Latitude = ?, Longitude = ?, Production_tonnes = ? WHERE SiteID = ?",
             (name, country_id, mineral_id, lat, lon, production, site_id)
         )
+        refresh_country_summaries(conn, country_id, old['CountryID'] if old else None)
+        bump_data_version(conn, 'sites')
         conn.commit()
         flash(f"Site '{name}' updated successfully.", "info")
     return redirect(url_for('view_sites'))
 
 @app.route('/admin/sites/delete/<int:site_id>', methods=['POST'])
+@admin_required
 def delete_site(site_id):
     with get_db_connection() as conn:
+        old = conn.execute("SELECT CountryID FROM sites WHERE SiteID = ?", (site_id,)).fetchone()
         conn.execute("DELETE FROM sites WHERE SiteID = ?", (site_id,))
+        if old:
+            refresh_country_summaries(conn, old['CountryID'])
+        bump_data_version(conn, 'sites')
         conn.commit()
         flash(f"Site deleted successfully.", "success")
     return redirect(url_for('view_sites'))
@@ -371,12 +456,14 @@ def delete_site(site_id):
 # -------------------------
 
 @app.route('/admin/production', methods=['GET'])
+@admin_required
 def view_production_stats():
     with get_db_connection() as conn:
-        stats = conn.execute("SELECT * FROM production_stats").fetchall()
-    return render_template('admin_production_stats_menu.html', stats=stats)
+        page = paginate(conn, 'production_stats', request.args)
+    return render_template('admin_production_stats_menu.html', stats=page.rows, page=page)
 
 @app.route('/admin/production/add', methods=['POST'])
+@admin_required
 def add_production_stat():
     year = request.form['year']
     country_id = request.form['country_id']
@@ -388,11 +475,14 @@ def add_production_stat():
             "INSERT INTO production_stats (Year, CountryID, MineralID, Production_tonnes, ExportValue_BillionUSD) VALUES (?, ?, ?, ?, ?)",
             (year, country_id, mineral_id, production, export_value)
         )
+        refresh_country_summaries(conn, country_id)
+        bump_data_version(conn, 'production_stats')
         conn.commit()
         flash(f"Production stat for year {year} added successfully.", "success")
     return redirect(url_for('view_production_stats'))
 
 @app.route('/admin/production/edit/<int:stat_id>', methods=['POST'])
+@admin_required
 def edit_production_stat(stat_id):
     year = request.form['year']
     country_id = request.form['country_id']
@@ -400,18 +490,26 @@ def edit_production_stat(stat_id):
     production = request.form['production']
     export_value = request.form['export_value']
     with get_db_connection() as conn:
+        old = conn.execute("SELECT CountryID FROM production_stats WHERE StatID = ?", (stat_id,)).fetchone()
         conn.execute(
             "UPDATE production_stats SET Year = ?, CountryID = ?, MineralID = ?, Production_tonnes = ?, ExportValue_BillionUSD = ? WHERE StatID = ?",
             (year, country_id, mineral_id, production, export_value, stat_id)
         )
+        refresh_country_summaries(conn, country_id, old['CountryID'] if old else None)
+        bump_data_version(conn, 'production_stats')
         conn.commit()
         flash(f"Production stat for year {year} updated successfully.", "info")
     return redirect(url_for('view_production_stats'))
 
 @app.route('/admin/production/delete/<int:stat_id>', methods=['POST'])
+@admin_required
 def delete_production_stat(stat_id):
     with get_db_connection() as conn:
+        old = conn.execute("SELECT CountryID FROM production_stats WHERE StatID = ?", (stat_id,)).fetchone()
         conn.execute("DELETE FROM production_stats WHERE StatID = ?", (stat_id,))
+        if old:
+            refresh_country_summaries(conn, old['CountryID'])
+        bump_data_version(conn, 'production_stats')
         conn.commit()
         flash(f"Production stat deleted successfully.", "success")
     return redirect(url_for('view_production_stats'))
@@ -421,13 +519,15 @@ def delete_production_stat(stat_id):
 # -------------------------
 
 @app.route('/admin/prices', methods=['GET'])
+@admin_required
 def view_mineral_prices():
     conn = get_db_connection()
-    prices = conn.execute("SELECT * FROM mineral_prices").fetchall()
+    page = paginate(conn, 'mineral_prices', request.args)
     conn.close()
-    return render_template('admin_mineral_prices_menu.html', prices=prices)
+    return render_template('admin_mineral_prices_menu.html', prices=page.rows, page=page)
 
 @app.route('/admin/prices/add', methods=['POST'])
+@admin_required
 def add_mineral_price():
     mineral_name = request.form['mineral_name']
     year = request.form['year']
@@ -437,6 +537,8 @@ def add_mineral_price():
         "INSERT INTO mineral_prices (MineralName, Year, PriceUSD_per_tonne) VALUES (?, ?, ?)",
         (mineral_name, year, price)
     )
+    refresh_mineral_stats(conn, mineral_name)
+    bump_data_version(conn, 'mineral_prices')
     conn.commit()
     conn.close()
     flash(f"Mineral price for {mineral_name} added successfully.", "success")
@@ -444,15 +546,20 @@ def add_mineral_price():
 
 
 @app.route('/admin/prices/edit/<int:price_id>', methods=['POST'])
+@admin_required
 def edit_mineral_price(price_id):
     mineral_name = request.form['mineral_name']
     year = request.form['year']
     price = request.form['price']
     conn = get_db_connection()
+    # The edit may move the price to another mineral, so refresh both
+    old = conn.execute("SELECT MineralName FROM mineral_prices WHERE PriceID = ?", (price_id,)).fetchone()
     conn.execute(
         "UPDATE mineral_prices SET MineralName = ?, Year = ?, PriceUSD_per_tonne = ? WHERE PriceID = ?",
         (mineral_name, year, price, price_id)
     )
+    refresh_mineral_stats(conn, mineral_name, *([old['MineralName']] if old else []))
+    bump_data_version(conn, 'mineral_prices')
     conn.commit()
     conn.close()
     flash(f"Mineral price for {mineral_name} updated successfully.", "info")
@@ -460,9 +567,14 @@ def edit_mineral_price(price_id):
 
 
 @app.route('/admin/prices/delete/<int:price_id>', methods=['POST'])
+@admin_required
 def delete_mineral_price(price_id):
     conn = get_db_connection()
+    old = conn.execute("SELECT MineralName FROM mineral_prices WHERE PriceID = ?", (price_id,)).fetchone()
     conn.execute("DELETE FROM mineral_prices WHERE PriceID = ?", (price_id,))
+    if old:
+        refresh_mineral_stats(conn, old['MineralName'])
+    bump_data_version(conn, 'mineral_prices')
     conn.commit()
     conn.close()
     flash(f"Mineral price deleted successfully.", "success")
@@ -472,13 +584,15 @@ def delete_mineral_price(price_id):
 # Admin: Manage Roles
 
 @app.route('/admin/roles', methods=['GET'])
+@admin_required
 def view_roles():
     conn = get_db_connection()
-    roles = conn.execute("SELECT * FROM roles").fetchall()
+    page = paginate(conn, 'roles', request.args)
     conn.close()
-    return render_template('manage_roles.html', roles=roles)
+    return render_template('manage_roles.html', roles=page.rows, page=page)
 
 @app.route('/admin/roles/add', methods=['POST'])
+@admin_required
 def add_role():
     name = request.form['name']
     permissions = request.form['permissions']
@@ -486,10 +600,12 @@ def add_role():
     conn.execute("INSERT INTO roles (RoleName, Permissions) VALUES (?, ?)", (name, permissions))
     conn.commit()
     conn.close()
+    role_cache.invalidate()
     flash(f"Role '{name}' added successfully.", "success")
     return redirect(url_for('view_roles'))
 
 @app.route('/admin/roles/edit/<int:role_id>', methods=['POST'])
+@admin_required
 def edit_role(role_id):
     name = request.form['name']
     permissions = request.form['permissions']
@@ -497,15 +613,18 @@ def edit_role(role_id):
     conn.execute("UPDATE roles SET RoleName = ?, Permissions = ? WHERE RoleID = ?", (name, permissions, role_id))
     conn.commit()
     conn.close()
+    role_cache.invalidate()
     flash(f"Role '{name}' updated successfully.", "info")
     return redirect(url_for('view_roles'))
 
 @app.route('/admin/roles/delete/<int:role_id>', methods=['POST'])
+@admin_required
 def delete_role(role_id):
     conn = get_db_connection()
     conn.execute("DELETE FROM roles WHERE RoleID = ?", (role_id,))
     conn.commit()
     conn.close()
+    role_cache.invalidate()
     flash(f"Role deleted successfully.", "success")
     return redirect(url_for('view_roles'))
 
@@ -514,9 +633,10 @@ def delete_role(role_id):
 # -------------------------
 
 @app.route('/<role>/minerals')
+@cached_page('minerals')
 def show_minerals(role):
     if role not in ['investor', 'researcher', 'administrator']:
-        return render_template('error.html', message="Unknown role.")
+        return render_template('error.html', message="Unknown role."), 404
 
     conn = get_db_connection()
     conn.row_factory = sqlite3.Row
@@ -525,175 +645,357 @@ def show_minerals(role):
 
     return render_template('shared_minerals.html', minerals=minerals, role=role)
 
-from flask import send_file
-import io
+# -------------------------
+# Exports
+# -------------------------
+# Streamed straight from SQLite (see exports.py); gzip is applied when the
+# client accepts it. Ticking "Run in background" writes the file from a
+# job instead, for selections too large to wait on.
+
+def stream_export(role, name, filename_stem):
+    export_format = request.form.get('format')
+    spec = EXPORTS[name]
+    filters = selected_filters(spec, request.form)
+
+    if not filters or export_format not in EXPORT_FORMATS:
+        message = "Invalid export format selected." if filters else "No records selected for export."
+        flash(message, "error")
+        return None
+    if export_format in COLUMNAR_FORMATS and not columnar_available():
+        flash("Parquet and Arrow exports require pyarrow to be installed on the server.", "error")
+        return None
+
+    filename = f"{role}_{filename_stem}_export.{export_format}"
+    if request.form.get('background'):
+        if 'username' not in session:
+            flash("Log in to run exports in the background.", "error")
+            return None
+        conn = get_db_connection()
+        job_id = job_queue.submit(conn, 'export', {
+            'name': name, 'filters': filters, 'export_format': export_format, 'filename': filename
+        }, owner=session['username'])
+        conn.close()
+        flash(f"{filename} is being exported in the background.", "info")
+        return redirect(url_for('job_status', job_id=job_id))
+
+    flash(f"{filename} successfully exported.", "success")
+    return export_response(name, filters, export_format, filename, gzip=accepts_gzip(request))
+
+
+def render_country_export_error(role):
+    conn = get_db_connection()
+    countries = conn.execute("SELECT CountryID, CountryName FROM countries").fetchall()
+    conn.close()
+    return render_template('shared_country_profile.html', role=role, countries=countries)
+
 
 @app.route('/<role>/export-countries', methods=['POST'])
 def export_countries(role):
     if role not in ['investor', 'researcher']:
         return render_template('error.html', message="Unknown role.")
 
+    response = stream_export(role, 'countries', 'country')
+    return response or render_country_export_error(role)
+
+@app.route('/<role>/export-minerals', methods=['POST'])
+def export_minerals(role):
+    if role not in ['investor', 'researcher']:
+        return render_template('error.html', message="Unknown role.")
+
+    response = stream_export(role, 'minerals', 'mineral')
+    if response:
+        return response
+
     conn = get_db_connection()
-    countries = conn.execute("SELECT CountryID, CountryName, GDP_BillionUSD, MiningRevenue_BillionUSD, KeyProjects FROM countries").fetchall()
+    minerals = conn.execute("SELECT * FROM minerals").fetchall()
     conn.close()
+    return render_template('shared_minerals.html', role=role, minerals=minerals)
 
-    selected_ids = request.form.getlist('country_id')
-    export_format = request.form.get('format')
+@app.route('/<role>/export-sites', methods=['POST'])
+def export_sites(role):
+    if role not in ['investor', 'researcher']:
+        return render_template('error.html', message="Unknown role.")
 
-    if not selected_ids:
-        return render_template('shared_country_profile.html', role=role, countries=countries,
-                               export_success="No countries selected for export.")
-
-    filtered = [c for c in countries if str(c['CountryID']) in selected_ids]
-    df = pd.DataFrame(filtered)
-
-    filename = f"{role}_country_export.{export_format}"
-
-    if export_format == 'csv':
-        buffer = io.StringIO()
-        df.to_csv(buffer, index=False)
-        buffer.seek(0)
-        flash(f"{filename} successfully exported.", "success")
-        return send_file(io.BytesIO(buffer.getvalue().encode()), mimetype='text/csv',
-                         as_attachment=True, download_name=filename)
-
-    elif export_format == 'json':
-        buffer = io.StringIO()
-        df.to_json(buffer, orient='records', indent=2)
-        buffer.seek(0)
-        flash(f"{filename} successfully exported.", "success")
-        return send_file(io.BytesIO(buffer.getvalue().encode()), mimetype='application/json',
-                         as_attachment=True, download_name=filename)
-    
-    flash("Invalid export format selected.", "error")
-    return render_template('shared_country_profile.html', role=role, countries=countries,
-                           export_success="Invalid export format selected.")
+    response = stream_export(role, 'sites', 'site')
+    return response or render_country_export_error(role)
 
-@app.route('/<role>/export-minerals', methods=['POST'])
-def export_minerals(role):
+@app.route('/<role>/export-production', methods=['POST'])
+def export_production_stats(role):
     if role not in ['investor', 'researcher']:
         return render_template('error.html', message="Unknown role.")
 
+    response = stream_export(role, 'production_stats', 'production')
+    return response or render_country_export_error(role)
+
+# -------------------------
+# Mineral Sites Map
+# -------------------------
+# The map page is a fixed-size Folium shell that loads sites as z/x/y
+# GeoJSON tiles for the visible area (see site_tiles.py), cut from a spatial
+# index built once per data version. Pages and tiles are cached under the
+# same version (see http_cache.py), so admin writes to these tables
+# invalidate all of them.
+
+MAP_TABLES = ('sites', 'countries', 'minerals')
+
+tile_cache = LRUCache(
+    max_entries=int(os.environ.get("TILE_CACHE_ENTRIES", 4096)),
+    max_bytes=int(os.environ.get("TILE_CACHE_BYTES", 64 * 1024 * 1024)),
+    disk_dir=os.environ.get("TILE_CACHE_DIR") or None
+)
+FILTERED_INDEX_ENTRIES = 16
+
+_site_index = None
+_site_index_version = None
+_filtered_site_indexes = OrderedDict()   # (version, mineral ids, country ids) -> SiteIndex
+_site_index_lock = threading.Lock()
+
+
+def get_map_data_version():
     conn = get_db_connection()
-    minerals = conn.execute("SELECT MineralID, MineralName, Description, MarketPriceUSD_per_tonne FROM minerals").fetchall()
+    version = get_data_version(conn, *MAP_TABLES)
     conn.close()
+    return version
+
+
+def get_site_index(version=None):
+    global _site_index, _site_index_version
+    if version is None:
+        version = get_map_data_version()
+    with _site_index_lock:
+        if _site_index is None or _site_index_version != version:
+            conn = get_db_connection()
+            countries = conn.execute("SELECT CountryID, CountryName FROM countries").fetchall()
+            minerals = conn.execute("SELECT MineralID, MineralName FROM minerals").fetchall()
+            sites = conn.execute(
+                "SELECT SiteID, SiteName, CountryID, MineralID, Latitude, Longitude, Production_tonnes FROM sites"
+            ).fetchall()
+            conn.close()
+
+            country_lookup = {c['CountryID']: c['CountryName'] for c in countries}
+            mineral_lookup = {m['MineralID']: m['MineralName'] for m in minerals}
+            _site_index = SiteIndex(sites, country_lookup, mineral_lookup)
+            _site_index_version = version
+            _filtered_site_indexes.clear()
+        return _site_index
+
+
+def get_filtered_site_index(mineral_ids=(), country_ids=()):
+    """The site index narrowed to some minerals and countries, kept for reuse."""
+    version = get_map_data_version()
+    index = get_site_index(version)
+    if not mineral_ids and not country_ids:
+        return index
+    key = (version, tuple(sorted(set(mineral_ids))), tuple(sorted(set(country_ids))))
+    with _site_index_lock:
+        subset = _filtered_site_indexes.get(key)
+        if subset is None:
+            subset = _filtered_site_indexes[key] = index.filtered(key[1], key[2])
+            while len(_filtered_site_indexes) > FILTERED_INDEX_ENTRIES:
+                _filtered_site_indexes.popitem(last=False)
+        else:
+            _filtered_site_indexes.move_to_end(key)
+        return subset
 
-    selected_ids = request.form.getlist('mineral_id')
-    export_format = request.form.get('format')
-
-    if not selected_ids:
-        return render_template('shared_minerals.html', role=role, minerals=minerals,
-                               export_success="No minerals selected for export.")
-
-    filtered = [m for m in minerals if str(m['MineralID']) in selected_ids]
-    df = pd.DataFrame(filtered)
-
-    filename = f"{role}_mineral_export.{export_format}"
-
-    if export_format == 'csv':
-        buffer = io.StringIO()
-        df.to_csv(buffer, index=False)
-        buffer.seek(0)
-        flash(f"{filename} successfully exported.", "success")
-        return send_file(io.BytesIO(buffer.getvalue().encode()), mimetype='text/csv',
-                         as_attachment=True, download_name=filename)
-
-    elif export_format == 'json':
-        buffer = io.StringIO()
-        df.to_json(buffer, orient='records', indent=2)
-        buffer.seek(0)
-        flash(f"{filename} successfully exported.", "success")
-        return send_file(io.BytesIO(buffer.getvalue().encode()), mimetype='application/json',
-                         as_attachment=True, download_name=filename)
-    flash("Invalid export format selected.", "error")
-    return render_template('shared_minerals.html', role=role, minerals=minerals,
-                           export_success="Invalid export format selected.")
 
 @app.route('/<role>/map')
+@cached_page(*MAP_TABLES)
 def show_mineral_sites_map(role):
     # Validate role
     if role not in ['investor', 'researcher']:
-        return render_template('error.html', message="Unknown role.")
+        return render_template('error.html', message="Unknown role."), 404
+
+    version = get_map_data_version()
+    if not len(get_site_index(version)):
+        return render_template('error.html', message="No mineral sites found."), 404
+
+    mineral_ids, country_ids = geo_filters()
+    query = urlencode([('v', version_token(version))]
+                      + [('mineral_id', i) for i in mineral_ids] + [('country_id', i) for i in country_ids])
+    # url_for needs real numbers; swap them for Leaflet's {z}/{x}/{y} placeholders
+    tile_url = url_for('map_site_tile', role=role, z=0, x=0, y=0).replace('/0/0/0.', '/{z}/{x}/{y}.')
 
     conn = get_db_connection()
+    minerals = conn.execute("SELECT MineralID, MineralName FROM minerals ORDER BY MineralName").fetchall()
+    countries = conn.execute("SELECT CountryID, CountryName FROM countries ORDER BY CountryName").fetchall()
+    conn.close()
 
-    # Load lookup tables
-    countries = conn.execute("SELECT CountryID, CountryName FROM countries").fetchall()
-    minerals = conn.execute("SELECT MineralID, MineralName FROM minerals").fetchall()
-    sites = conn.execute("SELECT * FROM sites").fetchall()
+    # Folium is imported on first use; see lazy_imports.py
+    from site_map import render_site_map
+    with timed('map'):
+        map_html = render_site_map(f"{tile_url}?{query}")
+    return render_template('shared_map.html', role=role, map_html=map_html,
+                           minerals=minerals, countries=countries,
+                           mineral_ids=mineral_ids, country_ids=country_ids)
+
+
+@app.route('/<role>/map/tiles/<int:z>/<int:x>/<int:y>.geojson')
+@cached_page(*MAP_TABLES, mimetype='application/geo+json', cache=tile_cache)
+def map_site_tile(role, z, x, y):
+    """
+    One map tile as a GeoJSON FeatureCollection of clusters or sites,
+    optionally narrowed by repeated mineral_id and country_id.
+    """
+    if role not in ['investor', 'researcher']:
+        return jsonify(error="Unknown role."), 404
+    if not valid_tile(z, x, y):
+        return jsonify(error="No such tile."), 404
+
+    index = get_filtered_site_index(*geo_filters())
+    return json.dumps(tile_features(index, z, x, y), separators=(',', ':'))
+
+
+@app.route('/sites.geojson')
+@cached_page(*MAP_TABLES, mimetype='application/geo+json')
+def sites_geojson():
+    """Every site as one GeoJSON FeatureCollection; takes mineral_id and country_id filters."""
+    sql, params = features_query(*geo_filters())
+    chunks = iter_geojson(iter_batches(sql, params))
+    gzip = accepts_gzip(request)
+    response = Response(gzip_chunks(chunks) if gzip else chunks, mimetype='application/geo+json')
+    if gzip:
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+
+# -------------------------
+# Geospatial Site Queries
+# -------------------------
+# Bounding-box, radius and nearest-site search over the sites R*Tree (see
+# site_geo.py). Every endpoint takes optional mineral_id and country_id
+# filters, each of which may be repeated.
+
+def geo_filters():
+    return request.args.getlist('mineral_id', type=int), request.args.getlist('country_id', type=int)
+
+
+def geo_point():
+    """(lat, lon) from the query string, or None if missing or out of range."""
+    lat = request.args.get('lat', type=float)
+    lon = request.args.get('lon', type=float)
+    if lat is None or lon is None or not -90 <= lat <= 90 or not -180 <= lon <= 180:
+        return None
+    return lat, lon
+
+
+@app.route('/<role>/sites/bbox')
+def sites_bbox(role):
+    """Sites in ?bbox=west,south,east,north, up to ?limit=N."""
+    if role not in ['investor', 'researcher']:
+        return jsonify(error="Unknown role."), 404
+
+    bbox = parse_bbox(request.args.get('bbox'))
+    if bbox is None:
+        return jsonify(error="A bbox of west,south,east,north is required."), 400
+    limit = max(1, min(request.args.get('limit', default=DEFAULT_MARKER_LIMIT, type=int), DEFAULT_MARKER_LIMIT))
+    mineral_ids, country_ids = geo_filters()
+
+    conn = get_db_connection()
+    sites, truncated = sites_in_bbox(conn, bbox, mineral_ids, country_ids, limit)
     conn.close()
+    return jsonify(sites=sites, truncated=truncated)
+
+
+@app.route('/<role>/sites/within')
+def sites_within_radius(role):
+    """Sites within ?radius_km= of ?lat=&lon=, nearest first, up to ?limit=N."""
+    if role not in ['investor', 'researcher']:
+        return jsonify(error="Unknown role."), 404
 
-    if not sites:
-        return render_template('error.html', message="No mineral sites found.")
+    point = geo_point()
+    radius_km = request.args.get('radius_km', type=float)
+    if point is None or radius_km is None or not 0 < radius_km <= MAX_DISTANCE_KM:
+        return jsonify(error=f"lat (-90 to 90), lon (-180 to 180) and a radius_km of up to "
+                             f"{MAX_DISTANCE_KM:.0f} are required."), 400
+    limit = max(1, min(request.args.get('limit', default=DEFAULT_MARKER_LIMIT, type=int), DEFAULT_MARKER_LIMIT))
+    mineral_ids, country_ids = geo_filters()
 
-    # Build lookup dictionaries
-    country_lookup = {c['CountryID']: c['CountryName'] for c in countries}
-    mineral_lookup = {m['MineralID']: m['MineralName'] for m in minerals}
+    conn = get_db_connection()
+    sites, truncated = sites_within(conn, *point, radius_km, mineral_ids, country_ids, limit)
+    conn.close()
+    return jsonify(sites=sites, truncated=truncated)
 
-    # Create Folium map
-    africa_map = folium.Map(location=[-2.0, 23.5], zoom_start=4)
 
-    for site in sites:
-        country_name = country_lookup.get(site['CountryID'], "Unknown Country")
-        mineral_name = mineral_lookup.get(site['MineralID'], "Unknown Mineral")
+@app.route('/<role>/sites/nearest')
+def sites_nearest(role):
+    """The ?k= sites nearest ?lat=&lon=, optionally no further than ?max_km=."""
+    if role not in ['investor', 'researcher']:
+        return jsonify(error="Unknown role."), 404
 
-        popup_html = f"""
-        <div style='font-size:14px'>
-          <strong>Site:</strong> {site['SiteName']}<br>
-          <strong>Country:</strong> {country_name}<br>
-          <strong>Mineral:</strong> {mineral_name}<br>
-          <strong>Production:</strong> {site['Production_tonnes']} tonnes
-        </div>
-        """
+    point = geo_point()
+    if point is None:
+        return jsonify(error="lat (-90 to 90) and lon (-180 to 180) are required."), 400
+    k = max(1, min(request.args.get('k', default=10, type=int), MAX_NEAREST))
+    max_km = request.args.get('max_km', default=MAX_DISTANCE_KM, type=float)
+    if not 0 < max_km <= MAX_DISTANCE_KM:
+        return jsonify(error=f"max_km must be between 0 and {MAX_DISTANCE_KM:.0f}."), 400
+    mineral_ids, country_ids = geo_filters()
 
-        folium.Marker(
-            location=[site['Latitude'], site['Longitude']],
-            popup=folium.Popup(popup_html, max_width=250),
-            icon=folium.Icon(color="blue", icon="info-sign")
-        ).add_to(africa_map)
+    conn = get_db_connection()
+    sites = nearest_sites(conn, *point, k, mineral_ids, country_ids, max_km)
+    conn.close()
+    return jsonify(sites=sites)
 
-    # Embed map in template
-    map_html = africa_map._repr_html_()
-    return render_template('shared_map.html', role=role, map_html=map_html)
+
+# -------------------------
+# Charts
+# -------------------------
+# Pages link to charts by a signed token holding the chart's spec instead
+# of inlining base64 images; the images are rendered on first fetch and
+# memoized by ChartService.
+
+chart_service = ChartService(
+    app.secret_key,
+    max_entries=int(os.environ.get("CHART_CACHE_ENTRIES", 256)),
+    max_bytes=int(os.environ.get("CHART_CACHE_BYTES", 32 * 1024 * 1024)),
+    disk_dir=os.environ.get("CHART_CACHE_DIR") or None
+)
 
 
 def generate_pie_chart(gdp, mining_revenue):
-    labels = ['Mining Revenue', 'Other GDP']
-    values = [mining_revenue, gdp - mining_revenue]
-    colors = ['#4F46E5', '#A5B4FC']
+    token = chart_service.token('gdp_pie', gdp=gdp, mining_revenue=mining_revenue)
+    return url_for('serve_chart', token=token, fmt='png')
 
-    fig, ax = plt.subplots()
-    ax.pie(values, labels=labels, autopct='%1.1f%%', colors=colors, startangle=90)
-    ax.set_title('GDP Composition')
 
-    buf = io.BytesIO()
-    plt.savefig(buf, format='png')
-    buf.seek(0)
-    chart_data = base64.b64encode(buf.read()).decode('utf-8')
-    plt.close(fig)
-    return chart_data
+@app.route('/charts/<token>.<fmt>')
+def serve_chart(token, fmt):
+    image = chart_service.render(token, fmt)
+    if image is None:
+        return render_template('error.html', message="Chart not found."), 404
+
+    # Chart URLs are content-addressed, so the image behind one never changes
+    response = app.response_class(image, mimetype=CHART_FORMATS[fmt])
+    response.set_etag(f"{token[:32]}.{fmt}")
+    response.cache_control.public = True
+    response.cache_control.max_age = 31536000
+    response.cache_control.immutable = True
+    return response.make_conditional(request)
 
 @app.route('/<role>/country-profile')
+@cached_page('countries', 'sites', 'production_stats', 'minerals')
 def view_country_profile(role):
     if role not in ['investor', 'researcher']:
-        return render_template('error.html', message="Unknown role.")
+        return render_template('error.html', message="Unknown role."), 404
 
     conn = get_db_connection()
     countries = conn.execute("SELECT * FROM countries").fetchall()
 
     country_id = request.args.get("country_id", type=int)
     selected_country = None
-    chart_data = None
+    chart_url = None
+    summary, mineral_breakdown, trend = None, [], []
 
     if country_id:
         selected_country = conn.execute(
-            "SELECT * FROM countries WHERE CountryID = ?", (country_id,)
+            COUNTRY_QUERY, (country_id,)
         ).fetchone()
 
         if selected_country:
             gdp = selected_country['GDP_BillionUSD']
             mining = selected_country['MiningRevenue_BillionUSD']
-            chart_data = generate_pie_chart(gdp, mining)
+            chart_url = generate_pie_chart(gdp, mining)
+            # Site and production rollups are precomputed (see country_summaries.py)
+            summary, mineral_breakdown, trend = load_country_summary(conn, country_id)
 
     conn.close()
 
@@ -702,65 +1004,47 @@ def view_country_profile(role):
         role=role,
         countries=countries,
         selected_country=selected_country,
-        chart_data=chart_data
+        chart_url=chart_url,
+        summary=summary,
+        mineral_breakdown=mineral_breakdown,
+        trend=trend
     )
 
 def generate_comparison_chart(countries):
     """
-    Generates a grouped bar chart comparing GDP and Mining Revenue across countries.
+    Builds a grouped bar chart comparing GDP and Mining Revenue across countries
+    and returns its URL.
     Expects a list of dicts with keys: 'CountryName', 'GDP_BillionUSD', 'MiningRevenue_BillionUSD'
     """
-    country_names = [c['CountryName'] for c in countries]
-    gdp_values = [c['GDP_BillionUSD'] for c in countries]
-    mining_values = [c['MiningRevenue_BillionUSD'] for c in countries]
-
-    x = range(len(countries))
-    width = 0.35
-
-    fig, ax = plt.subplots(figsize=(10, 6))
-    ax.bar([i - width/2 for i in x], gdp_values, width, label='GDP', color='#4F46E5')
-    ax.bar([i + width/2 for i in x], mining_values, width, label='Mining Revenue', color='#A5B4FC')
-
-    ax.set_xticks(x)
-    ax.set_xticklabels(country_names, rotation=45, ha='right')
-    ax.set_ylabel('Billion USD')
-    ax.set_title('GDP vs Mining Revenue by Country')
-    ax.legend()
-    ax.grid(axis='y', linestyle='--', alpha=0.5)
-
-    plt.tight_layout()
-
-    buf = io.BytesIO()
-    plt.savefig(buf, format='png')
-    buf.seek(0)
-    chart_data = base64.b64encode(buf.read()).decode('utf-8')
-    plt.close(fig)
-    return chart_data
+    token = chart_service.token('gdp_comparison', countries=[
+        {
+            'CountryName': c['CountryName'],
+            'GDP_BillionUSD': c['GDP_BillionUSD'],
+            'MiningRevenue_BillionUSD': c['MiningRevenue_BillionUSD'],
+        }
+        for c in countries
+    ])
+    return url_for('serve_chart', token=token, fmt='png')
 
 @app.route('/<role>/compare-countries')
+@cached_page('countries', 'sites', 'production_stats')
 def compare_countries(role):
     # Validate role
     if role not in ['investor', 'researcher']:
-        return render_template('error.html', message="Unknown role.")
-
-    # Load all countries
-    conn = get_db_connection()
-    countries = conn.execute("SELECT * FROM countries").fetchall()
+        return render_template('error.html', message="Unknown role."), 404
 
     # Get selected country IDs from query string
     ids = request.args.getlist("country_id", type=int)
-    selected_countries = []
 
-    # Filter selected countries
-    if ids:
-        for cid in ids:
-            country = conn.execute("SELECT * FROM countries WHERE CountryID = ?", (cid,)).fetchone()
-            if country:
-                selected_countries.append(country)
+    # One query and one vectorized pass for every country (see compare.py)
+    conn = get_db_connection()
+    countries, selected_countries = build_comparison(conn, ids)
+    conn.close()
 
     # Generate comparison chart
-    comparison_chart = generate_comparison_chart(selected_countries)
-    conn.close()
+    comparison_chart = None
+    if selected_countries:
+        comparison_chart = generate_comparison_chart(selected_countries)
 
     # Render template with all data
     return render_template(
@@ -768,70 +1052,111 @@ def compare_countries(role):
         role=role,
         countries=countries,
         selected_countries=selected_countries,
+        metrics=COMPARE_METRICS,
         comparison_chart=comparison_chart
     )
 
 
+@app.route('/<role>/compare/data')
+def compare_countries_data(role):
+    """
+    JSON version of the comparison: ?country_id=1&country_id=2... (all
+    countries when none are given), with metric ranks over all countries.
+    """
+    if role not in ['investor', 'researcher']:
+        return jsonify(error="Unknown role."), 404
+
+    ids = request.args.getlist("country_id", type=int)
+    conn = get_db_connection()
+    countries, selected = build_comparison(conn, ids)
+    conn.close()
+
+    return jsonify(
+        metrics=[{'key': key, 'label': label, 'unit': unit} for key, label, unit in COMPARE_METRICS],
+        countries=selected if ids else countries
+    )
+
+
+def wants_json():
+    """True for fetch() calls that asked for JSON instead of a page."""
+    return request.accept_mimetypes.best == 'application/json'
+
+
 @app.route('/researcher/insights', methods=['GET', 'POST'])
+@role_required('Researcher')
 def researcher_insights():
     conn = get_db_connection()
-    conn.row_factory = sqlite3.Row
-    cur = conn.cursor()
-
-    # Ensure required tables exist
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS minerals (
-            MineralID INTEGER PRIMARY KEY AUTOINCREMENT,
-            MineralName TEXT NOT NULL
-        )
-    """)
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS mineral_insights (
-            InsightID INTEGER PRIMARY KEY AUTOINCREMENT,
-            MineralID INTEGER,
-            Insight TEXT,
-            FOREIGN KEY(MineralID) REFERENCES minerals(MineralID)
-        )
-    """)
 
     # Handle new insight submission
     if request.method == 'POST':
         mineral_id = request.form.get('mineral_id')
         insight = request.form.get('insight')
+        new_item = None
         if mineral_id and insight:
-            cur.execute("""
+            cursor = conn.execute("""
                 INSERT INTO mineral_insights (MineralID, Insight)
                 VALUES (?, ?)
             """, (mineral_id, insight))
             conn.commit()
+            new_item = fetch_insight(conn, cursor.lastrowid)
+        conn.close()
+
+        # The page adds the new row itself; only plain form posts reload the feed
+        if wants_json():
+            if new_item is None:
+                return jsonify(error="A mineral and an insight are required."), 400
+            return jsonify(item=dict(new_item),
+                           html=render_template('researcher_insight_rows.html', insights=[new_item]))
+        return redirect(url_for('researcher_insights'))
 
     # Fetch minerals for dropdown
-    minerals = cur.execute("""
+    minerals = conn.execute("""
         SELECT MineralID, MineralName
         FROM minerals
         ORDER BY MineralName
     """).fetchall()
 
-    # Fetch all insights with mineral names
-    insights = cur.execute("""
-        SELECT i.InsightID, i.Insight, m.MineralName
-        FROM mineral_insights i
-        JOIN minerals m ON i.MineralID = m.MineralID
-        ORDER BY i.InsightID DESC
-    """).fetchall()
+    # First page of the feed; the rest is loaded by researcher_insights_feed
+    mineral_id = request.args.get('mineral_id', type=int)
+    insights, next_before = fetch_insights(conn, mineral_id=mineral_id)
 
     conn.close()
     return render_template('researcher_insights.html',
                            role='researcher',
                            minerals=minerals,
-                           insights=insights)
+                           insights=insights,
+                           mineral_id=mineral_id,
+                           next_before=next_before)
+
+
+@app.route('/researcher/insights/feed')
+@role_required('Researcher')
+def researcher_insights_feed():
+    """
+    JSON page of the insights feed: ?mineral_id=&before=<InsightID>&limit=N.
+    next_before is the cursor for the following page (null on the last).
+    """
+    mineral_id = request.args.get('mineral_id', type=int)
+    before = request.args.get('before', type=int)
+    limit = request.args.get('limit', FEED_PAGE_SIZE, type=int)
+
+    conn = get_db_connection()
+    insights, next_before = fetch_insights(conn, mineral_id=mineral_id, before=before, limit=limit)
+    conn.close()
+
+    return jsonify(
+        items=[dict(row) for row in insights],
+        next_before=next_before,
+        html=render_template('researcher_insight_rows.html', insights=insights)
+    )
 
 
 @app.route('/researcher/insights/edit/<int:insight_id>', methods=['POST'])
+@role_required('Researcher')
 def edit_insight(insight_id):
     updated_text = request.form.get('updated_insight')
     if updated_text:
-        with sqlite3.connect("userdata.db") as conn:
+        with get_db_connection() as conn:
             cur = conn.cursor()
             cur.execute("""
                 UPDATE mineral_insights
@@ -842,8 +1167,9 @@ def edit_insight(insight_id):
     return redirect(url_for('researcher_insights'))
 
 @app.route('/researcher/insights/delete/<int:insight_id>', methods=['POST'])
+@role_required('Researcher')
 def delete_insight(insight_id):
-    with sqlite3.connect("userdata.db") as conn:
+    with get_db_connection() as conn:
         cur = conn.cursor()
         cur.execute("""
             DELETE FROM mineral_insights
@@ -856,34 +1182,303 @@ def delete_insight(insight_id):
 
 # Investor-only Menus
 @app.route('/investor/analyze-prices')
+@role_required('Investor')
+@cached_page('mineral_prices', 'price_ticks')
 def investor_analyze_prices():
+    # Stats and chart series are kept up to date by the admin price routes
+    # (see price_analytics.py), so this only reads one row per mineral
     conn = get_db_connection()
-    conn.row_factory = sqlite3.Row
-
-    query = """
-    SELECT MineralName, Year, PriceUSD_per_tonne
-    FROM mineral_prices
-    ORDER BY MineralName, Year
-    """
-
-    df = pd.read_sql(query, conn)
+    analytics = load_price_analytics(conn)
+    tick_minerals = series_minerals(conn)
     conn.close()
 
-    if df.empty:
-        return render_template('investor_analyze_prices.html', message="No historical prices available.")
-
-    # Prepare data for charts
-    grouped = df.groupby("MineralName")
-    latest_df = df.loc[df.groupby("MineralName")["Year"].idxmax()]
+    if not analytics['latest']:
+        return render_template('investor_analyze_prices.html', message="No historical prices available.",
+                               chart={'years': [], 'series': []}, latest=[],
+                               tick_minerals=tick_minerals, role='investor')
 
     return render_template(
         'investor_analyze_prices.html',
-        data=df.to_dict(orient='records'),
-        latest=latest_df.to_dict(orient='records'),
+        chart=analytics['chart'],
+        latest=analytics['latest'],
+        tick_minerals=tick_minerals,
         role='investor'
     )
 
 
+@app.route('/investor/prices/series')
+@role_required('Investor')
+def investor_price_series():
+    """
+    JSON price series from the tick store. Query string: mineral, start/end
+    (epoch seconds or ISO dates; default the whole history), and either
+    resolution (tick/day/week/month/year) or points (minimum points wanted).
+    """
+    mineral = request.args.get('mineral', '')
+    resolution = request.args.get('resolution') or None
+    if resolution is not None and resolution not in RESOLUTIONS:
+        return jsonify(error=f"resolution must be one of {', '.join(RESOLUTIONS)}"), 400
+    try:
+        points = max(10, min(int(request.args.get('points', DEFAULT_POINTS)), 5000))
+    except ValueError:
+        return jsonify(error="points must be an integer"), 400
+
+    conn = get_db_connection()
+    stored = series_range(conn, mineral)
+    if stored is None:
+        conn.close()
+        return jsonify(error=f"No price ticks for {mineral!r}"), 404
+
+    start = parse_time(request.args.get('start'))
+    end = parse_time(request.args.get('end'))
+    start = stored[0] if start is None else start
+    end = stored[1] if end is None else end
+    try:
+        series = query_series(conn, mineral, start, end, resolution=resolution, points=points)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    finally:
+        conn.close()
+    return jsonify(series)
+
+
+# -------------------------
+# Search
+# -------------------------
+# Ranked full-text search across minerals, countries, sites and insights
+# (see search.py). Results link to the page each role uses for that record.
+
+def search_result_url(result, role):
+    kind, ref_id = result['kind'], result['id']
+    if role == 'admin':
+        links = {
+            'mineral': lambda: url_for('view_minerals', f_MineralID=ref_id),
+            'country': lambda: url_for('view_countries', f_CountryID=ref_id),
+            'site': lambda: url_for('view_sites', f_SiteID=ref_id),
+        }
+    else:
+        links = {
+            'mineral': lambda: url_for('show_minerals', role=role),
+            'country': lambda: url_for('view_country_profile', role=role, country_id=ref_id),
+            'site': lambda: url_for('show_mineral_sites_map', role=role),
+        }
+        if role == 'researcher':
+            links['insight'] = lambda: url_for('researcher_insights')
+    return links[kind]() if kind in links else None
+
+
+def run_search():
+    """Runs the search described by the query string for the logged-in role."""
+    role = role_slug() or 'investor'
+    text = request.args.get('q', '').strip()
+    kinds = [k for k in request.args.getlist('type') if k in SEARCH_SOURCES]
+    page = request.args.get('page', 1, type=int) or 1
+
+    conn = get_db_connection()
+    results, has_more = search(conn, text, kinds=kinds, page=page)
+    conn.close()
+    for result in results:
+        result['url'] = search_result_url(result, role)
+    return role, text, kinds, page, results, has_more
+
+
+@app.route('/search')
+def search_page():
+    if 'username' not in session:
+        return redirect(url_for('login'))
+    role, text, kinds, page, results, has_more = run_search()
+    return render_template('search.html', role=role, query=text, kinds=kinds,
+                           kind_names=list(SEARCH_SOURCES), page=page,
+                           results=results, has_more=has_more)
+
+
+@app.route('/search/data')
+def search_data():
+    """
+    JSON search: ?q=<text>&type=<mineral|country|site|insight>...&page=N.
+    title and snippet are HTML with matches wrapped in <mark>.
+    """
+    if 'username' not in session:
+        return jsonify(error="Login required."), 401
+    _, text, _, page, results, has_more = run_search()
+    return jsonify(query=text, page=page, results=results, has_more=has_more)
+
+
+# -------------------------
+# Background Jobs
+# -------------------------
+# Submit with POST /jobs {"kind": ..., "params": {...}}; the reply carries
+# the URL to poll. Jobs are visible to the user who started them and to
+# admins.
+
+def job_json(job):
+    finished = job['Status'] in FINISHED_STATUSES
+    return {
+        'job_id': job['JobID'],
+        'kind': job['Kind'],
+        'status': job['Status'],
+        'progress': job['Progress'],
+        'message': job['Message'],
+        'error': job['Error'],
+        'created_at': job['CreatedAt'],
+        'started_at': job['StartedAt'],
+        'finished_at': job['FinishedAt'],
+        'status_url': url_for('job_status', job_id=job['JobID']),
+        'result_url': url_for('job_result', job_id=job['JobID'])
+                      if job['Status'] == 'succeeded' and job['ResultPath'] else None,
+        'cancel_url': None if finished else url_for('cancel_job', job_id=job['JobID']),
+    }
+
+
+def load_job(job_id):
+    """The job if the logged-in user may see it, else None."""
+    conn = get_db_connection()
+    job = job_queue.get(conn, job_id)
+    conn.close()
+    if job is None or (not is_admin() and job['Owner'] != session.get('username')):
+        return None
+    return job
+
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    if 'username' not in session:
+        return jsonify(error="Login required."), 401
+
+    if request.is_json:
+        data = request.get_json(silent=True) or {}
+        kind, params = data.get('kind'), data.get('params') or {}
+    else:
+        # HTML forms send the params as their other fields
+        kind = request.form.get('kind')
+        params = {k: v for k, v in request.form.items() if k != 'kind'}
+    if kind not in JOB_KINDS:
+        return jsonify(error=f"kind must be one of {', '.join(JOB_KINDS)}"), 400
+    if JOB_KINDS[kind].admin_only and not is_admin():
+        return jsonify(error="Only administrators can run this job."), 403
+
+    conn = get_db_connection()
+    try:
+        job_id = job_queue.submit(conn, kind, params, owner=session['username'])
+    except ValueError as e:
+        if not request.is_json:
+            flash(str(e), "error")
+            return redirect(url_for('home'))
+        return jsonify(error=str(e)), 400
+    finally:
+        conn.close()
+
+    if not request.is_json:
+        flash("Job started.", "info")
+        return redirect(url_for('job_status', job_id=job_id))
+    return jsonify(job_id=job_id, status_url=url_for('job_status', job_id=job_id)), 202
+
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    if 'username' not in session:
+        return redirect(url_for('login'))
+    job = load_job(job_id)
+    if wants_json():
+        return jsonify(job_json(job)) if job else (jsonify(error="Job not found."), 404)
+    if job is None:
+        return render_template('error.html', message="Job not found.")
+    return render_template('job_status.html', job=job_json(job), role=role_slug())
+
+
+@app.route('/jobs/<job_id>/result')
+def job_result(job_id):
+    if 'username' not in session:
+        return redirect(url_for('login'))
+    job = load_job(job_id)
+    if job is None or job['Status'] != 'succeeded' or not job['ResultPath']:
+        return render_template('error.html', message="This job has no result to download.")
+    if not os.path.exists(job['ResultPath']):
+        return render_template('error.html', message="This job's result has expired.")
+    return send_file(os.path.abspath(job['ResultPath']), mimetype=job['ResultType'],
+                     as_attachment=True, download_name=job['ResultName'])
+
+
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    if 'username' not in session:
+        return jsonify(error="Login required."), 401
+    job = load_job(job_id)
+    if job is None:
+        return jsonify(error="Job not found."), 404
+
+    conn = get_db_connection()
+    cancelled = job_queue.cancel(conn, job_id)
+    job = job_queue.get(conn, job_id)
+    conn.close()
+
+    if not wants_json():
+        flash("Cancelling job." if cancelled else "The job had already finished.", "info")
+        return redirect(url_for('job_status', job_id=job_id))
+    return jsonify(job_json(job))
+
+
+# -------------------------
+# Metrics and Profiling
+# -------------------------
+
+@app.route('/metrics')
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/admin/profiling', methods=['GET', 'POST'])
+@admin_required
+def admin_profiling():
+    """
+    GET shows the profiler state and recent dumps; POST with enabled=0|1
+    and/or threshold_ms changes it (in this worker process only).
+    """
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or request.form
+        enabled = data.get('enabled')
+        threshold_ms = data.get('threshold_ms')
+        try:
+            profiler.configure(
+                enabled=None if enabled is None else str(enabled).lower() in ('1', 'true', 'on'),
+                threshold_ms=None if threshold_ms in (None, '') else float(threshold_ms)
+            )
+        except ValueError:
+            return jsonify(error="threshold_ms must be a number."), 400
+    return jsonify(enabled=profiler.enabled, threshold_ms=profiler.threshold_ms,
+                   interval_ms=profiler.interval_ms, pid=os.getpid(), dumps=profiler.dumps())
+
+
+# -------------------------
+# Health Checks
+# -------------------------
+# /healthz: the process is up and serving (liveness).
+# /readyz: it can also reach the database and the schema is current, so a
+# load balancer should send it traffic (readiness).
+
+@app.route('/healthz')
+def healthz():
+    return jsonify(status="ok", pid=os.getpid())
+
+
+@app.route('/readyz')
+def readyz():
+    checks = {}
+    try:
+        conn = get_db_connection()
+        conn.execute("SELECT 1").fetchone()
+        pending = pending_migrations(conn)
+        conn.close()
+        checks['database'] = "ok"
+        checks['migrations'] = "ok" if not pending else f"{len(pending)} pending"
+    except sqlite3.Error as e:
+        checks['database'] = f"error: {e}"
+    checks['jobs'] = "running" if job_queue.running else ("disabled" if job_queue.workers <= 0 else "stopped")
+
+    ready = checks.get('database') == "ok" and checks.get('migrations') == "ok"
+    return jsonify(status="ready" if ready else "unavailable", pid=os.getpid(), checks=checks), 200 if ready else 503
+
+
 # --- INDEX ---
 @app.route('/')
 def index():
@@ -897,29 +1492,58 @@ def index():
 @app.route('/login', methods=['GET', 'POST'])
 def login():
     error = None
+    status = 200
 
     if request.method == 'POST':
         username = request.form['username'].strip()
         password = request.form['password'].strip()
 
+        # Turn brute-force traffic away before it costs a password hash
+        ip = request.remote_addr or 'unknown'
+        account = username.lower()
+        wait = max(ip_limiter.retry_after(ip), username_limiter.retry_after((account, ip)),
+                   account_limiter.retry_after(account))
+        if wait:
+            return render_template('login.html',
+                                   error=f"Too many login attempts. Please try again in {wait} seconds.",
+                                   timestamp=datetime.now().strftime("%Y-%m-%d %H:%M:%S")), 429
+        ip_limiter.hit(ip)
+
         conn = get_db_connection()
         cur = conn.cursor()
-        cur.execute("SELECT UserID, Username, PasswordHash, RoleID FROM users WHERE Username=?", (username,))
+        cur.execute(LOGIN_QUERY, (username,))
         user = cur.fetchone()
-        conn.close()
 
         # Secure password check using hash
-        if user and check_password_hash(user["PasswordHash"], password):
+        try:
+            ok, new_hash = verify_password(user["PasswordHash"], password) if user else (False, None)
+        except AuthBusy:
+            ok, new_hash = None, None
+
+        if ok:
+            if new_hash:
+                # Plaintext or outdated hash: store the current kind
+                conn.execute("UPDATE users SET PasswordHash = ? WHERE UserID = ?", (new_hash, user["UserID"]))
+                conn.commit()
+            conn.close()
+            username_limiter.reset((account, ip))
             session['username'] = user["Username"]
             session['role_id'] = user["RoleID"]
 
-            return redirect(url_for('home')) 
+            return redirect(url_for('home'))
+
+        conn.close()
+        if ok is None:
+            error = "The server is busy. Please try again in a moment."
+            status = 503
         else:
+            username_limiter.hit((account, ip))
+            account_limiter.hit(account)
             error = "Invalid username or password."
 
     return render_template('login.html',
                            error=error,
-                           timestamp=datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+                           timestamp=datetime.now().strftime("%Y-%m-%d %H:%M:%S")), status
 
 # --- LOGOUT ---
 @app.route('/logout')
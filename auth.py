@@ -0,0 +1,276 @@
+import hmac
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+
+from flask import redirect, render_template, session, url_for
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from db import get_db_connection
+
+# -------------------------
+# Authentication Settings
+# -------------------------
+# PASSWORD_HASH_METHOD is any werkzeug method string, e.g. "scrypt",
+# "scrypt:16384:8:1" or "pbkdf2:sha256:600000"; stored hashes made with a
+# different method are re-hashed on the user's next successful login.
+
+PASSWORD_HASH_METHOD = os.environ.get("PASSWORD_HASH_METHOD", "scrypt")
+HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", max(1, (os.cpu_count() or 2) // 2)))
+HASH_QUEUE = int(os.environ.get("PASSWORD_HASH_QUEUE", HASH_WORKERS * 8))
+ROLE_CACHE_TTL = float(os.environ.get("ROLE_CACHE_TTL", 30))
+
+LOGIN_WINDOW_SECONDS = float(os.environ.get("LOGIN_WINDOW_SECONDS", 300))
+LOGIN_LIMIT_PER_IP = int(os.environ.get("LOGIN_LIMIT_PER_IP", 30))
+LOGIN_LIMIT_PER_USER = int(os.environ.get("LOGIN_LIMIT_PER_USER", 5))
+LOGIN_LIMIT_PER_ACCOUNT = int(os.environ.get("LOGIN_LIMIT_PER_ACCOUNT", 100))
+
+LOGIN_QUERY = "SELECT UserID, Username, PasswordHash, RoleID FROM users WHERE Username=?"
+
+ADMIN_ROLE = "Administrator"
+HASH_PREFIXES = ('scrypt:', 'pbkdf2:')
+
+
+class AuthBusy(Exception):
+    """Raised when the hashing pool is full; the caller should answer 503."""
+
+
+# -------------------------
+# Password Hashing Pool
+# -------------------------
+# Hashing is deliberately slow, and hashlib releases the GIL while it runs,
+# so a login storm on many request threads would otherwise run a hash per
+# thread at once and starve every other request of CPU. All hashing goes
+# through a few worker threads instead; once HASH_QUEUE hashes are waiting,
+# further logins are refused straight away rather than queueing.
+
+class HashPool:
+    def __init__(self, workers=HASH_WORKERS, queue=HASH_QUEUE):
+        self.workers = workers
+        self._slots = threading.BoundedSemaphore(workers + queue)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+
+    def _get_executor(self):
+        # Created on first use, and again in a forked child, whose copy of
+        # the parent's pool would have no threads
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="hash")
+                    self._pid = os.getpid()
+        return self._executor
+
+    def run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise AuthBusy()
+        try:
+            return self._get_executor().submit(fn, *args).result()
+        finally:
+            self._slots.release()
+
+
+hash_pool = HashPool()
+_method_prefix = None
+
+
+def _current_method_prefix():
+    # werkzeug fills in default parameters, so take the canonical form
+    # ("scrypt:32768:8:1") from a real hash, once
+    global _method_prefix
+    if _method_prefix is None:
+        _method_prefix = generate_password_hash("", PASSWORD_HASH_METHOD).split('$', 1)[0]
+    return _method_prefix
+
+
+def is_password_hash(value):
+    return bool(value) and value.startswith(HASH_PREFIXES) and value.count('$') >= 2
+
+
+def hash_password(password):
+    return hash_pool.run(generate_password_hash, password, PASSWORD_HASH_METHOD)
+
+
+def verify_password(stored, password):
+    """
+    Checks a password against the stored PasswordHash. Returns (ok,
+    new_hash); new_hash is set when the stored value should be replaced,
+    either because it is plaintext left by older admin forms and seed
+    files, or because it was hashed with another method.
+    """
+    if not stored:
+        return False, None
+    if not is_password_hash(stored):
+        ok = hmac.compare_digest(stored.encode('utf-8'), password.encode('utf-8'))
+        return ok, hash_password(password) if ok else None
+
+    ok = hash_pool.run(check_password_hash, stored, password)
+    if ok and stored.split('$', 1)[0] != _current_method_prefix():
+        return True, hash_password(password)
+    return ok, None
+
+
+def upgrade_plaintext_passwords(conn, progress=None):
+    """Hashes every stored plaintext password; returns how many were."""
+    rows = conn.execute("SELECT UserID, PasswordHash FROM users").fetchall()
+    upgraded = 0
+    for user_id, stored in rows:
+        if stored and not is_password_hash(stored):
+            conn.execute("UPDATE users SET PasswordHash = ? WHERE UserID = ?", (hash_password(stored), user_id))
+            conn.commit()
+            upgraded += 1
+            if progress:
+                progress(f"  {upgraded:,} passwords hashed")
+    return upgraded
+
+
+# -------------------------
+# Login Rate Limiting
+# -------------------------
+# Failed and successful attempts alike count against the client IP; only
+# failures count against a username. A username is limited per client IP
+# (LOGIN_LIMIT_PER_USER), so someone guessing from elsewhere cannot lock
+# the real user out, and also overall (LOGIN_LIMIT_PER_ACCOUNT, well above
+# the first) against guessing spread over many IPs. All are checked before
+# any hashing, so brute-force traffic is turned away without using the
+# hashing pool. Counters are per process.
+
+class RateLimiter:
+    """At most `limit` hits per key in any `window` seconds."""
+
+    def __init__(self, limit, window=LOGIN_WINDOW_SECONDS, max_keys=100000):
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys
+        self._hits = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _recent(self, key, now):
+        hits = self._hits.get(key)
+        if hits is None:
+            return None
+        while hits and hits[0] <= now - self.window:
+            hits.popleft()
+        if not hits:
+            del self._hits[key]
+            return None
+        return hits
+
+    def retry_after(self, key):
+        """Seconds until `key` may try again; 0 if it may now."""
+        now = time.monotonic()
+        with self._lock:
+            hits = self._recent(key, now)
+            if hits is None or len(hits) < self.limit:
+                return 0
+            return max(1, int(hits[0] + self.window - now) + 1)
+
+    def hit(self, key):
+        now = time.monotonic()
+        with self._lock:
+            hits = self._recent(key, now)
+            if hits is None:
+                hits = self._hits[key] = deque(maxlen=self.limit)
+                # Forget the least recently seen keys first
+                while len(self._hits) > self.max_keys:
+                    self._hits.popitem(last=False)
+            self._hits.move_to_end(key)
+            hits.append(now)
+
+    def reset(self, key):
+        with self._lock:
+            self._hits.pop(key, None)
+
+
+ip_limiter = RateLimiter(LOGIN_LIMIT_PER_IP)
+username_limiter = RateLimiter(LOGIN_LIMIT_PER_USER)    # keyed by (username, IP)
+account_limiter = RateLimiter(LOGIN_LIMIT_PER_ACCOUNT)  # keyed by username
+
+
+# -------------------------
+# Roles
+# -------------------------
+# Role-gated views look the session's role up in an in-process copy of the
+# roles table, reloaded every ROLE_CACHE_TTL seconds (and at once in the
+# process that edits a role), instead of querying it on every request.
+
+class RoleCache:
+    def __init__(self, ttl=ROLE_CACHE_TTL):
+        self.ttl = ttl
+        self._roles = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def roles(self):
+        now = time.monotonic()
+        if self._roles is None or now - self._loaded_at > self.ttl:
+            with self._lock:
+                if self._roles is None or now - self._loaded_at > self.ttl:
+                    conn = get_db_connection()
+                    rows = conn.execute("SELECT RoleID, RoleName, Permissions FROM roles").fetchall()
+                    conn.close()
+                    self._roles = {row['RoleID']: dict(row) for row in rows}
+                    self._loaded_at = now
+        return self._roles
+
+    def get(self, role_id):
+        return self.roles().get(role_id)
+
+    def invalidate(self):
+        self._roles = None
+
+
+role_cache = RoleCache()
+
+
+def current_role():
+    """The logged-in user's role row, or None."""
+    if 'username' not in session:
+        return None
+    return role_cache.get(session.get('role_id'))
+
+
+def is_admin():
+    role = current_role()
+    return role is not None and role['RoleName'] == ADMIN_ROLE
+
+
+def role_required(*role_names):
+    """
+    Restricts a view to logged-in users holding one of `role_names`
+    (any role when none are given). Anonymous users are sent to the login
+    page; others get a 403 error page.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            if 'username' not in session:
+                return redirect(url_for('login'))
+            role = current_role()
+            if role is None or (role_names and role['RoleName'] not in role_names):
+                return render_template('error.html', message="You are not authorized to view this page."), 403
+            return view(*args, **kwargs)
+        return wrapped
+    return decorator
+
+
+admin_required = role_required(ADMIN_ROLE)
+
+
+if __name__ == '__main__':
+    from db import connect
+    from migrations import run_migrations
+
+    if sys.argv[1:] != ['upgrade-passwords']:
+        sys.exit("usage: python auth.py upgrade-passwords")
+
+    conn = connect()
+    run_migrations(conn)
+    count = upgrade_plaintext_passwords(conn, progress=print)
+    conn.close()
+    print(f"Hashed {count:,} plaintext passwords.")
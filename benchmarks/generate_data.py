@@ -0,0 +1,173 @@
+import argparse
+import os
+import sys
+import time
+
+# -------------------------
+# Synthetic Benchmark Data
+# -------------------------
+# Fills a separate database with generated countries, minerals, sites,
+# production stats, prices and insights at a chosen scale, then rebuilds
+# the derived tables (price stats, country summaries, search index) the
+# way a bulk load would. Run from the repository root:
+#
+#     python -m benchmarks.generate_data --scale medium
+#     python -m benchmarks.generate_data --sites 10000 --prices 10000000
+#
+# Three users are created for the load driver, all with the password
+# BENCH_PASSWORD: bench_admin, bench_investor and bench_researcher.
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DEFAULT_DB = os.path.join("Data", "bench.db")
+BENCH_PASSWORD = "benchmark-password"
+BENCH_USERS = (("bench_admin", 1), ("bench_investor", 2), ("bench_researcher", 3))
+ROLES = ((1, "Administrator", "Full access (manage users, edit/delete data)"),
+         (2, "Investor", "View country profiles, charts, exports, production"),
+         (3, "Researcher", "View/export mineral & country data, add insights"))
+
+SCALES = {
+    'small': dict(countries=54, minerals=20, sites=1000, production=20000, prices=100000, insights=5000),
+    'medium': dict(countries=54, minerals=40, sites=10000, production=200000, prices=1000000, insights=50000),
+    'large': dict(countries=200, minerals=60, sites=10000, production=1000000, prices=10000000, insights=200000),
+}
+
+BATCH_ROWS = 100000
+FIRST_YEAR = 1900
+WORDS = ("cobalt", "lithium", "graphite", "manganese", "copper", "nickel", "expansion", "exports",
+         "battery", "refinery", "concession", "smelter", "pipeline", "tailings", "royalties",
+         "investment", "exploration", "demand", "supply", "licence", "railway", "port")
+
+
+def _batches(total, make_rows):
+    for start in range(0, total, BATCH_ROWS):
+        yield make_rows(start, min(start + BATCH_ROWS, total))
+
+
+def _text(rng, n_words):
+    return ' '.join(rng.choice(WORDS, n_words))
+
+
+def generate(conn, countries, minerals, sites, production, prices, insights, seed=0, progress=print):
+    import numpy as np
+
+    from auth import hash_password
+    from cache import bump_data_version
+    from country_summaries import rebuild_country_summaries
+    from migrations import INDEXES, SORT_INDEXES, ensure_indexes
+    from price_analytics import rebuild_price_stats
+
+    rng = np.random.default_rng(seed)
+    tables = ('mineral_insights', 'mineral_prices', 'production_stats', 'sites', 'countries',
+              'minerals', 'users', 'roles')
+    for table in tables:
+        conn.execute(f"DELETE FROM {table}")
+    # Indexes are rebuilt once at the end, as bulk_load.py does
+    for name, _, _ in INDEXES + SORT_INDEXES:
+        conn.execute(f"DROP INDEX IF EXISTS {name}")
+
+    def timed(label, sql, total, make_rows):
+        started = time.perf_counter()
+        for rows in _batches(total, make_rows):
+            conn.executemany(sql, rows)
+        conn.commit()
+        progress(f"  {label}: {total:,} rows in {time.perf_counter() - started:.1f}s")
+
+    conn.executemany("INSERT INTO roles (RoleID, RoleName, Permissions) VALUES (?, ?, ?)", ROLES)
+    password_hash = hash_password(BENCH_PASSWORD)
+    conn.executemany("INSERT INTO users (Username, PasswordHash, RoleID) VALUES (?, ?, ?)",
+                     [(name, password_hash, role_id) for name, role_id in BENCH_USERS])
+
+    mineral_names = [f"Mineral {i}" for i in range(1, minerals + 1)]
+    timed("minerals", "INSERT INTO minerals (MineralID, MineralName, Description, MarketPriceUSD_per_tonne) "
+          "VALUES (?, ?, ?, ?)", minerals, lambda a, b: [
+        (i + 1, mineral_names[i], _text(rng, 8), float(rng.uniform(500, 80000))) for i in range(a, b)
+    ])
+    timed("countries", "INSERT INTO countries (CountryID, CountryName, GDP_BillionUSD, MiningRevenue_BillionUSD, "
+          "KeyProjects, Population_Millions) VALUES (?, ?, ?, ?, ?, ?)", countries, lambda a, b: [
+        (i + 1, f"Country {i + 1}", float(gdp), float(gdp * rng.uniform(0.01, 0.4)), _text(rng, 6),
+         float(rng.uniform(1, 200)))
+        for i, gdp in zip(range(a, b), rng.uniform(5, 500, b - a))
+    ])
+
+    def site_rows(a, b):
+        n = b - a
+        lat, lon = rng.uniform(-35, 37, n), rng.uniform(-18, 51, n)
+        country = rng.integers(1, countries + 1, n)
+        mineral = rng.integers(1, minerals + 1, n)
+        output = rng.lognormal(10, 1.5, n)
+        return [(a + i + 1, f"Site {a + i + 1}", int(country[i]), int(mineral[i]),
+                 float(lat[i]), float(lon[i]), float(output[i])) for i in range(n)]
+    timed("sites", "INSERT INTO sites (SiteID, SiteName, CountryID, MineralID, Latitude, Longitude, "
+          "Production_tonnes) VALUES (?, ?, ?, ?, ?, ?, ?)", sites, site_rows)
+
+    def production_rows(a, b):
+        n = b - a
+        year = rng.integers(FIRST_YEAR, 2026, n)
+        country = rng.integers(1, countries + 1, n)
+        mineral = rng.integers(1, minerals + 1, n)
+        output = rng.lognormal(10, 1.5, n)
+        value = output * rng.uniform(1e-6, 1e-4, n)
+        return [(a + i + 1, int(year[i]), int(country[i]), int(mineral[i]), float(output[i]), float(value[i]))
+                for i in range(n)]
+    timed("production_stats", "INSERT INTO production_stats (StatID, Year, CountryID, MineralID, Production_tonnes, "
+          "ExportValue_BillionUSD) VALUES (?, ?, ?, ?, ?, ?)", production, production_rows)
+
+    def price_rows(a, b):
+        n = b - a
+        # Ids cycle through minerals and then years, so each (mineral, year)
+        # gets several revisions spread across the table
+        ids = np.arange(a, b)
+        mineral = ids % minerals
+        year = FIRST_YEAR + (ids // minerals) % (2026 - FIRST_YEAR)
+        price = rng.lognormal(9, 1, n)
+        return [(mineral_names[mineral[i]], int(year[i]), float(price[i])) for i in range(n)]
+    timed("mineral_prices",
+          "INSERT INTO mineral_prices (MineralName, Year, PriceUSD_per_tonne) VALUES (?, ?, ?)",
+          prices, price_rows)
+
+    timed("mineral_insights", "INSERT INTO mineral_insights (MineralID, Insight) VALUES (?, ?)", insights,
+          lambda a, b: [(int(m), _text(rng, 20)) for m in rng.integers(1, minerals + 1, b - a)])
+
+    started = time.perf_counter()
+    ensure_indexes(conn, INDEXES + SORT_INDEXES)
+    rebuild_price_stats(conn)
+    # The search index was kept current by its triggers; just compact it
+    conn.execute("INSERT INTO search_index (search_index) VALUES ('optimize')")
+    # Every cached page and ETag is stale; bumping (rather than clearing)
+    # the versions keeps them from matching pages cached before the load
+    bump_data_version(conn, *tables, 'price_ticks')
+    conn.commit()
+    rebuild_country_summaries(conn)
+    progress(f"  indexes and derived tables in {time.perf_counter() - started:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic database for benchmarks.")
+    parser.add_argument("--db", default=DEFAULT_DB, help=f"database to (re)fill (default: {DEFAULT_DB})")
+    parser.add_argument("--scale", choices=SCALES, default='small', help="preset sizes (default: small)")
+    for name in SCALES['small']:
+        parser.add_argument(f"--{name}", type=int, help=f"number of {name} rows (overrides --scale)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    sizes = {name: getattr(args, name) or default for name, default in SCALES[args.scale].items()}
+
+    # db.py reads the path at import
+    os.environ["MINERALS_DB_PATH"] = args.db
+    os.environ.setdefault("SQLITE_SYNCHRONOUS", "OFF")
+    from db import connect
+    from migrations import run_migrations
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.db)), exist_ok=True)
+    conn = connect()
+    run_migrations(conn)
+    print(f"Generating {', '.join(f'{v:,} {k}' for k, v in sizes.items())} into {args.db}")
+    started = time.perf_counter()
+    generate(conn, seed=args.seed, **sizes)
+    conn.close()
+    print(f"Done in {time.perf_counter() - started:.1f}s.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,335 @@
+import argparse
+import http.cookiejar
+import json
+import os
+import platform
+import random
+import resource
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+# -------------------------
+# Route Load Test
+# -------------------------
+# Drives the key routes against a generated database (see generate_data.py)
+# and reports p50/p99 latency, throughput and peak RSS for each. Runs the
+# app in-process through Flask's test client by default, or against a
+# running server with --url. Run from the repository root:
+#
+#     python -m benchmarks.generate_data --scale medium
+#     python -m benchmarks.load_test --requests 200 --concurrency 4
+#     python -m benchmarks.load_test --url http://127.0.0.1:8000 --server-pid 1234
+#
+# Regression gate: save a run as the baseline, then compare later runs to
+# it. The run exits 1 if any route got slower than the tolerance allows.
+#
+#     python -m benchmarks.load_test --save-baseline benchmarks/baselines/ci.json
+#     python -m benchmarks.load_test --baseline benchmarks/baselines/ci.json --tolerance 0.25
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.generate_data import BENCH_PASSWORD, DEFAULT_DB  # noqa: E402
+
+# name -> (user role, method, path, form data); {country}, {mineral},
+# {site}, {tile_x} and {tile_y} are replaced by random values on every request
+SCENARIOS = {
+    'login': (None, 'POST', '/login', {'username': 'bench_investor', 'password': BENCH_PASSWORD}),
+    'home': ('investor', 'GET', '/home', None),
+    'map': ('investor', 'GET', '/investor/map', None),
+    'map_tile': ('investor', 'GET', '/investor/map/tiles/5/{tile_x}/{tile_y}.geojson', None),
+    'sites_geojson': ('investor', 'GET', '/sites.geojson?mineral_id={mineral}', None),
+    'sites_within': ('investor', 'GET', '/investor/sites/within?lat=-5&lon=25&radius_km=500', None),
+    'sites_nearest': ('investor', 'GET', '/investor/sites/nearest?lat=-29.87&lon=31.03&k=10&mineral_id={mineral}', None),
+    'country_profile': ('investor', 'GET', '/investor/country-profile?country_id={country}', None),
+    'compare': ('investor', 'GET',
+                '/investor/compare-countries?country_id={country}&country_id={country}&country_id={country}', None),
+    'analyze_prices': ('investor', 'GET', '/investor/analyze-prices', None),
+    'export_sites_csv': ('investor', 'POST', '/investor/export-sites',
+                         {'country_id': ['{country}', '{country}'], 'format': 'csv'}),
+    'export_production_csv': ('investor', 'POST', '/investor/export-production',
+                              {'country_id': ['{country}'], 'format': 'csv'}),
+    'search': ('investor', 'GET', '/search?q=cobalt+expan', None),
+    'insights_feed': ('researcher', 'GET', '/researcher/insights/feed?mineral_id={mineral}', None),
+    'admin_sites': ('admin', 'GET', '/admin/sites', None),
+    'admin_production': ('admin', 'GET', '/admin/production?sort=Year&order=desc', None),
+    'admin_prices': ('admin', 'GET', '/admin/prices', None),
+    'admin_users': ('admin', 'GET', '/admin/users', None),
+}
+
+USERS = {'admin': 'bench_admin', 'investor': 'bench_investor', 'researcher': 'bench_researcher'}
+
+
+# -------------------------
+# Clients
+# -------------------------
+
+class TestClientSession:
+    """One logged-in Flask test client."""
+
+    def __init__(self, app, username):
+        self.client = app.test_client()
+        if username:
+            response = self.client.post('/login', data={'username': username, 'password': BENCH_PASSWORD})
+            if response.status_code != 302:
+                raise RuntimeError(f"Could not log in as {username}; generate the data first")
+
+    def request(self, method, path, data):
+        response = self.client.open(path, method=method, data=data)
+        response.get_data()   # read streamed bodies to the end
+        response.close()
+        return response.status_code
+
+
+class HTTPSession:
+    """One logged-in session against a running server."""
+
+    def __init__(self, base_url, username):
+        self.base_url = base_url.rstrip('/')
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect())
+        if username:
+            status = self.request('POST', '/login', {'username': username, 'password': BENCH_PASSWORD})
+            if status != 302:
+                raise RuntimeError(f"Could not log in as {username} (HTTP {status})")
+
+    def request(self, method, path, data):
+        body = urllib.parse.urlencode(data, doseq=True).encode() if data is not None else None
+        req = urllib.request.Request(self.base_url + path, data=body, method=method)
+        try:
+            with self.opener.open(req) as response:
+                while response.read(65536):
+                    pass
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    # Measure the route itself, not the page it redirects to
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+def _fill(value, rng, sizes):
+    if isinstance(value, list):
+        return [_fill(v, rng, sizes) for v in value]
+    if isinstance(value, dict):
+        return {k: _fill(v, rng, sizes) for k, v in value.items()}
+    if isinstance(value, str) and '{' in value:
+        while '{' in value:
+            start = value.index('{')
+            end = value.index('}', start)
+            bounds = sizes[value[start + 1:end]]
+            low, high = bounds if isinstance(bounds, tuple) else (1, bounds)
+            value = value[:start] + str(rng.randint(low, high)) + value[end + 1:]
+    return value
+
+
+# -------------------------
+# Measurement
+# -------------------------
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def peak_rss_mb(server_pid=None):
+    if server_pid:
+        with open(f"/proc/{server_pid}/status") as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+        return None
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def run_scenario(name, make_session, sizes, requests, warmup, concurrency, seed, server_pid=None):
+    role, method, path, data = SCENARIOS[name]
+    sessions = [make_session(USERS.get(role)) for _ in range(concurrency)]
+    # Successful logins answer 302; a page redirecting is a failure
+    ok_statuses = {200, 302} if name == 'login' else {200}
+
+    for i in range(warmup):
+        rng = random.Random(seed + i)
+        sessions[0].request(method, _fill(path, rng, sizes), _fill(data, rng, sizes))
+
+    latencies, errors = [], []
+    lock = threading.Lock()
+
+    def worker(index):
+        session = sessions[index]
+        rng = random.Random(seed * 1000 + index)
+        for _ in range(index, requests, concurrency):
+            url, form = _fill(path, rng, sizes), _fill(data, rng, sizes)
+            started = time.perf_counter()
+            status = session.request(method, url, form)
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                if status not in ok_statuses:
+                    errors.append(status)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(worker, range(concurrency)))
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': len(errors),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'mean_ms': round(sum(latencies) / max(len(latencies), 1) * 1000, 2),
+        'rps': round(len(latencies) / wall, 1) if wall else 0.0,
+        'peak_rss_mb': round(peak_rss_mb(server_pid) or 0, 1),
+    }
+
+
+def table_sizes(db_path):
+    import sqlite3
+
+    conn = sqlite3.connect(db_path)
+    sizes = {
+        # Zoom 5 tiles covering Africa
+        'tile_x': (14, 20), 'tile_y': (12, 19),
+        'country': conn.execute("SELECT COALESCE(MAX(CountryID), 1) FROM countries").fetchone()[0],
+        'mineral': conn.execute("SELECT COALESCE(MAX(MineralID), 1) FROM minerals").fetchone()[0],
+        'site': conn.execute("SELECT COALESCE(MAX(SiteID), 1) FROM sites").fetchone()[0],
+    }
+    rows = {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            for table in ('countries', 'minerals', 'sites', 'production_stats', 'mineral_prices', 'mineral_insights')}
+    conn.close()
+    return sizes, rows
+
+
+# -------------------------
+# Regression Gate
+# -------------------------
+
+def check_regressions(results, baseline, tolerance=0.25, slack_ms=2.0):
+    """
+    Compares each route to the baseline. Returns a list of regressions:
+    latency over baseline * (1 + tolerance) + slack_ms, throughput under
+    baseline * (1 - tolerance) when both ran at the same concurrency, or
+    errors where the baseline had none.
+    """
+    problems = []
+    same_load = baseline.get('meta', {}).get('concurrency') == results['meta']['concurrency']
+    for name, base in baseline.get('scenarios', {}).items():
+        current = results['scenarios'].get(name)
+        if current is None:
+            continue
+        for key in ('p50_ms', 'p99_ms'):
+            limit = base[key] * (1 + tolerance) + slack_ms
+            if current[key] > limit:
+                problems.append(f"{name}: {key} {current[key]:.1f} > {limit:.1f} (baseline {base[key]:.1f})")
+        if same_load and current['rps'] < base['rps'] * (1 - tolerance):
+            problems.append(f"{name}: rps {current['rps']:.1f} < {base['rps'] * (1 - tolerance):.1f} "
+                            f"(baseline {base['rps']:.1f})")
+        if current['errors'] and not base['errors']:
+            problems.append(f"{name}: {current['errors']} failed requests")
+    return problems
+
+
+def print_results(results):
+    print(f"\n{'route':<24}{'p50 ms':>9}{'p99 ms':>9}{'mean ms':>9}{'req/s':>9}{'errors':>8}{'RSS MB':>9}")
+    for name, r in results['scenarios'].items():
+        print(f"{name:<24}{r['p50_ms']:>9.1f}{r['p99_ms']:>9.1f}{r['mean_ms']:>9.1f}"
+              f"{r['rps']:>9.1f}{r['errors']:>8}{r['peak_rss_mb']:>9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the key routes.")
+    parser.add_argument("--db", default=DEFAULT_DB, help=f"generated database (default: {DEFAULT_DB})")
+    parser.add_argument("--url", help="base URL of a running server; default is in-process")
+    parser.add_argument("--server-pid", type=int, help="with --url: read the server's peak RSS from /proc")
+    parser.add_argument("--only", help="comma-separated routes to run (default: all)")
+    parser.add_argument("--requests", type=int, default=100, help="timed requests per route")
+    parser.add_argument("--warmup", type=int, default=5, help="untimed requests per route first")
+    parser.add_argument("--concurrency", type=int, default=1, help="client threads")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--baseline", help="compare against this saved run; exit 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown (default 0.25 = 25%%)")
+    parser.add_argument("--slack-ms", type=float, default=2.0, help="absolute latency noise allowance")
+    parser.add_argument("--save-baseline", help="write the results as a new baseline")
+    args = parser.parse_args()
+
+    names = args.only.split(',') if args.only else list(SCENARIOS)
+    unknown = [n for n in names if n not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown routes: {', '.join(unknown)}; choose from {', '.join(SCENARIOS)}")
+
+    if args.url:
+        def make_session(username):
+            return HTTPSession(args.url, username)
+    else:
+        if not os.path.exists(args.db):
+            sys.exit(f"{args.db} not found; run python -m benchmarks.generate_data first")
+        # Settings read at import: the benchmark database, no login throttling
+        # (every request comes from one address), no background jobs
+        os.environ["MINERALS_DB_PATH"] = args.db
+        os.environ.setdefault("LOGIN_LIMIT_PER_IP", str(10 ** 9))
+        os.environ.setdefault("LOGIN_LIMIT_PER_USER", str(10 ** 9))
+        os.environ.setdefault("LOGIN_LIMIT_PER_ACCOUNT", str(10 ** 9))
+        os.environ.setdefault("JOB_WORKERS", "0")
+        from app import app
+
+        def make_session(username):
+            return TestClientSession(app, username)
+
+    sizes, rows = table_sizes(args.db) if os.path.exists(args.db) else ({'country': 1, 'mineral': 1, 'site': 1}, {})
+    results = {
+        'meta': {
+            'mode': 'http' if args.url else 'in-process',
+            'concurrency': args.concurrency,
+            'requests': args.requests,
+            'rows': rows,
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'cpus': os.cpu_count(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'scenarios': {},
+    }
+    if rows:
+        print("Rows: " + ', '.join(f"{table} {count:,}" for table, count in rows.items()))
+
+    for name in names:
+        results['scenarios'][name] = run_scenario(
+            name, make_session, sizes, args.requests, args.warmup, args.concurrency, args.seed, args.server_pid)
+        r = results['scenarios'][name]
+        print(f"  {name}: p50 {r['p50_ms']:.1f} ms, p99 {r['p99_ms']:.1f} ms, {r['rps']:.1f} req/s")
+
+    print_results(results)
+    for path in (args.output, args.save_baseline):
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            with open(path, 'w') as f:
+                json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        problems = check_regressions(results, baseline, args.tolerance, args.slack_ms)
+        if problems:
+            print("\nRegressions against " + args.baseline + ":")
+            for problem in problems:
+                print(f"  {problem}")
+            sys.exit(1)
+        print(f"\nNo regressions against {args.baseline}.")
+
+
+if __name__ == '__main__':
+    main()
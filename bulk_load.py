@@ -0,0 +1,226 @@
+import os
+import sqlite3
+import time
+
+from cache import bump_data_version
+from country_summaries import SOURCE_TABLES as SUMMARY_SOURCES, rebuild_country_summaries
+from lazy_imports import lazy_module
+
+np = lazy_module("numpy")
+pd = lazy_module("pandas")
+
+# -------------------------
+# Bulk Loader
+# -------------------------
+# Streams a CSV (or Parquet) feed into a table in chunks. Each chunk is
+# validated against the table's declared column types, then written with
+# executemany. Secondary indexes are dropped for the load and rebuilt once
+# at the end, and commits happen every `commit_every` rows rather than per row.
+
+LOAD_MODES = ('upsert', 'ignore')
+
+
+class LoadReport:
+    """Running totals for one load, printable as a progress line."""
+
+    def __init__(self, table):
+        self.table = table
+        self.rows_read = 0
+        self.rows_written = 0
+        self.rows_rejected = 0
+        self.errors = []
+        self.started = time.perf_counter()
+        self.finished = None
+
+    @property
+    def elapsed(self):
+        return (self.finished or time.perf_counter()) - self.started
+
+    @property
+    def rows_per_second(self):
+        return self.rows_written / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self):
+        return (f"{self.table}: {self.rows_written:,} written, {self.rows_rejected:,} rejected "
+                f"of {self.rows_read:,} read in {self.elapsed:.1f}s "
+                f"({self.rows_per_second:,.0f} rows/s)")
+
+
+def table_schema(conn, table):
+    """Returns [(column, declared type, not null, is primary key)] for a table."""
+    rows = conn.execute(f"PRAGMA table_info({table})").fetchall()
+    if not rows:
+        raise ValueError(f"Unknown table: {table}")
+    return [(r[1], (r[2] or '').upper(), bool(r[3]), bool(r[5])) for r in rows]
+
+
+def read_chunks(path, chunksize):
+    """Yields DataFrames of up to `chunksize` rows from a CSV or Parquet file."""
+    if path.endswith('.parquet'):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Loading Parquet files requires pyarrow (pip install pyarrow).")
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunksize, low_memory=False)
+
+
+def validate_chunk(chunk, schema, report, row_offset):
+    """
+    Coerces a chunk to the table's column types. Returns the valid rows as
+    a list of tuples in schema order; invalid rows are counted on the report.
+    """
+    missing = [name for name, _, not_null, pk in schema
+               if name not in chunk.columns and not_null and not pk]
+    if missing:
+        raise ValueError(f"Missing required column(s): {', '.join(missing)}")
+
+    valid = np.ones(len(chunk), dtype=bool)
+    columns = {}
+    for name, col_type, not_null, pk in schema:
+        if name not in chunk.columns:
+            continue
+        raw = chunk[name]
+        present = raw.notna().to_numpy()
+
+        if 'INT' in col_type:
+            values = pd.to_numeric(raw, errors='coerce')
+            ok = values.notna().to_numpy() & (values.fillna(0) % 1 == 0).to_numpy()
+        elif any(t in col_type for t in ('REAL', 'FLOA', 'DOUB', 'NUM')):
+            values = pd.to_numeric(raw, errors='coerce')
+            ok = values.notna().to_numpy()
+        else:
+            values = raw.astype(str)
+            ok = present
+
+        bad = present & ~ok
+        if not_null and not pk:
+            bad |= ~present
+        if bad.any():
+            for i in np.flatnonzero(bad)[:max(0, 5 - len(report.errors))]:
+                report.errors.append(f"row {row_offset + i + 1}: bad {name} value {raw.iloc[i]!r}")
+        valid &= ~bad
+
+        if 'INT' in col_type:
+            values = values.round().astype('Int64')
+        columns[name] = values.astype(object).where(present & ok, None)
+
+    report.rows_rejected += int((~valid).sum())
+    names = list(columns)
+    return names, list(zip(*(columns[n][valid].tolist() for n in names)))
+
+
+def _insert_sql(table, names, pk_columns, mode):
+    placeholders = ','.join(['?'] * len(names))
+    sql = f"INSERT INTO {table} ({','.join(names)}) VALUES ({placeholders})"
+    if mode == 'ignore':
+        return sql.replace("INSERT INTO", "INSERT OR IGNORE INTO", 1)
+    updates = [n for n in names if n not in pk_columns]
+    if not pk_columns or not updates:
+        return sql.replace("INSERT INTO", "INSERT OR IGNORE INTO", 1)
+    assignments = ', '.join(f"{n} = excluded.{n}" for n in updates)
+    return f"{sql} ON CONFLICT({','.join(pk_columns)}) DO UPDATE SET {assignments}"
+
+
+def _write_chunk(conn, sql, names, rows, report, strict):
+    """
+    Writes one chunk and returns the number of rows written. If a row
+    breaks a constraint the upsert does not cover (another UNIQUE column, a
+    foreign key), the chunk is retried row by row and the offending rows
+    are rejected, unless `strict` is set.
+    """
+    if not conn.in_transaction:
+        # Releasing a savepoint that opened the transaction would commit it
+        conn.execute("BEGIN")
+    conn.execute("SAVEPOINT load_chunk")
+    try:
+        # rowcount skips rows ignored as duplicates and trigger writes
+        written = max(conn.executemany(sql, rows).rowcount, 0)
+    except sqlite3.IntegrityError as e:
+        conn.execute("ROLLBACK TO load_chunk")
+        if strict:
+            conn.execute("RELEASE load_chunk")
+            raise ValueError(f"{report.table}: {e}") from e
+        written = 0
+        for row in rows:
+            try:
+                written += max(conn.execute(sql, row).rowcount, 0)
+            except sqlite3.IntegrityError as row_error:
+                report.rows_rejected += 1
+                if len(report.errors) < 5:
+                    key = ', '.join(f"{n}={v!r}" for n, v in zip(names, row[:2]))
+                    report.errors.append(f"{key}: {row_error}")
+    conn.execute("RELEASE load_chunk")
+    return written
+
+
+def load_table(conn, table, path, mode='upsert', chunksize=50000,
+               commit_every=500000, strict=False, progress=print):
+    """
+    Loads `path` into `table` and returns a LoadReport.
+
+    mode='upsert' overwrites rows whose primary key already exists;
+    mode='ignore' keeps existing rows and only inserts new keys.
+    """
+    if mode not in LOAD_MODES:
+        raise ValueError(f"mode must be one of {', '.join(LOAD_MODES)}")
+
+    schema = table_schema(conn, table)
+    pk_columns = [name for name, _, _, pk in schema if pk]
+    report = LoadReport(table)
+
+    # Defer secondary indexes: drop now, rebuild after the data is in.
+    # UNIQUE indexes stay, since they enforce constraints during the load.
+    indexes = conn.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? "
+        "AND sql IS NOT NULL AND sql NOT LIKE 'CREATE UNIQUE%'",
+        (table,)
+    ).fetchall()
+    for name, _ in indexes:
+        conn.execute(f"DROP INDEX {name}")
+
+    pending = 0
+    try:
+        for chunk in read_chunks(path, chunksize):
+            names, rows = validate_chunk(chunk, schema, report, report.rows_read)
+            report.rows_read += len(chunk)
+            if strict and report.rows_rejected:
+                raise ValueError(f"{table}: invalid rows in {path}: {'; '.join(report.errors)}")
+
+            report.rows_written += _write_chunk(conn, _insert_sql(table, names, pk_columns, mode),
+                                                names, rows, report, strict)
+            pending += len(rows)
+            if pending >= commit_every:
+                conn.commit()
+                pending = 0
+            if progress:
+                progress(str(report))
+
+        bump_data_version(conn, table)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        # Committed batches stay even when the load fails, so the indexes
+        # go back either way
+        for _, sql in indexes:
+            conn.execute(sql.replace("CREATE INDEX", "CREATE INDEX IF NOT EXISTS", 1))
+        conn.commit()
+
+    if table in SUMMARY_SOURCES:
+        rebuild_country_summaries(conn)
+
+    report.finished = time.perf_counter()
+    return report
+
+
+def find_source(data_dir, table):
+    """Prefers Data/<table>.parquet over Data/<table>.csv when both exist."""
+    for ext in ('.parquet', '.csv'):
+        path = os.path.join(data_dir, table + ext)
+        if os.path.exists(path):
+            return path
+    return None
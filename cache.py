@@ -0,0 +1,134 @@
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+# -------------------------
+# Data Versions
+# -------------------------
+# Every table that feeds a cached page has a counter in data_versions. Admin
+# write routes bump it inside the same transaction as their change, so any
+# worker process reading the counter sees exactly when its cache went stale.
+
+def ensure_data_versions(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS data_versions (
+            TableName TEXT PRIMARY KEY,
+            Version INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+
+
+def bump_data_version(conn, *tables):
+    """Increments the version of each table. Call before the write is committed."""
+    for table in tables:
+        conn.execute("""
+            INSERT INTO data_versions (TableName, Version) VALUES (?, 1)
+            ON CONFLICT(TableName) DO UPDATE SET Version = Version + 1
+        """, (table,))
+
+
+DATA_VERSIONS_QUERY = "SELECT TableName, Version FROM data_versions WHERE TableName IN ({placeholders})"
+
+
+def get_data_version(conn, *tables):
+    """Returns the versions of the given tables as a tuple, in the order asked."""
+    rows = conn.execute(
+        DATA_VERSIONS_QUERY.format(placeholders=','.join(['?'] * len(tables))),
+        tables
+    ).fetchall()
+    versions = {row[0]: row[1] for row in rows}
+    return tuple(versions.get(table, 0) for table in tables)
+
+
+# -------------------------
+# LRU Cache with Optional Disk Tier
+# -------------------------
+
+class LRUCache:
+    """
+    Thread-safe LRU cache of bytes values, bounded by entry count and total
+    size. When `disk_dir` is set, entries are also written there so other
+    worker processes sharing the directory can pick them up.
+    """
+
+    def __init__(self, max_entries=128, max_bytes=64 * 1024 * 1024,
+                 disk_dir=None, max_disk_entries=1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.max_disk_entries = max_disk_entries
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, hashlib.sha256(key.encode('utf-8')).hexdigest())
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                return value
+
+        if not self.disk_dir:
+            return None
+        try:
+            with open(self._disk_path(key), 'rb') as f:
+                value = f.read()
+        except OSError:
+            return None
+        self._remember(key, value)
+        return value
+
+    def set(self, key, value):
+        self._remember(key, value)
+        if self.disk_dir:
+            self._write_disk(key, value)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def _remember(self, key, value):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old)
+            self._entries[key] = value
+            self._size += len(value)
+            while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def _write_disk(self, key, value):
+        # Write to a temp file and rename so readers never see a partial entry
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.disk_dir, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(value)
+            os.replace(tmp_path, self._disk_path(key))
+        except OSError:
+            return
+        self._prune_disk()
+
+    def _prune_disk(self):
+        try:
+            entries = [e for e in os.scandir(self.disk_dir) if not e.name.endswith('.tmp')]
+        except OSError:
+            return
+        if len(entries) <= self.max_disk_entries:
+            return
+        entries.sort(key=lambda e: e.stat().st_mtime)
+        for entry in entries[:len(entries) - self.max_disk_entries]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
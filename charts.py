@@ -0,0 +1,126 @@
+import base64
+import hashlib
+import hmac
+import io
+import json
+import zlib
+
+from cache import LRUCache
+from instrumentation import timed
+
+# -------------------------
+# Chart Rendering
+# -------------------------
+# Charts are drawn on standalone Figure objects (Agg canvas, no pyplot), so
+# concurrent requests never share global plotting state. A chart's URL
+# carries its whole spec (kind and inputs, compressed and signed with the
+# app's secret key), so any worker can render it on first fetch, whichever
+# worker rendered the page and whatever it has cached since. Images are
+# memoized by a hash of the spec.
+
+CHART_FORMATS = {
+    'png': 'image/png',
+    'svg': 'image/svg+xml',
+}
+
+
+def draw_gdp_pie(fig, gdp, mining_revenue):
+    labels = ['Mining Revenue', 'Other GDP']
+    values = [mining_revenue, gdp - mining_revenue]
+    colors = ['#4F46E5', '#A5B4FC']
+
+    ax = fig.subplots()
+    ax.pie(values, labels=labels, autopct='%1.1f%%', colors=colors, startangle=90)
+    ax.set_title('GDP Composition')
+
+
+def draw_gdp_comparison(fig, countries):
+    """
+    Grouped bar chart comparing GDP and Mining Revenue across countries.
+    Expects a list of dicts with keys: 'CountryName', 'GDP_BillionUSD', 'MiningRevenue_BillionUSD'
+    """
+    country_names = [c['CountryName'] for c in countries]
+    gdp_values = [c['GDP_BillionUSD'] for c in countries]
+    mining_values = [c['MiningRevenue_BillionUSD'] for c in countries]
+
+    x = range(len(countries))
+    width = 0.35
+
+    ax = fig.subplots()
+    ax.bar([i - width/2 for i in x], gdp_values, width, label='GDP', color='#4F46E5')
+    ax.bar([i + width/2 for i in x], mining_values, width, label='Mining Revenue', color='#A5B4FC')
+
+    ax.set_xticks(list(x))
+    ax.set_xticklabels(country_names, rotation=45, ha='right')
+    ax.set_ylabel('Billion USD')
+    ax.set_title('GDP vs Mining Revenue by Country')
+    ax.legend()
+    ax.grid(axis='y', linestyle='--', alpha=0.5)
+
+    fig.tight_layout()
+
+
+# kind -> (draw function, figure size in inches)
+CHART_KINDS = {
+    'gdp_pie': (draw_gdp_pie, (6.4, 4.8)),
+    'gdp_comparison': (draw_gdp_comparison, (10, 6)),
+}
+
+
+class ChartService:
+    """
+    Turns chart specs into signed URL tokens and renders them on demand,
+    keeping rendered images in an LRU cache.
+    """
+
+    def __init__(self, secret, max_entries=256, max_bytes=32 * 1024 * 1024, disk_dir=None):
+        self.secret = secret.encode('utf-8') if isinstance(secret, str) else secret
+        self.images = LRUCache(max_entries=max_entries, max_bytes=max_bytes, disk_dir=disk_dir)
+
+    def _sign(self, payload):
+        return hmac.new(self.secret, payload.encode('ascii'), hashlib.sha256).hexdigest()[:32]
+
+    def token(self, kind, **params):
+        """Returns the URL token for a chart: a signature followed by the encoded spec."""
+        if kind not in CHART_KINDS:
+            raise ValueError(f"Unknown chart kind: {kind}")
+        spec = json.dumps({'kind': kind, 'params': params}, sort_keys=True).encode('utf-8')
+        payload = base64.urlsafe_b64encode(zlib.compress(spec, 9)).decode('ascii').rstrip('=')
+        return self._sign(payload) + payload
+
+    def _spec(self, token):
+        """The spec behind a token, or None if it is malformed or not signed by us."""
+        signature, payload = token[:32], token[32:]
+        if not payload or not hmac.compare_digest(signature, self._sign(payload)):
+            return None
+        try:
+            spec = zlib.decompress(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)))
+            spec = json.loads(spec)
+        except (ValueError, zlib.error):
+            return None
+        return spec if spec.get('kind') in CHART_KINDS else None
+
+    def render(self, token, fmt='png'):
+        """Returns the image bytes for a chart token, or None if it is invalid."""
+        if fmt not in CHART_FORMATS:
+            return None
+        spec = self._spec(token)
+        if spec is None:
+            return None
+        image_key = hashlib.sha256(json.dumps(spec, sort_keys=True).encode('utf-8')).hexdigest()[:32] + '.' + fmt
+        image = self.images.get(image_key)
+        if image is not None:
+            return image
+
+        draw, figsize = CHART_KINDS[spec['kind']]
+        with timed('chart'):
+            # matplotlib loads on the first chart render, not at app startup
+            from matplotlib.figure import Figure
+            fig = Figure(figsize=figsize)
+            draw(fig, **spec['params'])
+            buf = io.BytesIO()
+            fig.savefig(buf, format=fmt)
+            image = buf.getvalue()
+
+        self.images.set(image_key, image)
+        return image
@@ -0,0 +1,115 @@
+from lazy_imports import lazy_module
+
+np = lazy_module("numpy")
+
+# -------------------------
+# Country Comparison
+# -------------------------
+# Every country is read in one query, joined to its precomputed site count
+# and latest-year production totals (country_summary, see
+# country_summaries.py). The derived metrics, ranks and percentiles are
+# computed over all countries in a single NumPy pass, and the selection is
+# picked out of that, so comparing 5 or 50 countries costs the same.
+
+COMPARE_QUERY = """
+    SELECT c.CountryID, c.CountryName, c.GDP_BillionUSD, c.MiningRevenue_BillionUSD,
+           c.KeyProjects, c.Population_Millions, s.LatestYear,
+           s.LatestProduction_tonnes, s.LatestExportValue_BillionUSD, s.SiteCount
+    FROM countries c
+    LEFT JOIN country_summary s ON s.CountryID = c.CountryID
+    ORDER BY c.CountryID
+"""
+
+# (key, label, unit) - ranked highest first
+COMPARE_METRICS = [
+    ('MiningShareOfGDP_Pct', 'Mining share of GDP', '%'),
+    ('ExportIntensity_Pct', 'Mineral exports / GDP', '%'),
+    ('Production_tonnes', 'Production', 't'),
+    ('ProductionPerCapita_tonnes', 'Production per capita', 't'),
+    ('SiteCount', 'Mine sites', ''),
+]
+
+
+def add_population_column(conn):
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(countries)")]
+    if 'Population_Millions' not in columns:
+        conn.execute("ALTER TABLE countries ADD COLUMN Population_Millions REAL")
+
+
+def _ratio(numerator, denominator):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out = numerator / denominator
+    out[~np.isfinite(out)] = np.nan
+    return out
+
+
+def rank_and_percentile(values):
+    """
+    Rank (1 = highest, ties share the best rank) and percentile (share of
+    countries at or below the value) of each entry; NaN where unknown.
+    """
+    known = np.sort(values[~np.isnan(values)])
+    at_or_below = np.searchsorted(known, values, side='right').astype(np.float64)
+    ranks = len(known) - at_or_below + 1
+    percentiles = at_or_below / max(len(known), 1) * 100
+    ranks[np.isnan(values)] = np.nan
+    percentiles[np.isnan(values)] = np.nan
+    return ranks, percentiles
+
+
+def compute_metrics(rows):
+    """Column arrays of the base figures and every derived metric."""
+    data = np.array([[np.nan if v is None else v for v in (r[2], r[3], r[5], r[6], r[7], r[8], r[9])]
+                     for r in rows], dtype=np.float64).reshape(-1, 7)
+    gdp, mining, population, year, production, exports, sites = data.T
+
+    metrics = {
+        'MiningShareOfGDP_Pct': _ratio(mining, gdp) * 100,
+        'ExportIntensity_Pct': _ratio(exports, gdp) * 100,
+        'Production_tonnes': production,
+        'ProductionPerCapita_tonnes': _ratio(production, population * 1e6),
+        'SiteCount': sites,
+    }
+    columns = {
+        'ProductionYear': year,
+        'ExportValue_BillionUSD': exports,
+    }
+    for key, values in metrics.items():
+        ranks, percentiles = rank_and_percentile(values)
+        columns[key] = values
+        columns[f"{key}_Rank"] = ranks
+        columns[f"{key}_Percentile"] = percentiles
+    return columns
+
+
+def _value(key, x):
+    if np.isnan(x):
+        return None
+    return int(x) if key.endswith('_Rank') or key in ('ProductionYear', 'SiteCount') else float(x)
+
+
+def build_comparison(conn, ids):
+    """
+    Returns (all countries, selected countries) as lists of dicts holding
+    the country's columns plus every metric with its rank and percentile.
+    Selected countries follow the order of `ids`.
+    """
+    rows = conn.execute(COMPARE_QUERY).fetchall()
+    columns = compute_metrics(rows)
+
+    countries = []
+    for i, row in enumerate(rows):
+        country = {
+            'CountryID': row[0],
+            'CountryName': row[1],
+            'GDP_BillionUSD': row[2],
+            'MiningRevenue_BillionUSD': row[3],
+            'KeyProjects': row[4],
+            'Population_Millions': row[5],
+        }
+        country.update({key: _value(key, values[i]) for key, values in columns.items()})
+        countries.append(country)
+
+    by_id = {c['CountryID']: c for c in countries}
+    selected = [by_id[i] for i in dict.fromkeys(ids) if i in by_id]
+    return countries, selected
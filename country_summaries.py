@@ -0,0 +1,206 @@
+import json
+import sys
+import time
+
+# -------------------------
+# Country Summaries
+# -------------------------
+# Per-country rollups of sites and production_stats, kept in their own
+# tables so the profile and compare pages read a few pre-joined rows
+# instead of aggregating the large tables on every view:
+#
+#   country_summary          one row per country: site totals, latest year
+#   country_mineral_summary  per (country, mineral): sites and production
+#   country_production_trend per (country, year): production and exports
+#
+# Admin writes refresh only the countries they touched; bulk loads and the
+# command below rebuild everything, a batch of countries per transaction.
+#
+#     python country_summaries.py rebuild
+
+SOURCE_TABLES = ('countries', 'sites', 'production_stats')
+REBUILD_BATCH = 500
+
+COUNTRY_QUERY = "SELECT * FROM countries WHERE CountryID = ?"
+
+COUNTRY_REFRESH_QUERY = """
+    INSERT INTO country_summary
+        (CountryID, SiteCount, SiteProduction_tonnes, MineralCount, FirstYear,
+         LatestYear, LatestProduction_tonnes, LatestExportValue_BillionUSD)
+    SELECT c.CountryID,
+           (SELECT COUNT(*) FROM sites s WHERE s.CountryID = c.CountryID),
+           (SELECT COALESCE(SUM(s.Production_tonnes), 0) FROM sites s WHERE s.CountryID = c.CountryID),
+           (SELECT COUNT(*) FROM country_mineral_summary m WHERE m.CountryID = c.CountryID),
+           (SELECT MIN(t.Year) FROM country_production_trend t WHERE t.CountryID = c.CountryID),
+           latest.Year, latest.Production_tonnes, latest.ExportValue_BillionUSD
+    FROM countries c
+    LEFT JOIN country_production_trend latest ON latest.CountryID = c.CountryID AND latest.Year = (
+        SELECT MAX(t.Year) FROM country_production_trend t WHERE t.CountryID = c.CountryID
+    )
+    WHERE c.CountryID IN (SELECT value FROM json_each(?))
+"""
+
+MINERAL_BREAKDOWN_QUERY = """
+    SELECT m.MineralName, s.*
+    FROM country_mineral_summary s
+    LEFT JOIN minerals m ON m.MineralID = s.MineralID
+    WHERE s.CountryID = ?
+    ORDER BY s.LatestProduction_tonnes DESC, s.SiteCount DESC
+"""
+
+TREND_QUERY = """
+    SELECT Year, Production_tonnes, ExportValue_BillionUSD
+    FROM country_production_trend
+    WHERE CountryID = ?
+    ORDER BY Year
+"""
+
+
+def create_summary_tables(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS country_summary (
+            CountryID INTEGER PRIMARY KEY,
+            SiteCount INTEGER NOT NULL,
+            SiteProduction_tonnes REAL NOT NULL,
+            MineralCount INTEGER NOT NULL,
+            FirstYear INTEGER,
+            LatestYear INTEGER,
+            LatestProduction_tonnes REAL,
+            LatestExportValue_BillionUSD REAL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS country_mineral_summary (
+            CountryID INTEGER NOT NULL,
+            MineralID INTEGER NOT NULL,
+            SiteCount INTEGER NOT NULL,
+            SiteProduction_tonnes REAL NOT NULL,
+            TotalProduction_tonnes REAL,
+            LatestYear INTEGER,
+            LatestProduction_tonnes REAL,
+            LatestExportValue_BillionUSD REAL,
+            PRIMARY KEY (CountryID, MineralID)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS country_production_trend (
+            CountryID INTEGER NOT NULL,
+            Year INTEGER NOT NULL,
+            Production_tonnes REAL NOT NULL,
+            ExportValue_BillionUSD REAL NOT NULL,
+            PRIMARY KEY (CountryID, Year)
+        ) WITHOUT ROWID
+    """)
+
+
+def create_and_build_summaries(conn):
+    create_summary_tables(conn)
+    rebuild_country_summaries(conn, commit=False)
+
+
+def refresh_country_summaries(conn, *country_ids):
+    """
+    Recomputes the summaries of the given countries from sites and
+    production_stats. The caller commits. Unknown or None ids are skipped.
+    """
+    ids = json.dumps(sorted({int(c) for c in country_ids if c not in (None, '')}))
+    for table in ('country_summary', 'country_mineral_summary', 'country_production_trend'):
+        conn.execute(f"DELETE FROM {table} WHERE CountryID IN (SELECT value FROM json_each(?))", (ids,))
+
+    conn.execute("""
+        INSERT INTO country_production_trend (CountryID, Year, Production_tonnes, ExportValue_BillionUSD)
+        SELECT CountryID, Year, SUM(Production_tonnes), SUM(ExportValue_BillionUSD)
+        FROM production_stats
+        WHERE CountryID IN (SELECT value FROM json_each(?))
+        GROUP BY CountryID, Year
+    """, (ids,))
+
+    conn.execute("""
+        INSERT INTO country_mineral_summary
+            (CountryID, MineralID, SiteCount, SiteProduction_tonnes, TotalProduction_tonnes,
+             LatestYear, LatestProduction_tonnes, LatestExportValue_BillionUSD)
+        WITH site_totals AS (
+            SELECT CountryID, MineralID, COUNT(*) AS SiteCount, SUM(Production_tonnes) AS Production
+            FROM sites
+            WHERE CountryID IN (SELECT value FROM json_each(?1)) AND MineralID IS NOT NULL
+            GROUP BY CountryID, MineralID
+        ),
+        yearly AS (
+            SELECT CountryID, MineralID, Year,
+                   SUM(Production_tonnes) AS Production, SUM(ExportValue_BillionUSD) AS ExportValue
+            FROM production_stats
+            WHERE CountryID IN (SELECT value FROM json_each(?1)) AND MineralID IS NOT NULL
+            GROUP BY CountryID, MineralID, Year
+        ),
+        production_totals AS (
+            SELECT CountryID, MineralID, SUM(Production) AS Production, MAX(Year) AS LatestYear
+            FROM yearly
+            GROUP BY CountryID, MineralID
+        ),
+        pairs AS (
+            SELECT CountryID, MineralID FROM site_totals
+            UNION
+            SELECT CountryID, MineralID FROM production_totals
+        )
+        SELECT k.CountryID, k.MineralID, COALESCE(s.SiteCount, 0), COALESCE(s.Production, 0),
+               t.Production, t.LatestYear, y.Production, y.ExportValue
+        FROM pairs k
+        LEFT JOIN site_totals s ON s.CountryID = k.CountryID AND s.MineralID = k.MineralID
+        LEFT JOIN production_totals t ON t.CountryID = k.CountryID AND t.MineralID = k.MineralID
+        LEFT JOIN yearly y ON y.CountryID = k.CountryID AND y.MineralID = k.MineralID AND y.Year = t.LatestYear
+    """, (ids,))
+
+    conn.execute(COUNTRY_REFRESH_QUERY, (ids,))
+
+
+def rebuild_country_summaries(conn, batch_size=REBUILD_BATCH, commit=True, progress=None):
+    """
+    Rebuilds every country's summaries. With commit=True each batch is its
+    own transaction, so readers keep seeing complete rows for every country
+    while a long rebuild runs.
+    """
+    ids = [row[0] for row in conn.execute("""
+        SELECT CountryID FROM countries
+        UNION SELECT CountryID FROM sites WHERE CountryID IS NOT NULL
+        UNION SELECT CountryID FROM production_stats WHERE CountryID IS NOT NULL
+    """)]
+    for start in range(0, len(ids), batch_size):
+        refresh_country_summaries(conn, *ids[start:start + batch_size])
+        if commit:
+            conn.commit()
+        if progress:
+            progress(f"  {min(start + batch_size, len(ids)):,} of {len(ids):,} countries")
+
+    # Drop rows of countries that no longer appear anywhere
+    known = json.dumps(ids)
+    for table in ('country_summary', 'country_mineral_summary', 'country_production_trend'):
+        conn.execute(f"DELETE FROM {table} WHERE CountryID NOT IN (SELECT value FROM json_each(?))", (known,))
+    if commit:
+        conn.commit()
+    return len(ids)
+
+
+def load_country_summary(conn, country_id):
+    """
+    The profile summary of one country: its totals row (or None), its
+    per-mineral breakdown, and its production trend, oldest year first.
+    """
+    summary = conn.execute("SELECT * FROM country_summary WHERE CountryID = ?", (country_id,)).fetchone()
+    minerals = conn.execute(MINERAL_BREAKDOWN_QUERY, (country_id,)).fetchall()
+    trend = conn.execute(TREND_QUERY, (country_id,)).fetchall()
+    return summary, minerals, trend
+
+
+if __name__ == '__main__':
+    from db import connect
+    from migrations import run_migrations
+
+    if sys.argv[1:] != ['rebuild']:
+        sys.exit("usage: python country_summaries.py rebuild")
+
+    conn = connect()
+    run_migrations(conn)
+    started = time.perf_counter()
+    count = rebuild_country_summaries(conn, progress=print)
+    conn.close()
+    print(f"Rebuilt summaries for {count:,} countries in {time.perf_counter() - started:.1f}s.")
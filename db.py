@@ -0,0 +1,172 @@
+import os
+import queue
+import sqlite3
+import time
+
+from flask import g, has_app_context
+
+# -------------------------
+# Database Settings
+# -------------------------
+# All overridable from the environment; the defaults suit a single-box
+# deployment with a read-heavy workload.
+
+DB_PATH = os.environ.get("MINERALS_DB_PATH", os.path.join("Data", "userdata.db"))
+DB_POOL_SIZE = int(os.environ.get("SQLITE_POOL_SIZE", 8))
+DB_TIMEOUT = float(os.environ.get("SQLITE_TIMEOUT", 10))
+DB_STATEMENT_CACHE = int(os.environ.get("SQLITE_STATEMENT_CACHE", 256))
+DB_SYNCHRONOUS = os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL")
+DB_CACHE_SIZE = int(os.environ.get("SQLITE_CACHE_SIZE", -20000))         # negative = KiB
+DB_MMAP_SIZE = int(os.environ.get("SQLITE_MMAP_SIZE", 256 * 1024 * 1024))
+
+SYNCHRONOUS_MODES = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+
+
+# -------------------------
+# Query Timing
+# -------------------------
+# When an observer is set (see instrumentation.py), statements run through
+# conn.execute() and the fetches on their cursors are timed and reported as
+# observer(seconds, statements). Rows read by iterating a cursor directly
+# are not timed. With no observer the plain sqlite3 methods are used.
+
+_query_observer = None
+
+
+def set_query_observer(observer):
+    global _query_observer
+    _query_observer = observer
+
+
+class TimedCursor(sqlite3.Cursor):
+    def _timed(self, method, statements, *args):
+        started = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            if _query_observer is not None:
+                _query_observer(time.perf_counter() - started, statements)
+
+    def execute(self, *args):
+        return self._timed(super().execute, 1, *args)
+
+    def executemany(self, *args):
+        return self._timed(super().executemany, 1, *args)
+
+    def fetchone(self):
+        return self._timed(super().fetchone, 0)
+
+    def fetchmany(self, *args):
+        return self._timed(super().fetchmany, 0, *args)
+
+    def fetchall(self):
+        return self._timed(super().fetchall, 0)
+
+
+class PooledConnection(sqlite3.Connection):
+    """
+    Connection whose close() hands it back to the pool when it was checked
+    out for a request, so existing `conn.close()` calls in routes stay valid.
+    """
+    pooled = False
+
+    def cursor(self, factory=None):
+        if factory is None:
+            factory = sqlite3.Cursor if _query_observer is None else TimedCursor
+        return super().cursor(factory)
+
+    def execute(self, *args):
+        if _query_observer is None:
+            return super().execute(*args)
+        return self.cursor().execute(*args)
+
+    def executemany(self, *args):
+        if _query_observer is None:
+            return super().executemany(*args)
+        return self.cursor().executemany(*args)
+
+    def close(self):
+        if not self.pooled:
+            super().close()
+
+    def discard(self):
+        super().close()
+
+
+def connect():
+    """Opens a new connection with WAL and the configured pragmas applied."""
+    conn = sqlite3.connect(
+        DB_PATH,
+        timeout=DB_TIMEOUT,
+        factory=PooledConnection,
+        cached_statements=DB_STATEMENT_CACHE,
+        check_same_thread=False
+    )
+    conn.row_factory = sqlite3.Row
+
+    synchronous = DB_SYNCHRONOUS.upper()
+    if synchronous not in SYNCHRONOUS_MODES:
+        raise ValueError(f"SQLITE_SYNCHRONOUS must be one of {', '.join(SYNCHRONOUS_MODES)}")
+
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute(f"PRAGMA synchronous = {synchronous}")
+    conn.execute(f"PRAGMA cache_size = {int(DB_CACHE_SIZE)}")
+    conn.execute(f"PRAGMA mmap_size = {int(DB_MMAP_SIZE)}")
+    conn.execute(f"PRAGMA busy_timeout = {int(DB_TIMEOUT * 1000)}")
+    return conn
+
+
+# -------------------------
+# Connection Pool
+# -------------------------
+
+_pool = queue.LifoQueue(maxsize=DB_POOL_SIZE)
+
+
+def _checkout():
+    try:
+        conn = _pool.get_nowait()
+    except queue.Empty:
+        conn = connect()
+    conn.pooled = True
+    return conn
+
+
+def _release(conn):
+    # Never hand on a connection with a half-finished transaction
+    if conn.in_transaction:
+        conn.rollback()
+    conn.row_factory = sqlite3.Row
+    try:
+        _pool.put_nowait(conn)
+    except queue.Full:
+        conn.discard()
+
+
+def get_db_connection():
+    """
+    Returns the current request's connection, checking one out of the pool
+    on first use. Outside a request a standalone connection is returned and
+    the caller must close it.
+    """
+    if not has_app_context():
+        return connect()
+    if 'db' not in g:
+        g.db = _checkout()
+    return g.db
+
+
+def close_db(exc=None):
+    """Teardown hook: returns the request's connection to the pool."""
+    conn = g.pop('db', None)
+    if conn is not None:
+        _release(conn)
+
+
+def close_pool():
+    """Closes every idle pooled connection, e.g. before a worker exits."""
+    while True:
+        try:
+            _pool.get_nowait().discard()
+        except queue.Empty:
+            return
@@ -0,0 +1,286 @@
+import csv
+import io
+import json
+import zlib
+
+from flask import Response
+
+from db import connect
+
+# -------------------------
+# Streaming Exports
+# -------------------------
+# Selections are filtered in SQL and rows are serialized batch by batch as
+# the client reads the response, so an export never holds more than one
+# batch in memory. Exports open their own connection because the body is
+# generated after the request's pooled connection has been handed back.
+
+EXPORT_BATCH_ROWS = 5000
+COLUMNAR_BATCH_ROWS = 65536   # one Parquet row group / Arrow message each
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet',
+    'arrow': 'application/vnd.apache.arrow.stream',
+}
+
+# Binary formats that are already compressed internally and need pyarrow
+COLUMNAR_FORMATS = ('parquet', 'arrow')
+
+
+class ExportSpec:
+    """Which columns of a table to export and which form fields filter it."""
+
+    def __init__(self, table, columns, filters):
+        self.table = table
+        self.columns = columns
+        self.key = columns[0]
+        self.filters = filters  # form field -> column
+
+
+EXPORTS = {
+    'countries': ExportSpec(
+        'countries',
+        ['CountryID', 'CountryName', 'GDP_BillionUSD', 'MiningRevenue_BillionUSD', 'KeyProjects'],
+        {'country_id': 'CountryID'}
+    ),
+    'minerals': ExportSpec(
+        'minerals',
+        ['MineralID', 'MineralName', 'Description', 'MarketPriceUSD_per_tonne'],
+        {'mineral_id': 'MineralID'}
+    ),
+    'sites': ExportSpec(
+        'sites',
+        ['SiteID', 'SiteName', 'CountryID', 'MineralID', 'Latitude', 'Longitude', 'Production_tonnes'],
+        {'site_id': 'SiteID', 'country_id': 'CountryID', 'mineral_id': 'MineralID'}
+    ),
+    'production_stats': ExportSpec(
+        'production_stats',
+        ['StatID', 'Year', 'CountryID', 'MineralID', 'Production_tonnes', 'ExportValue_BillionUSD'],
+        {'stat_id': 'StatID', 'country_id': 'CountryID', 'mineral_id': 'MineralID', 'year': 'Year'}
+    ),
+}
+
+
+def selected_filters(spec, form):
+    """Collects {column: [ids]} from the form fields the spec filters on."""
+    filters = {}
+    for field, column in spec.filters.items():
+        values = []
+        for value in form.getlist(field):
+            try:
+                values.append(int(value))
+            except ValueError:
+                continue
+        if values:
+            filters[column] = values
+    return filters
+
+
+def export_query(spec, filters):
+    # json_each keeps the IN list to one bound parameter however many ids
+    # were selected, so large selections never hit SQLite's variable limit
+    sql = f"SELECT {', '.join(spec.columns)} FROM {spec.table}"
+    clauses, params = [], []
+    for column, values in filters.items():
+        clauses.append(f"{column} IN (SELECT value FROM json_each(?))")
+        params.append(json.dumps(values))
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    return sql + f" ORDER BY {spec.key}", params
+
+
+def iter_batches(sql, params, batch_size=EXPORT_BATCH_ROWS, conn=None, on_batch=None):
+    conn = conn or connect()
+    try:
+        cursor = conn.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            if on_batch:
+                on_batch(len(rows))
+            yield rows
+    finally:
+        conn.close()
+
+
+def iter_csv(columns, batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(columns)
+    for rows in batches:
+        writer.writerows(tuple(row) for row in rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def iter_json(columns, batches):
+    yield '['
+    first = True
+    for rows in batches:
+        parts = []
+        for row in rows:
+            parts.append(('\n  ' if first else ',\n  ') + json.dumps(dict(zip(columns, row))))
+            first = False
+        yield ''.join(parts)
+    yield '\n]\n' if not first else ']\n'
+
+
+def iter_ndjson(columns, batches):
+    for rows in batches:
+        yield ''.join(json.dumps(dict(zip(columns, row))) + '\n' for row in rows)
+
+
+# -------------------------
+# Columnar Exports (Parquet / Arrow IPC)
+# -------------------------
+# Cursor batches are turned straight into Arrow record batches, typed from
+# the table's declared column types, without going through pandas. pyarrow
+# is optional and only imported when one of these formats is requested.
+
+def columnar_available():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def arrow_schema(conn, spec):
+    import pyarrow as pa
+
+    declared = {r[1]: (r[2] or '').upper() for r in conn.execute(f"PRAGMA table_info({spec.table})")}
+    fields = []
+    for column in spec.columns:
+        col_type = declared.get(column, '')
+        if 'INT' in col_type:
+            arrow_type = pa.int64()
+        elif any(t in col_type for t in ('REAL', 'FLOA', 'DOUB', 'NUM')):
+            arrow_type = pa.float64()
+        else:
+            arrow_type = pa.string()
+        fields.append(pa.field(column, arrow_type))
+    return pa.schema(fields)
+
+
+def iter_record_batches(schema, batches):
+    import pyarrow as pa
+
+    for rows in batches:
+        columns = list(zip(*rows))
+        yield pa.RecordBatch.from_arrays(
+            [pa.array(values, type=field.type) for values, field in zip(columns, schema)],
+            schema=schema
+        )
+
+
+class _ChunkSink:
+    """Write-only file object that hands written bytes back to a generator."""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def iter_columnar(export_format, spec, sql, params, on_batch=None):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    conn = connect()
+    try:
+        schema = arrow_schema(conn, spec)
+        sink = _ChunkSink()
+        if export_format == 'parquet':
+            writer = pq.ParquetWriter(sink, schema, compression='zstd')
+        else:
+            writer = pa.ipc.new_stream(sink, schema, options=pa.ipc.IpcWriteOptions(compression='zstd'))
+
+        # Each cursor batch becomes one row group / IPC message, sent as soon as it's written
+        for batch in iter_record_batches(schema, iter_batches(sql, params, COLUMNAR_BATCH_ROWS, conn=conn, on_batch=on_batch)):
+            writer.write_batch(batch)
+            data = sink.drain()
+            if data:
+                yield data
+        writer.close()
+        yield sink.drain()
+    finally:
+        conn.close()
+
+
+SERIALIZERS = {
+    'csv': iter_csv,
+    'json': iter_json,
+    'ndjson': iter_ndjson,
+}
+
+
+def gzip_chunks(chunks, level=6):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # 31 = gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def accepts_gzip(request):
+    # Honours q-values, so "gzip;q=0" opts out
+    return request.accept_encodings['gzip'] > 0
+
+
+def export_chunks(name, filters, export_format, gzip=False, on_batch=None):
+    """
+    Yields the encoded export, chunk by chunk. `on_batch(n)` is called as
+    each batch of n rows is read, e.g. to report progress.
+    """
+    spec = EXPORTS[name]
+    sql, params = export_query(spec, filters)
+    if export_format in COLUMNAR_FORMATS:
+        return iter_columnar(export_format, spec, sql, params, on_batch=on_batch)
+    chunks = SERIALIZERS[export_format](spec.columns, iter_batches(sql, params, on_batch=on_batch))
+    return gzip_chunks(chunks) if gzip else chunks
+
+
+def count_export_rows(conn, name, filters):
+    sql, params = export_query(EXPORTS[name], filters)
+    return conn.execute(f"SELECT COUNT(*) FROM ({sql})", params).fetchone()[0]
+
+
+def export_response(name, filters, export_format, filename, gzip=False):
+    """Builds a streamed download of export `name` in the given format."""
+    gzip = gzip and export_format not in COLUMNAR_FORMATS
+    chunks = export_chunks(name, filters, export_format, gzip=gzip)
+
+    response = Response(chunks, mimetype=EXPORT_FORMATS[export_format])
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    if gzip:
+        response.headers['Content-Encoding'] = 'gzip'
+        response.headers['Vary'] = 'Accept-Encoding'
+    return response
@@ -0,0 +1,59 @@
+import multiprocessing
+import os
+
+# -------------------------
+# Gunicorn Settings
+# -------------------------
+# All overridable from the environment. Defaults use every core: one
+# worker process per CPU, each serving requests on a few threads (SQLite
+# and the chart/map renderers release the GIL for much of their work).
+#
+#     gunicorn -c gunicorn.conf.py
+#
+# Reload without dropping requests:
+#   kill -HUP <master pid>   restart workers with the current code and settings
+#   kill -USR2 <master pid>  start a new master (picks up new code), then
+#   kill -TERM <old master>  once the new one is serving
+
+wsgi_app = "wsgi:application"
+bind = os.environ.get("BIND", "0.0.0.0:8000")
+
+workers = int(os.environ.get("WEB_WORKERS", multiprocessing.cpu_count()))
+threads = int(os.environ.get("WEB_THREADS", 4))
+worker_class = "gthread"
+
+# Import the app once in the master, then fork (see wsgi.py)
+preload_app = True
+
+timeout = int(os.environ.get("WEB_TIMEOUT", 60))
+graceful_timeout = int(os.environ.get("WEB_GRACEFUL_TIMEOUT", 30))
+keepalive = int(os.environ.get("WEB_KEEPALIVE", 5))
+
+# Recycle workers now and then so slow leaks cannot build up; the jitter
+# keeps them from all restarting at once
+max_requests = int(os.environ.get("WEB_MAX_REQUESTS", 0))
+max_requests_jitter = max_requests // 10
+
+accesslog = os.environ.get("WEB_ACCESS_LOG", "-")
+errorlog = "-"
+loglevel = os.environ.get("WEB_LOG_LEVEL", "info")
+
+
+def on_starting(server):
+    # Worker metric snapshots from a previous run would be summed into this one
+    metrics_dir = os.environ.get("METRICS_DIR")
+    if metrics_dir and os.path.isdir(metrics_dir):
+        for name in os.listdir(metrics_dir):
+            if name.endswith('.json'):
+                os.remove(os.path.join(metrics_dir, name))
+
+
+def post_fork(server, worker):
+    # Fresh DB pool and job workers in each worker, never the master's
+    from app import init_worker
+    init_worker()
+
+
+def worker_exit(server, worker):
+    from app import shutdown_worker
+    shutdown_worker()
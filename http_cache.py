@@ -0,0 +1,172 @@
+import glob
+import gzip
+import hashlib
+import os
+from functools import wraps
+from urllib.parse import urlencode
+
+from flask import make_response, request, session
+
+from cache import LRUCache, get_data_version
+from db import get_db_connection
+
+# -------------------------
+# HTTP Page Caching
+# -------------------------
+# Read-only pages are identified by their URL and the data versions of the
+# tables they read (see cache.py). That pair becomes the page's ETag, so a
+# browser revalidating with If-None-Match gets a 304 after a single
+# data_versions lookup, before the view runs any other query or renders
+# anything. Pages that do have to be sent are rendered once per version
+# and kept in the page cache already compressed, per encoding.
+#
+# Charts on these pages are separate URLs that carry their own spec and
+# are cached by the browser for a year (see serve_chart), so a 304 or
+# cached page still shows them, whichever worker serves the image.
+
+PAGE_CACHE_ENTRIES = int(os.environ.get("PAGE_CACHE_ENTRIES", 256))
+PAGE_CACHE_BYTES = int(os.environ.get("PAGE_CACHE_BYTES", 32 * 1024 * 1024))
+PAGE_CACHE_DIR = os.environ.get("PAGE_CACHE_DIR") or None
+# 0 makes browsers revalidate on every load; higher values let them reuse
+# a page without asking for that many seconds, at the cost of staleness
+PAGE_MAX_AGE = int(os.environ.get("PAGE_MAX_AGE", 0))
+COMPRESS_MIN_BYTES = int(os.environ.get("COMPRESS_MIN_BYTES", 1024))
+GZIP_LEVEL = int(os.environ.get("GZIP_LEVEL", 9))
+BROTLI_QUALITY = int(os.environ.get("BROTLI_QUALITY", 9))
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _build_id():
+    """
+    Identifies the deployed code and templates, so a deploy changes every
+    ETag. Taken from file sizes and times, which all workers agree on.
+    Set APP_BUILD_ID (e.g. to the git commit) to override.
+    """
+    if os.environ.get("APP_BUILD_ID"):
+        return os.environ["APP_BUILD_ID"]
+    digest = hashlib.sha1()
+    paths = glob.glob(os.path.join(APP_DIR, '*.py')) + glob.glob(os.path.join(APP_DIR, 'Templates', '*'))
+    for path in sorted(paths):
+        stat = os.stat(path)
+        digest.update(f"{os.path.basename(path)}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+    return digest.hexdigest()[:12]
+
+
+BUILD_ID = _build_id()
+
+page_cache = LRUCache(max_entries=PAGE_CACHE_ENTRIES, max_bytes=PAGE_CACHE_BYTES, disk_dir=PAGE_CACHE_DIR)
+
+
+# -------------------------
+# Compression
+# -------------------------
+# brotli is optional; without it clients get gzip.
+
+def _brotli():
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+def choose_encoding(request):
+    """The best encoding the client accepts: 'br', 'gzip' or 'identity'."""
+    accepted = request.accept_encodings
+    if accepted['br'] and _brotli() is not None:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return 'identity'
+
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return _brotli().compress(body, quality=BROTLI_QUALITY)
+    if encoding == 'gzip':
+        # mtime=0 so the same page always compresses to the same bytes
+        return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+    return body
+
+
+# -------------------------
+# Cached Page Decorator
+# -------------------------
+
+def version_token(versions):
+    """Data versions as a URL-safe string, for ?v= in versioned URLs."""
+    return '.'.join(str(v) for v in versions)
+
+
+def page_etag(versions):
+    # Argument order is kept: some pages list their selections in order
+    query = urlencode(list(request.args.items(multi=True)))
+    key = f"{BUILD_ID}|{request.path}?{query}|{versions}"
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def _set_cache_headers(response, etag, immutable=False):
+    response.set_etag(etag, weak=True)
+    response.cache_control.private = True
+    if immutable:
+        response.cache_control.max_age = 31536000
+        response.cache_control.immutable = True
+    elif PAGE_MAX_AGE:
+        response.cache_control.max_age = PAGE_MAX_AGE
+    else:
+        response.cache_control.no_cache = True
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def cached_page(*tables, mimetype='text/html', cache=page_cache):
+    """
+    Serves a GET view through `cache`, keyed by URL and the data versions
+    of `tables`. Only 200 responses are cached; anything else the view
+    returns (error pages, redirects) passes straight through, as do
+    requests with flashed messages waiting to be shown. Streamed responses
+    are not cached but still get an ETag, so they can be revalidated.
+
+    A URL whose ?v= matches the current version_token() can never change,
+    so it may be kept by the browser for a year.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            if request.method != 'GET' or '_flashes' in session:
+                return view(*args, **kwargs)
+
+            conn = get_db_connection()
+            versions = get_data_version(conn, *tables)
+            conn.close()
+            etag = page_etag(versions)
+            immutable = request.args.get('v') == version_token(versions)
+
+            if request.if_none_match.contains_weak(etag):
+                return _set_cache_headers(make_response('', 304), etag, immutable)
+
+            encoding = choose_encoding(request)
+            body = cache.get(f"{etag}:{encoding}")
+            if body is None:
+                page = cache.get(f"{etag}:identity")
+                if page is None:
+                    response = make_response(view(*args, **kwargs))
+                    if response.status_code != 200:
+                        return response
+                    if response.is_streamed:
+                        return _set_cache_headers(response, etag, immutable)
+                    page = response.get_data()
+                    cache.set(f"{etag}:identity", page)
+                if len(page) < COMPRESS_MIN_BYTES:
+                    encoding = 'identity'
+                body = compress(page, encoding)
+                cache.set(f"{etag}:{encoding}", body)
+
+            response = make_response(body)
+            response.mimetype = mimetype
+            if encoding != 'identity':
+                response.headers['Content-Encoding'] = encoding
+            return _set_cache_headers(response, etag, immutable)
+        return wrapped
+    return decorator
@@ -0,0 +1,49 @@
+# -------------------------
+# Researcher Insights Feed
+# -------------------------
+# Insights are listed newest first and paged by InsightID: each page asks
+# for the insights older than the last one shown (?before=<InsightID>), so
+# loading the next page reads about one page of rows however long the feed
+# is. Filtering by mineral walks idx_mineral_insights_mineral the same way.
+
+FEED_PAGE_SIZE = 25
+MAX_FEED_PAGE_SIZE = 100
+
+INSIGHT_COLUMNS = """
+    SELECT i.InsightID, i.MineralID, i.Insight, m.MineralName
+    FROM mineral_insights i
+    JOIN minerals m ON i.MineralID = m.MineralID
+"""
+
+
+def feed_query(mineral_id=None, before=None, limit=FEED_PAGE_SIZE):
+    """The SQL and parameters for one page of the feed, plus one extra row."""
+    clauses, params = [], []
+    if mineral_id is not None:
+        clauses.append("i.MineralID = ?")
+        params.append(mineral_id)
+    if before is not None:
+        clauses.append("i.InsightID < ?")
+        params.append(before)
+
+    sql = INSIGHT_COLUMNS
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += " ORDER BY i.InsightID DESC LIMIT ?"
+    params.append(limit + 1)
+    return sql, params
+
+
+def fetch_insights(conn, mineral_id=None, before=None, limit=FEED_PAGE_SIZE):
+    """
+    One page of the feed. Returns (rows, next_before); next_before is the
+    cursor for the following page, or None on the last page.
+    """
+    limit = max(1, min(limit, MAX_FEED_PAGE_SIZE))
+    rows = conn.execute(*feed_query(mineral_id, before, limit)).fetchall()
+    next_before = rows[limit - 1]['InsightID'] if len(rows) > limit else None
+    return rows[:limit], next_before
+
+
+def fetch_insight(conn, insight_id):
+    return conn.execute(INSIGHT_COLUMNS + " WHERE i.InsightID = ?", (insight_id,)).fetchone()
@@ -0,0 +1,336 @@
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from flask import before_render_template, g, has_request_context, request, template_rendered
+
+from db import set_query_observer
+
+# -------------------------
+# Request Instrumentation
+# -------------------------
+# Times every request and the phases inside it:
+#
+#   db        statements and fetches on the request's connections (db.py)
+#   template  Jinja rendering
+#   chart     matplotlib chart rendering (charts.py)
+#   map       Folium map page building
+#
+# Results go out three ways: a Server-Timing header on each response (shown
+# by browser dev tools), Prometheus histograms at /metrics, and, when the
+# sampling profiler is on, collapsed stack files for slow requests that
+# flamegraph.pl or speedscope read directly.
+#
+# Metrics are kept per process. With several workers, set METRICS_DIR to a
+# directory they share: each worker saves a snapshot there every few
+# seconds and /metrics adds them all up.
+
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") == "1"
+METRICS_DIR = os.environ.get("METRICS_DIR") or None
+METRICS_SNAPSHOT_SECONDS = float(os.environ.get("METRICS_SNAPSHOT_SECONDS", 5))
+
+PROFILE_REQUESTS = os.environ.get("PROFILE_REQUESTS", "0") == "1"
+PROFILE_THRESHOLD_MS = float(os.environ.get("PROFILE_THRESHOLD_MS", 500))
+PROFILE_INTERVAL_MS = float(os.environ.get("PROFILE_INTERVAL_MS", 5))
+PROFILE_DIR = os.environ.get("PROFILE_DIR", os.path.join("Data", "profiles"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+PHASES = ('db', 'template', 'chart', 'map')
+
+
+# -------------------------
+# Histograms
+# -------------------------
+
+class Histogram:
+    """A Prometheus histogram keyed by label values."""
+
+    def __init__(self, name, help_text, labelnames, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._series = {}   # label values -> [per-bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            else:
+                series[len(self.buckets)] += 1
+            series[-1] += value
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(labels), list(series)] for labels, series in self._series.items()]
+
+
+class Metrics:
+    def __init__(self):
+        self.request_seconds = Histogram(
+            'app_request_duration_seconds', 'Request latency by route.',
+            ('endpoint', 'method', 'status'), LATENCY_BUCKETS)
+        self.phase_seconds = Histogram(
+            'app_request_phase_seconds', 'Time spent in each phase of a request, by route.',
+            ('endpoint', 'phase'), LATENCY_BUCKETS)
+        self.db_queries = Histogram(
+            'app_db_queries_per_request', 'SQL statements run per request, by route.',
+            ('endpoint',), QUERY_COUNT_BUCKETS)
+        self.histograms = (self.request_seconds, self.phase_seconds, self.db_queries)
+        self._last_saved = 0.0
+
+    def snapshot(self):
+        return {h.name: h.snapshot() for h in self.histograms}
+
+    def save_snapshot(self, force=False):
+        """Writes this process's metrics to METRICS_DIR, at most every few seconds."""
+        now = time.monotonic()
+        if not METRICS_DIR or (not force and now - self._last_saved < METRICS_SNAPSHOT_SECONDS):
+            return
+        self._last_saved = now
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=METRICS_DIR, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp, os.path.join(METRICS_DIR, f"{os.getpid()}.json"))
+
+    def collect(self):
+        """This process's snapshot merged with every other worker's saved one."""
+        snapshots = [self.snapshot()]
+        if METRICS_DIR and os.path.isdir(METRICS_DIR):
+            own = f"{os.getpid()}.json"
+            for name in os.listdir(METRICS_DIR):
+                if name.endswith('.json') and name != own:
+                    try:
+                        with open(os.path.join(METRICS_DIR, name)) as f:
+                            snapshots.append(json.load(f))
+                    except (OSError, ValueError):
+                        continue   # being replaced right now
+
+        merged = {h.name: {} for h in self.histograms}
+        for snapshot in snapshots:
+            for name, series_list in snapshot.items():
+                for labels, series in series_list:
+                    total = merged.setdefault(name, {}).get(tuple(labels))
+                    if total is None:
+                        merged[name][tuple(labels)] = list(series)
+                    else:
+                        for i, value in enumerate(series):
+                            total[i] += value
+        return merged
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)."""
+        merged = self.collect()
+        lines = []
+        for h in self.histograms:
+            lines.append(f"# HELP {h.name} {h.help_text}")
+            lines.append(f"# TYPE {h.name} histogram")
+            for labels, series in sorted(merged.get(h.name, {}).items()):
+                label_text = ','.join(f'{k}="{_escape(v)}"' for k, v in zip(h.labelnames, labels))
+                cumulative = 0
+                for bound, count in zip(h.buckets, series):
+                    cumulative += count
+                    lines.append(f'{h.name}_bucket{{{label_text},le="{bound}"}} {cumulative}')
+                count = cumulative + series[len(h.buckets)]
+                lines.append(f'{h.name}_bucket{{{label_text},le="+Inf"}} {count}')
+                lines.append(f'{h.name}_sum{{{label_text}}} {series[-1]:.6f}')
+                lines.append(f'{h.name}_count{{{label_text}}} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+metrics = Metrics()
+
+
+# -------------------------
+# Sampling Profiler
+# -------------------------
+# A single background thread samples the stacks of the threads currently
+# serving requests every PROFILE_INTERVAL_MS. Requests that take longer than
+# the threshold have their samples written to PROFILE_DIR as collapsed
+# stacks ("outer;inner;leaf count" per line). Off by default; turn it on
+# with PROFILE_REQUESTS=1 or from /admin/profiling.
+
+class SamplingProfiler:
+    def __init__(self, enabled=PROFILE_REQUESTS, threshold_ms=PROFILE_THRESHOLD_MS,
+                 interval_ms=PROFILE_INTERVAL_MS, out_dir=PROFILE_DIR):
+        self.enabled = enabled
+        self.threshold_ms = threshold_ms
+        self.interval_ms = interval_ms
+        self.out_dir = out_dir
+        self._active = {}   # thread id -> Counter of collapsed stacks
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def _ensure_thread(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._sample_loop, name="profiler", daemon=True)
+                self._thread.start()
+
+    def _sample_loop(self):
+        while self.enabled:
+            frames = sys._current_frames()
+            with self._lock:
+                for thread_id, samples in self._active.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        samples[_collapse(frame)] += 1
+            time.sleep(self.interval_ms / 1000)
+        self._pid = None
+
+    def begin(self):
+        if not self.enabled:
+            return
+        self._ensure_thread()
+        with self._lock:
+            self._active[threading.get_ident()] = Counter()
+
+    def end(self, label, elapsed):
+        """Stops sampling this thread; returns the dump's path if one was written."""
+        with self._lock:
+            samples = self._active.pop(threading.get_ident(), None)
+        if not samples or elapsed * 1000 < self.threshold_ms:
+            return None
+        os.makedirs(self.out_dir, exist_ok=True)
+        safe_label = ''.join(c if c.isalnum() else '_' for c in label).strip('_') or 'request'
+        path = os.path.join(self.out_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{int(elapsed * 1000)}ms-"
+                                          f"{safe_label}-{os.getpid()}.folded")
+        with open(path, 'w') as f:
+            for stack, count in samples.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
+
+    def configure(self, enabled=None, threshold_ms=None):
+        if threshold_ms is not None:
+            self.threshold_ms = float(threshold_ms)
+        if enabled is not None:
+            self.enabled = bool(enabled)
+
+    def dumps(self, limit=50):
+        if not os.path.isdir(self.out_dir):
+            return []
+        names = sorted((n for n in os.listdir(self.out_dir) if n.endswith('.folded')), reverse=True)
+        return names[:limit]
+
+
+def _collapse(frame):
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ';'.join(reversed(stack))
+
+
+profiler = SamplingProfiler()
+
+
+# -------------------------
+# Request Hooks
+# -------------------------
+
+class RequestStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_queries = 0
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self._template_started = []
+
+
+def _stats():
+    return g.get('_request_stats') if has_request_context() else None
+
+
+def _record_query(seconds, statements):
+    stats = _stats()
+    if stats is not None:
+        stats.phases['db'] += seconds
+        stats.db_queries += statements
+
+
+@contextmanager
+def timed(phase):
+    """Adds the time spent in the block to the current request's `phase`."""
+    stats = _stats()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if stats is not None:
+            stats.phases[phase] = stats.phases.get(phase, 0.0) + time.perf_counter() - started
+
+
+def _before_render(sender, template, context, **extra):
+    stats = _stats()
+    if stats is not None:
+        stats._template_started.append(time.perf_counter())
+
+
+def _after_render(sender, template, context, **extra):
+    stats = _stats()
+    if stats is not None and stats._template_started:
+        stats.phases['template'] += time.perf_counter() - stats._template_started.pop()
+
+
+def _endpoint():
+    # The route pattern, not the URL, so ids do not blow up label counts
+    return request.url_rule.rule if request.url_rule else 'unmatched'
+
+
+def _begin_request():
+    g._request_stats = RequestStats()
+    profiler.begin()
+
+
+def _end_request(response):
+    stats = _stats()
+    if stats is None:
+        return response
+    elapsed = time.perf_counter() - stats.started
+    endpoint = _endpoint()
+
+    metrics.request_seconds.observe((endpoint, request.method, str(response.status_code)), elapsed)
+    for phase, seconds in stats.phases.items():
+        if seconds:
+            metrics.phase_seconds.observe((endpoint, phase), seconds)
+    metrics.db_queries.observe((endpoint,), stats.db_queries)
+    metrics.save_snapshot()
+
+    timings = [f'{phase};dur={seconds * 1000:.1f}' for phase, seconds in stats.phases.items() if seconds]
+    timings.append(f'total;dur={elapsed * 1000:.1f};desc="{stats.db_queries} queries"')
+    response.headers['Server-Timing'] = ', '.join(timings)
+
+    profiler.end(f"{request.method} {endpoint}", elapsed)
+    return response
+
+
+def init_instrumentation(app):
+    """Installs the request hooks on `app`; does nothing when METRICS_ENABLED=0."""
+    if not METRICS_ENABLED:
+        return
+    set_query_observer(_record_query)
+    app.before_request(_begin_request)
+    app.after_request(_end_request)
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_after_render, app)
@@ -0,0 +1,510 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from db import connect
+
+# -------------------------
+# Background Jobs
+# -------------------------
+# Long operations (large exports, data reloads, summary rebuilds) are queued
+# as rows in the jobs table and run on a small thread pool, so the request
+# that starts one returns a job ID straight away. Every state change goes
+# through the database:
+#
+#   queued -> running -> succeeded | failed | cancelled
+#
+# Workers claim queued jobs with a single UPDATE, so any number of worker
+# processes can share the table. Every worker process also touches a file
+# of its own under JOB_RESULTS_DIR/workers on each poll. If the process
+# running a job dies, that file goes stale and the job is put back in the
+# queue (up to JOB_MAX_ATTEMPTS), so jobs survive restarts.
+#
+# Liveness lives in files rather than in the jobs table because a job may
+# hold the database's write lock for a long time (a reload's batch, with
+# the search and spatial index triggers behind it). Rows in the table
+# cannot be updated meanwhile, but the file keeps being touched, so a busy
+# job is never mistaken for a dead one and run twice.
+#
+# A job does its work on its own connection and commits when its work says
+# so. Progress goes through a second connection, so it never commits a
+# job's half-done transaction. While the job holds the write lock, progress
+# updates are skipped, not waited for; cancellation is read, which WAL
+# never blocks.
+
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 2))
+JOB_RESULTS_DIR = os.environ.get("JOB_RESULTS_DIR", os.path.join("Data", "jobs"))
+JOB_POLL_SECONDS = float(os.environ.get("JOB_POLL_SECONDS", 1.0))
+JOB_STALE_SECONDS = float(os.environ.get("JOB_STALE_SECONDS", 60))
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", 3))
+JOB_RETENTION_HOURS = float(os.environ.get("JOB_RETENTION_HOURS", 24))
+# Rows per transaction for reloads run as jobs, so progress lands regularly
+JOB_COMMIT_EVERY = int(os.environ.get("JOB_COMMIT_EVERY", 50000))
+
+FINISHED_STATUSES = ('succeeded', 'failed', 'cancelled')
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def _now(offset_seconds=0):
+    return (datetime.now() + timedelta(seconds=offset_seconds)).strftime(TIME_FORMAT)
+
+
+def create_jobs_table(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS jobs (
+            JobID TEXT PRIMARY KEY,
+            Kind TEXT NOT NULL,
+            Params TEXT NOT NULL,
+            Owner TEXT,
+            Status TEXT NOT NULL,
+            Progress REAL,
+            Message TEXT,
+            Error TEXT,
+            ResultPath TEXT,
+            ResultName TEXT,
+            ResultType TEXT,
+            CancelRequested INTEGER NOT NULL DEFAULT 0,
+            Attempts INTEGER NOT NULL DEFAULT 0,
+            WorkerID TEXT,
+            HeartbeatAt TEXT,
+            CreatedAt TEXT NOT NULL,
+            StartedAt TEXT,
+            FinishedAt TEXT
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (Status, CreatedAt)")
+
+
+class JobCancelled(Exception):
+    """Raised inside a job when cancellation has been requested."""
+
+
+# -------------------------
+# Job Kinds
+# -------------------------
+
+class JobKind:
+    def __init__(self, name, run, admin_only, validate):
+        self.name = name
+        self.run = run
+        self.admin_only = admin_only
+        self.validate = validate
+
+
+JOB_KINDS = {}
+
+
+def job_kind(name, admin_only=False, validate=None):
+    """
+    Registers `fn(ctx, **params)` as the handler for jobs of kind `name`.
+    `validate(params)` returns the cleaned params or raises ValueError, so
+    bad submissions are refused up front instead of failing in a worker.
+    """
+    def register(fn):
+        JOB_KINDS[name] = JobKind(name, fn, admin_only, validate)
+        return fn
+    return register
+
+
+def _is_locked(error):
+    return 'locked' in str(error) or 'busy' in str(error)
+
+
+class JobContext:
+    """
+    Handed to a running job for reporting progress and storing its result.
+    `conn` is the job's own connection for its work.
+    """
+
+    def __init__(self, queue, job_id, conn):
+        self.queue = queue
+        self.job_id = job_id
+        self.conn = conn
+        self._status = connect()
+        # Never wait behind the job's own write transaction
+        self._status.execute("PRAGMA busy_timeout = 0")
+        self._last_report = 0.0
+
+    def progress(self, fraction=None, message=None, force=False):
+        """
+        Records progress (0-1, or None if unknown) and a status line.
+        Raises JobCancelled if the job has been cancelled meanwhile.
+        Writes at most twice a second unless `force` is set.
+        """
+        now = time.monotonic()
+        if not force and now - self._last_report < 0.5:
+            return
+        self._last_report = now
+        try:
+            self._status.execute("""
+                UPDATE jobs SET Progress = COALESCE(?, Progress), Message = COALESCE(?, Message), HeartbeatAt = ?
+                WHERE JobID = ?
+            """, (fraction, message, _now(), self.job_id))
+            self._status.commit()
+        except sqlite3.OperationalError as e:
+            self._status.rollback()
+            if not _is_locked(e):
+                raise
+        row = self._status.execute("SELECT CancelRequested FROM jobs WHERE JobID = ?", (self.job_id,)).fetchone()
+        if row and row[0]:
+            raise JobCancelled()
+
+    def close(self):
+        self._status.close()
+
+    def result_path(self, extension):
+        os.makedirs(self.queue.results_dir, exist_ok=True)
+        return os.path.join(self.queue.results_dir, f"{self.job_id}.{extension}")
+
+
+# -------------------------
+# Queue
+# -------------------------
+
+class JobQueue:
+    """Submits jobs to the database and runs queued jobs on a thread pool."""
+
+    def __init__(self, workers=JOB_WORKERS, results_dir=JOB_RESULTS_DIR,
+                 poll_seconds=JOB_POLL_SECONDS, stale_seconds=JOB_STALE_SECONDS,
+                 max_attempts=JOB_MAX_ATTEMPTS, retention_hours=JOB_RETENTION_HOURS):
+        self.workers = workers
+        self.results_dir = results_dir
+        self.poll_seconds = poll_seconds
+        self.stale_seconds = stale_seconds
+        self.max_attempts = max_attempts
+        self.retention_hours = retention_hours
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._running = set()
+        self._executor = None
+        self._dispatcher = None
+        self._pid = None
+        self.worker_id = None
+
+    # -- submitting and inspecting (any process) --
+
+    def submit(self, conn, kind, params, owner=None):
+        """
+        Queues a job and returns its ID; raises ValueError for an unknown
+        kind or invalid params. The caller's conn is committed.
+        """
+        if kind not in JOB_KINDS:
+            raise ValueError(f"Unknown job kind: {kind}")
+        if not isinstance(params, dict):
+            raise ValueError("params must be an object")
+        if JOB_KINDS[kind].validate:
+            params = JOB_KINDS[kind].validate(params)
+        job_id = uuid.uuid4().hex
+        conn.execute("""
+            INSERT INTO jobs (JobID, Kind, Params, Owner, Status, Progress, CreatedAt)
+            VALUES (?, ?, ?, ?, 'queued', 0, ?)
+        """, (job_id, kind, json.dumps(params), owner, _now()))
+        conn.commit()
+        self._wake.set()
+        return job_id
+
+    def get(self, conn, job_id):
+        return conn.execute("SELECT * FROM jobs WHERE JobID = ?", (job_id,)).fetchone()
+
+    def cancel(self, conn, job_id):
+        """
+        Cancels a queued job at once, or asks a running one to stop at its
+        next progress report. Returns False if the job had already finished.
+        """
+        cursor = conn.execute("""
+            UPDATE jobs SET Status = 'cancelled', FinishedAt = ?
+            WHERE JobID = ? AND Status = 'queued'
+        """, (_now(), job_id))
+        if not cursor.rowcount:
+            cursor = conn.execute(
+                "UPDATE jobs SET CancelRequested = 1 WHERE JobID = ? AND Status = 'running'", (job_id,)
+            )
+        conn.commit()
+        return bool(cursor.rowcount)
+
+    # -- running (worker processes) --
+
+    @property
+    def running(self):
+        return self._dispatcher is not None and self._pid == os.getpid()
+
+    def start(self):
+        """Starts the dispatcher and pool; safe to call again, e.g. after a fork."""
+        if self.running:
+            return
+        with self._lock:
+            if self.workers <= 0 or (self._dispatcher and self._pid == os.getpid()):
+                return
+            # Threads do not survive fork(), so a forked child starts its own
+            self._pid = os.getpid()
+            self.worker_id = f"{socket.gethostname()}:{self._pid}:{uuid.uuid4().hex[:8]}"
+            self._stopping.clear()
+            self._running = set()
+            self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="job")
+            self._dispatcher = threading.Thread(target=self._dispatch_loop, name="job-dispatcher", daemon=True)
+            self._dispatcher.start()
+
+    def stop(self, wait=True):
+        """Stops claiming jobs; running jobs finish unless wait is False."""
+        with self._lock:
+            if not self._dispatcher or self._pid != os.getpid():
+                return
+            self._stopping.set()
+            self._wake.set()
+            self._dispatcher.join()
+            self._executor.shutdown(wait=wait)
+            self._dispatcher = None
+            if wait:
+                try:
+                    os.remove(self._worker_file(self.worker_id))
+                except OSError:
+                    pass
+
+    def _worker_file(self, worker_id):
+        return os.path.join(self.results_dir, 'workers', worker_id.replace(':', '-'))
+
+    def _touch_worker_file(self):
+        path = self._worker_file(self.worker_id)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            open(path, 'a').close()
+
+    def _worker_alive(self, worker_id):
+        """Whether the worker running a job has touched its file recently."""
+        if not worker_id:
+            return False
+        if worker_id == self.worker_id:
+            return True
+        try:
+            return time.time() - os.path.getmtime(self._worker_file(worker_id)) < self.stale_seconds
+        except OSError:
+            return False
+
+    def _dispatch_loop(self):
+        conn = connect()
+        last_cleanup = 0.0
+        try:
+            while not self._stopping.is_set():
+                try:
+                    self._touch_worker_file()
+                    self._heartbeat(conn)
+                    self._requeue_stale(conn)
+                    if time.monotonic() - last_cleanup > 600:
+                        self._remove_expired(conn)
+                        last_cleanup = time.monotonic()
+                    while len(self._running) < self.workers and not self._stopping.is_set():
+                        job = self._claim(conn)
+                        if job is None:
+                            break
+                        self._running.add(job['JobID'])
+                        self._executor.submit(self._run, job)
+                except Exception:
+                    # A locked or briefly unavailable database must not kill the dispatcher
+                    conn.rollback()
+                    traceback.print_exc()
+                self._wake.wait(self.poll_seconds)
+                self._wake.clear()
+        finally:
+            conn.close()
+
+    def _heartbeat(self, conn):
+        if self._running:
+            try:
+                conn.execute(
+                    "UPDATE jobs SET HeartbeatAt = ? WHERE JobID IN (SELECT value FROM json_each(?))",
+                    (_now(), json.dumps(sorted(self._running)))
+                )
+                conn.commit()
+            except sqlite3.OperationalError as e:
+                # A job is mid-transaction; beat again on the next poll
+                conn.rollback()
+                if not _is_locked(e):
+                    raise
+
+    def _requeue_stale(self, conn):
+        # Jobs whose worker process has stopped: retry, or give up after
+        # max_attempts. A job whose row heartbeat is old but whose worker
+        # is still touching its file is just busy. Polls that find nothing
+        # to requeue (nearly all) stay read-only.
+        stale_before = _now(-self.stale_seconds)
+        rows = conn.execute(
+            "SELECT JobID, WorkerID FROM jobs WHERE Status = 'running' AND HeartbeatAt < ?", (stale_before,)
+        ).fetchall()
+        dead = [job_id for job_id, worker_id in rows if not self._worker_alive(worker_id)]
+        if not dead:
+            return
+        conn.execute("""
+            UPDATE jobs
+            SET Status = CASE
+                    WHEN CancelRequested THEN 'cancelled'
+                    WHEN Attempts >= ? THEN 'failed'
+                    ELSE 'queued' END,
+                Error = CASE WHEN Attempts >= ? THEN 'Worker stopped responding.' ELSE Error END,
+                FinishedAt = CASE WHEN CancelRequested OR Attempts >= ? THEN ? ELSE NULL END,
+                WorkerID = NULL
+            WHERE Status = 'running' AND HeartbeatAt < ? AND JobID IN (SELECT value FROM json_each(?))
+        """, (self.max_attempts, self.max_attempts, self.max_attempts, _now(), stale_before, json.dumps(dead)))
+        conn.commit()
+
+    def _remove_expired(self, conn):
+        expired = conn.execute("""
+            SELECT JobID, ResultPath FROM jobs
+            WHERE Status IN ('succeeded', 'failed', 'cancelled') AND FinishedAt < ?
+        """, (_now(-self.retention_hours * 3600),)).fetchall()
+        for job_id, path in expired:
+            if path and os.path.exists(path):
+                os.remove(path)
+            conn.execute("DELETE FROM jobs WHERE JobID = ?", (job_id,))
+        conn.commit()
+
+        # Files of worker processes long gone
+        workers_dir = os.path.join(self.results_dir, 'workers')
+        if not os.path.isdir(workers_dir):
+            return
+        for name in os.listdir(workers_dir):
+            path = os.path.join(workers_dir, name)
+            try:
+                if time.time() - os.path.getmtime(path) > self.retention_hours * 3600:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def _claim(self, conn):
+        # Look before taking the write lock, so an idle queue costs a read
+        if conn.execute("SELECT 1 FROM jobs WHERE Status = 'queued' LIMIT 1").fetchone() is None:
+            return None
+        row = conn.execute("""
+            UPDATE jobs
+            SET Status = 'running', WorkerID = ?, Attempts = Attempts + 1,
+                StartedAt = ?, HeartbeatAt = ?
+            WHERE JobID = (
+                SELECT JobID FROM jobs WHERE Status = 'queued' ORDER BY CreatedAt LIMIT 1
+            ) AND Status = 'queued'
+            RETURNING *
+        """, (self.worker_id, _now(), _now())).fetchone()
+        conn.commit()
+        return row
+
+    def _run(self, job):
+        conn = connect()
+        ctx = JobContext(self, job['JobID'], conn)
+        try:
+            kind = JOB_KINDS[job['Kind']]
+            result = kind.run(ctx, **json.loads(job['Params'])) or {}
+            conn.execute("""
+                UPDATE jobs
+                SET Status = 'succeeded', Progress = 1, FinishedAt = ?,
+                    Message = COALESCE(?, Message), ResultPath = ?, ResultName = ?, ResultType = ?
+                WHERE JobID = ?
+            """, (_now(), result.get('message'), result.get('path'), result.get('name'),
+                  result.get('mimetype'), job['JobID']))
+        except JobCancelled:
+            conn.rollback()
+            conn.execute(
+                "UPDATE jobs SET Status = 'cancelled', FinishedAt = ? WHERE JobID = ?", (_now(), job['JobID'])
+            )
+        except Exception as e:
+            conn.rollback()
+            traceback.print_exc()
+            conn.execute(
+                "UPDATE jobs SET Status = 'failed', Error = ?, FinishedAt = ? WHERE JobID = ?",
+                (f"{type(e).__name__}: {e}", _now(), job['JobID'])
+            )
+        finally:
+            conn.commit()
+            conn.close()
+            ctx.close()
+            self._running.discard(job['JobID'])
+            self._wake.set()
+
+
+# -------------------------
+# Built-in Job Kinds
+# -------------------------
+
+RELOAD_TABLES = ("minerals", "countries", "sites", "production_stats")
+
+
+def validate_export(params):
+    from exports import EXPORTS, EXPORT_FORMATS
+
+    name, export_format = params.get('name'), params.get('export_format')
+    if name not in EXPORTS:
+        raise ValueError(f"name must be one of {', '.join(EXPORTS)}")
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"export_format must be one of {', '.join(EXPORT_FORMATS)}")
+    filters = params.get('filters') or {}
+    columns = set(EXPORTS[name].filters.values())
+    if not isinstance(filters, dict) or not set(filters) <= columns:
+        raise ValueError(f"filters may only use {', '.join(sorted(columns))}")
+    try:
+        filters = {column: [int(v) for v in values] for column, values in filters.items()}
+    except (TypeError, ValueError):
+        raise ValueError("filter values must be lists of integer IDs")
+    filename = params.get('filename') or f"{name}_export.{export_format}"
+    return {'name': name, 'filters': filters, 'export_format': export_format,
+            'filename': os.path.basename(str(filename))}
+
+
+def validate_reload(params):
+    from bulk_load import LOAD_MODES
+
+    if params.get('table') not in RELOAD_TABLES:
+        raise ValueError(f"table must be one of {', '.join(RELOAD_TABLES)}")
+    if params.get('mode', 'ignore') not in LOAD_MODES:
+        raise ValueError(f"mode must be one of {', '.join(LOAD_MODES)}")
+    return {'table': params['table'], 'mode': params.get('mode', 'ignore')}
+
+
+@job_kind('export', validate=validate_export)
+def run_export(ctx, name, filters, export_format, filename):
+    """Writes an export to a file instead of streaming it to the client."""
+    from exports import EXPORT_FORMATS, count_export_rows, export_chunks
+
+    total = count_export_rows(ctx.conn, name, filters) or 1
+    done = [0]
+
+    def on_batch(rows):
+        done[0] += rows
+        ctx.progress(min(done[0] / total, 1.0), f"{done[0]:,} of {total:,} rows")
+
+    path = ctx.result_path(export_format)
+    partial = path + ".part"
+    with open(partial, 'wb') as f:
+        for chunk in export_chunks(name, filters, export_format, on_batch=on_batch):
+            f.write(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+    os.replace(partial, path)
+    return {'path': path, 'name': filename, 'mimetype': EXPORT_FORMATS[export_format],
+            'message': f"Exported {done[0]:,} rows."}
+
+
+@job_kind('reload_table', admin_only=True, validate=validate_reload)
+def run_reload_table(ctx, table, mode='ignore', data_dir='Data'):
+    """Bulk-loads Data/<table>.csv|parquet, as setup_database.py does."""
+    from bulk_load import find_source, load_table
+
+    path = find_source(data_dir, table)
+    if path is None:
+        raise FileNotFoundError(f"No {table}.csv or {table}.parquet in {data_dir}")
+    report = load_table(ctx.conn, table, path, mode=mode, commit_every=JOB_COMMIT_EVERY,
+                        progress=lambda line: ctx.progress(None, line))
+    return {'message': str(report)}
+
+
+@job_kind('rebuild_country_summaries', admin_only=True, validate=lambda params: {})
+def run_rebuild_country_summaries(ctx):
+    from country_summaries import rebuild_country_summaries
+
+    count = rebuild_country_summaries(ctx.conn, progress=lambda line: ctx.progress(None, line.strip()))
+    return {'message': f"Rebuilt summaries for {count:,} countries."}
@@ -0,0 +1,68 @@
+import importlib
+import os
+import threading
+
+# -------------------------
+# Lazy Imports
+# -------------------------
+# numpy, pandas, matplotlib and folium take most of a cold start, yet
+# logins and the admin CRUD pages never touch them. Modules that use them
+# bind a proxy instead:
+#
+#     np = lazy_module("numpy")
+#
+# and the real import happens on the first attribute access (np.array...),
+# i.e. on the first request that needs it. Pages that always need a
+# library (the map, chart rendering) import it inside the function instead.
+
+HEAVY_MODULES = (
+    "numpy",
+    "pandas",
+    "matplotlib.figure",
+    "matplotlib.backends.backend_agg",
+    "folium",
+)
+
+WARM_UP_IMPORTS = os.environ.get("WARM_UP_IMPORTS", "1") == "1"
+
+
+class LazyModule:
+    """Stands in for a module until one of its attributes is used."""
+
+    def __init__(self, name):
+        self.__dict__['_name'] = name
+        self.__dict__['_module'] = None
+
+    def __getattr__(self, attr):
+        module = self._module
+        if module is None:
+            module = importlib.import_module(self._name)
+            self.__dict__['_module'] = module
+        return getattr(module, attr)
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module '{self._name}' ({state})>"
+
+
+def lazy_module(name):
+    return LazyModule(name)
+
+
+def preload(modules=HEAVY_MODULES):
+    """Imports the heavy modules now, e.g. in a server master before forking."""
+    for name in modules:
+        importlib.import_module(name)
+
+
+def warm_up(modules=HEAVY_MODULES):
+    """
+    Imports the heavy modules on a background thread, so a freshly started
+    worker answers light requests at once and has them ready shortly after.
+    Never call this before forking: the import lock could be held mid-fork.
+    """
+    if not WARM_UP_IMPORTS:
+        return None
+    thread = threading.Thread(target=preload, args=(modules,), name="import-warm-up", daemon=True)
+    thread.start()
+    return thread
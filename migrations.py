@@ -0,0 +1,239 @@
+from datetime import datetime
+
+from cache import ensure_data_versions
+from compare import add_population_column
+from country_summaries import create_and_build_summaries
+from jobs import create_jobs_table
+from search import create_and_fill_search_index
+from site_geo import create_and_fill_site_rtree
+from price_analytics import create_and_backfill_price_stats
+from price_series import create_price_series_tables
+
+# -------------------------
+# Schema Migrations
+# -------------------------
+# Each migration runs once and is recorded in schema_migrations. When the
+# database is up to date, run_migrations() only reads, so every worker can
+# call it on startup without taking a write lock.
+
+HISTORICAL_PRICES = [
+    ("Cobalt",    2023, 50229.0),
+    ("Cobalt",    2024, 49822.0),
+    ("Cobalt",    2025, 52000.0),
+    ("Graphite",  2023, 729.0),
+    ("Graphite",  2024, 821.0),
+    ("Graphite",  2025, 800.0),
+    ("Lithium",   2023, 64093.0),
+    ("Lithium",   2024, 69273.0),
+    ("Lithium",   2025, 70000.0),
+    ("Manganese", 2023, 1980.0),
+    ("Manganese", 2024, 2300.0),
+    ("Manganese", 2025, 2200.0)
+]
+
+
+def create_base_tables(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS roles (
+            RoleID INTEGER PRIMARY KEY,
+            RoleName TEXT NOT NULL,
+            Permissions TEXT NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            UserID INTEGER PRIMARY KEY,
+            Username TEXT NOT NULL UNIQUE,
+            PasswordHash TEXT NOT NULL,
+            RoleID INTEGER,
+            FOREIGN KEY(RoleID) REFERENCES roles(RoleID)
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS minerals (
+            MineralID INTEGER PRIMARY KEY,
+            MineralName TEXT NOT NULL,
+            Description TEXT NOT NULL,
+            MarketPriceUSD_per_tonne REAL NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS countries (
+            CountryID INTEGER PRIMARY KEY,
+            CountryName TEXT NOT NULL,
+            GDP_BillionUSD REAL NOT NULL,
+            MiningRevenue_BillionUSD REAL NOT NULL,
+            KeyProjects TEXT NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS sites (
+            SiteID INTEGER PRIMARY KEY,
+            SiteName TEXT NOT NULL,
+            CountryID INTEGER,
+            MineralID INTEGER,
+            Latitude REAL NOT NULL,
+            Longitude REAL NOT NULL,
+            Production_tonnes REAL NOT NULL,
+            FOREIGN KEY(CountryID) REFERENCES countries(CountryID),
+            FOREIGN KEY(MineralID) REFERENCES minerals(MineralID)
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS production_stats (
+            StatID INTEGER PRIMARY KEY,
+            Year INTEGER NOT NULL,
+            CountryID INTEGER,
+            MineralID INTEGER,
+            Production_tonnes REAL NOT NULL,
+            ExportValue_BillionUSD REAL NOT NULL,
+            FOREIGN KEY(CountryID) REFERENCES countries(CountryID),
+            FOREIGN KEY(MineralID) REFERENCES minerals(MineralID)
+        )
+    """)
+
+
+def create_mineral_prices(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS mineral_prices (
+            PriceID INTEGER PRIMARY KEY AUTOINCREMENT,
+            MineralName TEXT NOT NULL,
+            Year INTEGER NOT NULL,
+            PriceUSD_per_tonne REAL NOT NULL
+        )
+    """)
+
+
+def seed_historical_prices(conn):
+    # Skips (MineralName, Year) pairs that already exist, so prices edited
+    # by admins are left alone
+    conn.executemany("""
+        INSERT INTO mineral_prices (MineralName, Year, PriceUSD_per_tonne)
+        SELECT ?, ?, ?
+        WHERE NOT EXISTS (
+            SELECT 1 FROM mineral_prices WHERE MineralName = ? AND Year = ?
+        )
+    """, [(name, year, price, name, year) for name, year, price in HISTORICAL_PRICES])
+
+
+def create_mineral_insights(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS mineral_insights (
+            InsightID INTEGER PRIMARY KEY AUTOINCREMENT,
+            MineralID INTEGER,
+            Insight TEXT,
+            FOREIGN KEY(MineralID) REFERENCES minerals(MineralID)
+        )
+    """)
+
+
+# Secondary indexes for the lookup and join columns used by routes.
+# (name, table, columns) - query_plans.py checks that routes actually use them.
+INDEXES = [
+    ("idx_mineral_prices_mineral_year", "mineral_prices", "MineralName, Year, PriceUSD_per_tonne"),
+    ("idx_sites_country", "sites", "CountryID"),
+    ("idx_sites_mineral", "sites", "MineralID"),
+    ("idx_production_stats_country", "production_stats", "CountryID, Year"),
+    ("idx_production_stats_mineral", "production_stats", "MineralID, Year"),
+    ("idx_mineral_insights_mineral", "mineral_insights", "MineralID"),
+]
+
+# Sort columns of the admin lists (see pagination.py), added by migration 14.
+# Like INDEXES, applied migrations depend on this list: add new indexes in
+# a new list and migration rather than here.
+SORT_INDEXES = [
+    ("idx_minerals_name", "minerals", "MineralName"),
+    ("idx_countries_name", "countries", "CountryName"),
+    ("idx_sites_name", "sites", "SiteName"),
+    ("idx_sites_production", "sites", "Production_tonnes"),
+    ("idx_production_stats_year", "production_stats", "Year"),
+    ("idx_mineral_prices_year", "mineral_prices", "Year"),
+    ("idx_roles_name", "roles", "RoleName"),
+]
+
+
+def ensure_indexes(conn, indexes=INDEXES):
+    for name, table, columns in indexes:
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})")
+
+
+def create_sort_indexes(conn):
+    ensure_indexes(conn, SORT_INDEXES)
+
+
+# (version, name, function) - append only, never renumber
+MIGRATIONS = [
+    (1, "create base tables", create_base_tables),
+    (2, "create mineral_prices", create_mineral_prices),
+    (3, "seed historical prices", seed_historical_prices),
+    (4, "create mineral_insights", create_mineral_insights),
+    (5, "create data_versions", ensure_data_versions),
+    (6, "create lookup indexes", ensure_indexes),
+    (7, "create mineral_price_stats", create_and_backfill_price_stats),
+    (8, "create price tick blocks and rollups", create_price_series_tables),
+    (9, "add countries.Population_Millions", add_population_column),
+    (10, "create country summaries", create_and_build_summaries),
+    (11, "create full-text search index", create_and_fill_search_index),
+    (12, "create jobs", create_jobs_table),
+    (13, "create site spatial index", create_and_fill_site_rtree),
+    (14, "create admin sort indexes", create_sort_indexes),
+]
+
+
+def applied_versions(conn):
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'schema_migrations'"
+    ).fetchone()
+    if not exists:
+        return set()
+    return {row[0] for row in conn.execute("SELECT Version FROM schema_migrations")}
+
+
+def pending_migrations(conn):
+    applied = applied_versions(conn)
+    return [m for m in MIGRATIONS if m[0] not in applied]
+
+
+def run_migrations(conn):
+    """
+    Applies pending migrations in order and returns the versions applied.
+    Does nothing (and writes nothing) when the schema is current.
+    """
+    if not pending_migrations(conn):
+        return []
+
+    # Take the write lock, then re-check in case another worker got there first
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                Version INTEGER PRIMARY KEY,
+                Name TEXT NOT NULL,
+                AppliedAt TEXT NOT NULL
+            )
+        """)
+        applied = []
+        for version, name, migrate in pending_migrations(conn):
+            migrate(conn)
+            conn.execute(
+                "INSERT INTO schema_migrations (Version, Name, AppliedAt) VALUES (?, ?, ?)",
+                (version, name, datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+            )
+            applied.append(version)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return applied
+
+
+if __name__ == '__main__':
+    from db import connect
+
+    conn = connect()
+    applied = run_migrations(conn)
+    conn.close()
+    if applied:
+        print(f"Applied migrations: {', '.join(str(v) for v in applied)}")
+    else:
+        print("Database schema is up to date.")
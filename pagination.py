@@ -0,0 +1,173 @@
+import base64
+import json
+
+# -------------------------
+# Keyset Pagination for Admin Lists
+# -------------------------
+# Pages are addressed by the (sort value, primary key) of the row at their
+# edge instead of an OFFSET. Only the primary key and NOT NULL columns with
+# an index of their own are offered for sorting (such an index is ordered by
+# (column, rowid), just like the ORDER BY), so a page is a walk along an index
+# that stops after page_size rows, however deep it is (query_plans.py
+# checks this for every sortable column).
+#
+# Filters do not keep that bound. An equality filter on an indexed column
+# reads just the matching rows, but sorts them in a temporary B-tree. Any
+# other filter, including every text 'contains' match (LIKE '%x%' can't use
+# an index), is checked row by row along the sort index. A filter that
+# matches few rows may therefore walk most of the table to fill one page.
+#
+# Query string: ?sort=<column>&order=asc|desc&page_size=N
+#               &f_<column>=<value>     (numeric: equals, text: contains)
+#               &after=<cursor> | &before=<cursor>
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+def encode_cursor(values):
+    raw = json.dumps(values, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(value):
+    """Returns the [sort value, key] pair in a cursor, or None if invalid."""
+    if not value:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(value + '=' * (-len(value) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(values, list) or len(values) != 2:
+        return None
+    return values
+
+
+class Page:
+    """One page of rows plus everything the template needs to link around."""
+
+    def __init__(self, rows, columns, sortable, sort, order, page_size, filters,
+                 next_cursor, prev_cursor):
+        self.rows = rows
+        self.columns = columns
+        self.sortable = sortable
+        self.sort = sort
+        self.order = order
+        self.page_size = page_size
+        self.filters = filters
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    def args(self, **extra):
+        """Query-string arguments for this listing, merged with `extra`."""
+        args = {'sort': self.sort, 'order': self.order, 'page_size': self.page_size}
+        args.update({f"f_{column}": value for column, value in self.filters.items()})
+        args.update(extra)
+        return args
+
+    @property
+    def next_args(self):
+        return self.args(after=self.next_cursor) if self.next_cursor else None
+
+    @property
+    def prev_args(self):
+        return self.args(before=self.prev_cursor) if self.prev_cursor else None
+
+
+def _is_numeric(col_type):
+    return any(t in col_type for t in ('INT', 'REAL', 'FLOA', 'DOUB', 'NUM'))
+
+
+def sortable_columns(conn, table, schema=None):
+    """
+    Returns (key, sortable): the table's primary key and the columns a page
+    can be sorted by, the key first.
+    """
+    schema = schema or conn.execute(f"PRAGMA table_info({table})").fetchall()
+    key = next((r[1] for r in schema if r[5]), 'rowid')
+    indexed = set()
+    for index in conn.execute(f"PRAGMA index_list({table})").fetchall():
+        index_columns = conn.execute(f"PRAGMA index_info({index[1]})").fetchall()
+        if len(index_columns) == 1:
+            indexed.add(index_columns[0][2])
+    # Keyset comparisons need non-null sort values
+    return key, [key] + [r[1] for r in schema if r[3] and r[1] != key and r[1] in indexed]
+
+
+def keyset_query(table, key, sort, ascending, where, page_size):
+    """The SELECT for one page: rows matching `where`, walked in sort order."""
+    direction = 'ASC' if ascending else 'DESC'
+    sql = f"SELECT {'rowid, ' if key == 'rowid' else ''}* FROM {table}"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    order_by = [f"{sort} {direction}"] + ([f"{key} {direction}"] if sort != key else [])
+    return sql + f" ORDER BY {', '.join(order_by)} LIMIT {page_size + 1}"
+
+
+def cursor_clause(key, sort, ascending):
+    op = '>' if ascending else '<'
+    if sort == key:
+        return f"{key} {op} ?"
+    return f"({sort}, {key}) {op} (?, ?)"
+
+
+def paginate(conn, table, args):
+    """Fetches one page of `table` according to the request arguments."""
+    schema = conn.execute(f"PRAGMA table_info({table})").fetchall()
+    columns = [r[1] for r in schema]
+    types = {r[1]: (r[2] or '').upper() for r in schema}
+    key, sortable = sortable_columns(conn, table, schema)
+
+    sort = args.get('sort') if args.get('sort') in sortable else key
+    order = 'desc' if args.get('order') == 'desc' else 'asc'
+    try:
+        page_size = int(args.get('page_size', DEFAULT_PAGE_SIZE))
+    except (TypeError, ValueError):
+        page_size = DEFAULT_PAGE_SIZE
+    page_size = max(1, min(page_size, MAX_PAGE_SIZE))
+
+    where, params, filters = [], [], {}
+    for column in columns:
+        value = (args.get(f"f_{column}") or '').strip()
+        if not value:
+            continue
+        if _is_numeric(types[column]):
+            try:
+                params.append(float(value))
+            except ValueError:
+                continue
+            where.append(f"{column} = ?")
+        else:
+            escaped = value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            where.append(f"{column} LIKE ? ESCAPE '\\'")
+            params.append(f"%{escaped}%")
+        filters[column] = value
+
+    after = decode_cursor(args.get('after'))
+    before = decode_cursor(args.get('before'))
+    forward = after is not None or before is None
+    cursor = after if forward else before
+
+    # Walking backwards runs the query in reverse order, then flips the rows
+    ascending = (order == 'asc') == forward
+    if cursor is not None:
+        where.append(cursor_clause(key, sort, ascending))
+        params.extend(cursor[1:] if sort == key else cursor)
+
+    rows = conn.execute(keyset_query(table, key, sort, ascending, where, page_size), params).fetchall()
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if not forward:
+        rows.reverse()
+
+    has_next = has_more if forward else True
+    has_prev = cursor is not None if forward else has_more
+    next_cursor = prev_cursor = None
+    if rows and has_next:
+        next_cursor = encode_cursor([rows[-1][sort], rows[-1][key]])
+    if rows and has_prev:
+        prev_cursor = encode_cursor([rows[0][sort], rows[0][key]])
+
+    return Page(rows, columns, sortable, sort, order, page_size, filters,
+                next_cursor, prev_cursor)
@@ -0,0 +1,146 @@
+import json
+
+from lazy_imports import lazy_module
+
+np = lazy_module("numpy")
+
+# -------------------------
+# Price Analytics
+# -------------------------
+# mineral_price_stats keeps one row per mineral with its headline figures
+# and its yearly series, already shaped for the charts. The admin price
+# routes refresh only the mineral(s) they touched, so the analyze-prices
+# page reads a handful of rows no matter how long the price history is.
+
+ROLLING_WINDOW = 5   # observations used for rolling min/max/volatility
+
+MINERAL_PRICES_QUERY = """
+    SELECT PriceID, Year, PriceUSD_per_tonne
+    FROM mineral_prices
+    WHERE MineralName = ?
+    ORDER BY Year
+"""
+
+PRICE_STATS_QUERY = "SELECT * FROM mineral_price_stats ORDER BY MineralName"
+
+
+def create_price_stats_table(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS mineral_price_stats (
+            MineralName TEXT PRIMARY KEY,
+            Observations INTEGER NOT NULL,
+            FirstYear INTEGER,
+            FirstPrice REAL,
+            LatestYear INTEGER,
+            LatestPrice REAL,
+            YoYChangePct REAL,
+            CAGRPct REAL,
+            RollingMin REAL,
+            RollingMax REAL,
+            RollingVolatilityPct REAL,
+            Series TEXT NOT NULL
+        )
+    """)
+
+
+def compute_stats(years, prices):
+    """
+    Headline figures for one mineral from its yearly prices (sorted by
+    year). Percentages are None where they are undefined.
+    """
+    years = np.asarray(years, dtype=np.int64)
+    prices = np.asarray(prices, dtype=np.float64)
+    window = prices[-ROLLING_WINDOW:]
+
+    stats = {
+        'Observations': len(prices),
+        'FirstYear': int(years[0]),
+        'FirstPrice': float(prices[0]),
+        'LatestYear': int(years[-1]),
+        'LatestPrice': float(prices[-1]),
+        'YoYChangePct': None,
+        'CAGRPct': None,
+        'RollingMin': float(window.min()),
+        'RollingMax': float(window.max()),
+        'RollingVolatilityPct': None,
+    }
+
+    if len(prices) > 1 and prices[-2] > 0:
+        stats['YoYChangePct'] = float((prices[-1] / prices[-2] - 1) * 100)
+
+    span = years[-1] - years[0]
+    if span > 0 and prices[0] > 0 and prices[-1] > 0:
+        stats['CAGRPct'] = float(((prices[-1] / prices[0]) ** (1 / span) - 1) * 100)
+
+    # Standard deviation of log returns across the rolling window
+    positive = window[window > 0]
+    if len(positive) > 2:
+        returns = np.diff(np.log(positive))
+        stats['RollingVolatilityPct'] = float(returns.std(ddof=1) * 100)
+
+    return stats
+
+
+def refresh_mineral_stats(conn, *mineral_names):
+    """Recomputes the stats row of each named mineral from mineral_prices."""
+    for name in set(mineral_names):
+        rows = conn.execute(MINERAL_PRICES_QUERY, (name,)).fetchall()
+        # One price per year; the most recently added entry for a year wins
+        by_year, entry_ids = {}, {}
+        for price_id, year, price in rows:
+            if price_id > entry_ids.get(year, -1):
+                by_year[year] = price
+                entry_ids[year] = price_id
+
+        if not by_year:
+            conn.execute("DELETE FROM mineral_price_stats WHERE MineralName = ?", (name,))
+            continue
+
+        years = sorted(by_year)
+        stats = compute_stats(years, [by_year[y] for y in years])
+        stats['MineralName'] = name
+        stats['Series'] = json.dumps([[y, by_year[y]] for y in years])
+
+        columns = list(stats)
+        conn.execute(
+            f"INSERT OR REPLACE INTO mineral_price_stats ({', '.join(columns)}) "
+            f"VALUES ({', '.join(['?'] * len(columns))})",
+            [stats[c] for c in columns]
+        )
+
+
+def rebuild_price_stats(conn):
+    """Recomputes every mineral; used by the migration and after bulk loads."""
+    conn.execute("DELETE FROM mineral_price_stats")
+    names = [row[0] for row in conn.execute("SELECT DISTINCT MineralName FROM mineral_prices")]
+    refresh_mineral_stats(conn, *names)
+
+
+def create_and_backfill_price_stats(conn):
+    create_price_stats_table(conn)
+    rebuild_price_stats(conn)
+
+
+def load_price_analytics(conn):
+    """
+    Returns the analyze-prices payload:
+      latest - one stats dict per mineral
+      chart  - {'years': [...], 'series': [{'label', 'data'}]} with data
+               aligned to years (None where a mineral has no price)
+    """
+    rows = conn.execute(PRICE_STATS_QUERY).fetchall()
+
+    latest, series, all_years = [], [], set()
+    for row in rows:
+        stats = dict(row)
+        points = dict((year, price) for year, price in json.loads(stats.pop('Series')))
+        all_years.update(points)
+        series.append((stats['MineralName'], points))
+        latest.append(stats)
+
+    years = sorted(all_years)
+    chart = {
+        'years': years,
+        'series': [{'label': name, 'data': [points.get(y) for y in years]} for name, points in series],
+    }
+    return {'latest': latest, 'chart': chart}
@@ -0,0 +1,400 @@
+import json
+import zlib
+
+from bulk_load import read_chunks
+from cache import bump_data_version
+from lazy_imports import lazy_module
+
+np = lazy_module("numpy")
+pd = lazy_module("pandas")
+
+# -------------------------
+# High-Resolution Price Series
+# -------------------------
+# Raw price ticks are stored one block per (mineral, UTC day): the day's
+# timestamps and prices as zlib-compressed arrays, so a day of ticks is a
+# single row however many ticks it holds. Every write also refreshes the
+# OHLC rollups for the periods it touched (day -> week -> month -> year),
+# and queries read the coarsest tier that still gives the resolution asked
+# for, so a 20-year chart reads about a thousand rollup rows, not ticks.
+#
+#     python price_series.py load ticks.csv   # MineralName, Timestamp, Price
+
+DAY = 86400
+
+# Finest to coarsest; 'tick' is served from the raw blocks
+RESOLUTIONS = ('tick', 'day', 'week', 'month', 'year')
+ROLLUP_TIERS = ('day', 'week', 'month', 'year')
+
+# Approximate period length, used to pick a tier for a requested point count
+PERIOD_SECONDS = {'day': DAY, 'week': 7 * DAY, 'month': 30 * DAY, 'year': 365 * DAY}
+
+# Each tier is built from the one it is listed against
+ROLLUP_SOURCES = {'week': 'day', 'month': 'day', 'year': 'month'}
+
+DEFAULT_POINTS = 500
+MAX_TICK_POINTS = 200000
+
+ROLLUP_QUERY = """
+    SELECT PeriodStart, Open, High, Low, Close, Total, TickCount
+    FROM price_rollups
+    WHERE MineralName = ? AND Resolution = ? AND PeriodStart >= ? AND PeriodStart < ?
+    ORDER BY PeriodStart
+"""
+
+TICKS_QUERY = """
+    SELECT Day, Timestamps, Prices FROM price_tick_blocks
+    WHERE MineralName = ? AND Day >= ? AND Day < ?
+    ORDER BY Day
+"""
+
+
+def create_price_series_tables(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS price_tick_blocks (
+            MineralName TEXT NOT NULL,
+            Day INTEGER NOT NULL,
+            TickCount INTEGER NOT NULL,
+            Timestamps BLOB NOT NULL,
+            Prices BLOB NOT NULL,
+            PRIMARY KEY (MineralName, Day)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS price_rollups (
+            MineralName TEXT NOT NULL,
+            Resolution TEXT NOT NULL,
+            PeriodStart INTEGER NOT NULL,
+            Open REAL NOT NULL,
+            High REAL NOT NULL,
+            Low REAL NOT NULL,
+            Close REAL NOT NULL,
+            Total REAL NOT NULL,
+            TickCount INTEGER NOT NULL,
+            PRIMARY KEY (MineralName, Resolution, PeriodStart)
+        ) WITHOUT ROWID
+    """)
+
+
+# -------------------------
+# Encoding and Periods
+# -------------------------
+
+def _encode(array):
+    return zlib.compress(array.tobytes(), 1)
+
+
+def _decode(blob, dtype):
+    return np.frombuffer(zlib.decompress(blob), dtype=dtype)
+
+
+def period_start(resolution, timestamps):
+    """Start (epoch seconds, UTC) of the period each timestamp falls in."""
+    days = np.asarray(timestamps, dtype=np.int64) // DAY
+    if resolution == 'day':
+        starts = days
+    elif resolution == 'week':
+        starts = days - (days + 3) % 7   # weeks start on Monday; day 0 was a Thursday
+    elif resolution == 'month':
+        starts = days.astype('datetime64[D]').astype('datetime64[M]').astype('datetime64[D]').astype(np.int64)
+    elif resolution == 'year':
+        starts = days.astype('datetime64[D]').astype('datetime64[Y]').astype('datetime64[D]').astype(np.int64)
+    else:
+        raise ValueError(f"Unknown resolution: {resolution}")
+    return starts * DAY
+
+
+def _period_end(resolution, start):
+    """Exclusive end of the period beginning at `start`."""
+    day = np.datetime64(int(start // DAY), 'D')
+    if resolution == 'day':
+        end = day + 1
+    elif resolution == 'week':
+        end = day + 7
+    elif resolution == 'month':
+        end = (day.astype('datetime64[M]') + 1).astype('datetime64[D]')
+    else:
+        end = (day.astype('datetime64[Y]') + 1).astype('datetime64[D]')
+    return int(end.astype(np.int64)) * DAY
+
+
+def parse_time(value):
+    """Epoch seconds from an int/float or an ISO date string; None if invalid."""
+    if value is None or value == '':
+        return None
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        pass
+    try:
+        return int(pd.Timestamp(value, tz='UTC').timestamp())
+    except (TypeError, ValueError):
+        return None
+
+
+# -------------------------
+# Aggregation
+# -------------------------
+
+def _aggregate(keys, open_, high, low, close, total, count):
+    """
+    Groups time-ordered rows by period key. Returns the keys and the OHLC,
+    total and count of each group.
+    """
+    keys, first = np.unique(keys, return_index=True)
+    last = np.append(first[1:], len(open_)) - 1
+    return (keys, open_[first], np.maximum.reduceat(high, first),
+            np.minimum.reduceat(low, first), close[last],
+            np.add.reduceat(total, first), np.add.reduceat(count, first))
+
+
+def _write_rollups(conn, mineral, resolution, groups):
+    keys, open_, high, low, close, total, count = groups
+    conn.executemany("""
+        INSERT OR REPLACE INTO price_rollups
+            (MineralName, Resolution, PeriodStart, Open, High, Low, Close, Total, TickCount)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, [(mineral, resolution, int(k), float(o), float(h), float(l), float(c), float(t), int(n))
+          for k, o, h, l, c, t, n in zip(keys, open_, high, low, close, total, count)])
+
+
+def _refresh_tier(conn, mineral, resolution, starts):
+    """Rebuilds the given periods of a tier from the tier below it."""
+    source = ROLLUP_SOURCES[resolution]
+    starts = np.unique(period_start(resolution, starts))
+    low_bound, high_bound = int(starts[0]), _period_end(resolution, starts[-1])
+
+    rows = conn.execute("""
+        SELECT PeriodStart, Open, High, Low, Close, Total, TickCount
+        FROM price_rollups
+        WHERE MineralName = ? AND Resolution = ? AND PeriodStart >= ? AND PeriodStart < ?
+        ORDER BY PeriodStart
+    """, (mineral, source, low_bound, high_bound)).fetchall()
+
+    conn.execute("""
+        DELETE FROM price_rollups
+        WHERE MineralName = ? AND Resolution = ? AND PeriodStart IN (SELECT value FROM json_each(?))
+    """, (mineral, resolution, json.dumps([int(s) for s in starts])))
+    if not rows:
+        return starts
+
+    data = np.array([tuple(r) for r in rows], dtype=np.float64)
+    keys = period_start(resolution, data[:, 0].astype(np.int64))
+    wanted = np.isin(keys, starts)
+    groups = _aggregate(keys[wanted], *(data[wanted, i] for i in range(1, 7)))
+    _write_rollups(conn, mineral, resolution, groups)
+    return starts
+
+
+def _refresh_days(conn, mineral, days):
+    """Rebuilds the day rollups of the given day numbers from their blocks."""
+    conn.execute("""
+        DELETE FROM price_rollups
+        WHERE MineralName = ? AND Resolution = 'day' AND PeriodStart IN (SELECT value FROM json_each(?))
+    """, (mineral, json.dumps([int(d) * DAY for d in days])))
+    rows = conn.execute("""
+        SELECT Day, Prices FROM price_tick_blocks
+        WHERE MineralName = ? AND Day IN (SELECT value FROM json_each(?))
+        ORDER BY Day
+    """, (mineral, json.dumps([int(d) for d in days]))).fetchall()
+    for day, blob in rows:
+        prices = _decode(blob, np.float64)
+        _write_rollups(conn, mineral, 'day', (
+            [day * DAY], [prices[0]], [prices.max()], [prices.min()], [prices[-1]],
+            [prices.sum()], [len(prices)]
+        ))
+
+
+def refresh_rollups(conn, mineral, days):
+    """Brings every rollup tier up to date for the given day numbers."""
+    days = np.unique(np.asarray(days, dtype=np.int64))
+    if not len(days):
+        return
+    _refresh_days(conn, mineral, days)
+    touched = {'day': days * DAY}
+    for resolution in ('week', 'month', 'year'):
+        touched[resolution] = _refresh_tier(conn, mineral, resolution, touched[ROLLUP_SOURCES[resolution]])
+
+
+# -------------------------
+# Writes
+# -------------------------
+
+def append_ticks(conn, mineral, timestamps, prices):
+    """
+    Merges ticks into a mineral's day blocks and refreshes the rollups they
+    fall in. A tick at an existing timestamp replaces the stored price.
+    Returns the number of day blocks written. The caller commits.
+    """
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    prices = np.asarray(prices, dtype=np.float64)
+    if not len(timestamps):
+        return 0
+
+    days = timestamps // DAY
+    order = np.argsort(days, kind='stable')
+    days, timestamps, prices = days[order], timestamps[order], prices[order]
+    unique_days, first = np.unique(days, return_index=True)
+    bounds = np.append(first, len(days))
+
+    existing = {row[0]: row for row in conn.execute("""
+        SELECT Day, Timestamps, Prices FROM price_tick_blocks
+        WHERE MineralName = ? AND Day IN (SELECT value FROM json_each(?))
+    """, (mineral, json.dumps([int(d) for d in unique_days])))}
+
+    blocks = []
+    for i, day in enumerate(unique_days):
+        ts, px = timestamps[bounds[i]:bounds[i + 1]], prices[bounds[i]:bounds[i + 1]]
+        if int(day) in existing:
+            _, old_ts, old_px = existing[int(day)]
+            ts = np.concatenate([_decode(old_ts, np.int64), ts])
+            px = np.concatenate([_decode(old_px, np.float64), px])
+        # Sort by time; on equal timestamps the newest tick (last appended) wins
+        order = np.argsort(ts, kind='stable')
+        ts, px = ts[order], px[order]
+        keep = np.append(ts[1:] != ts[:-1], True)
+        ts, px = ts[keep], px[keep]
+        blocks.append((mineral, int(day), len(ts), _encode(ts), _encode(px)))
+
+    conn.executemany("""
+        INSERT OR REPLACE INTO price_tick_blocks (MineralName, Day, TickCount, Timestamps, Prices)
+        VALUES (?, ?, ?, ?, ?)
+    """, blocks)
+    refresh_rollups(conn, mineral, unique_days)
+    bump_data_version(conn, 'price_ticks')
+    return len(blocks)
+
+
+def load_ticks(conn, path, chunksize=1000000, progress=print):
+    """
+    Streams a CSV/Parquet tick feed (MineralName, Timestamp, Price) into the
+    store, committing once per chunk. Timestamps may be epoch seconds or
+    ISO dates/times (UTC). Returns the number of ticks loaded.
+    """
+    loaded = 0
+    for chunk in read_chunks(path, chunksize):
+        missing = {'MineralName', 'Timestamp', 'Price'} - set(chunk.columns)
+        if missing:
+            raise ValueError(f"Missing required column(s): {', '.join(sorted(missing))}")
+
+        if pd.api.types.is_numeric_dtype(chunk['Timestamp']):
+            stamps = pd.to_numeric(chunk['Timestamp'], errors='coerce')
+        else:
+            parsed = pd.to_datetime(chunk['Timestamp'], errors='coerce', utc=True, format='ISO8601')
+            stamps = (parsed - pd.Timestamp(0, tz='UTC')) // pd.Timedelta(seconds=1)
+        chunk = chunk.assign(Timestamp=stamps, Price=pd.to_numeric(chunk['Price'], errors='coerce'))
+        chunk = chunk.dropna(subset=['MineralName', 'Timestamp', 'Price'])
+
+        for mineral, ticks in chunk.groupby('MineralName', sort=False):
+            append_ticks(conn, mineral, ticks['Timestamp'].to_numpy(np.int64), ticks['Price'].to_numpy(np.float64))
+        conn.commit()
+        loaded += len(chunk)
+        if progress:
+            progress(f"  {loaded:,} ticks loaded")
+    return loaded
+
+
+# -------------------------
+# Queries
+# -------------------------
+
+def choose_resolution(start, end, points=DEFAULT_POINTS):
+    """
+    The coarsest tier that still gives at least `points` periods across
+    [start, end); raw ticks when even daily rollups are too coarse.
+    """
+    span = max(end - start, 1)
+    for resolution in reversed(ROLLUP_TIERS):
+        if span / PERIOD_SECONDS[resolution] >= points:
+            return resolution
+    return 'tick'
+
+
+def series_minerals(conn):
+    return [row[0] for row in conn.execute(
+        "SELECT DISTINCT MineralName FROM price_rollups WHERE Resolution = 'year' ORDER BY MineralName"
+    )]
+
+
+def series_range(conn, mineral):
+    """(first, last) tick timestamps stored for a mineral, or None."""
+    row = conn.execute("""
+        SELECT MIN(Day), MAX(Day) FROM price_tick_blocks WHERE MineralName = ?
+    """, (mineral,)).fetchone()
+    if row[0] is None:
+        return None
+    return row[0] * DAY, (row[1] + 1) * DAY
+
+
+def _query_ticks(conn, mineral, start, end, limit=MAX_TICK_POINTS):
+    """Raw ticks in [start, end) as (timestamps, prices); None past `limit`."""
+    ts, px, total = [], [], 0
+    for _, ts_blob, px_blob in conn.execute(TICKS_QUERY, (mineral, start // DAY, -(-end // DAY))):
+        day_ts = _decode(ts_blob, np.int64)
+        mask = (day_ts >= start) & (day_ts < end)
+        ts.append(day_ts[mask])
+        px.append(_decode(px_blob, np.float64)[mask])
+        total += len(ts[-1])
+        if total > limit:
+            return None
+    if not ts:
+        return [], []
+    return np.concatenate(ts).tolist(), np.concatenate(px).tolist()
+
+
+def query_series(conn, mineral, start, end, resolution=None, points=DEFAULT_POINTS):
+    """
+    Price series for a mineral over [start, end) as parallel lists. Uses
+    `resolution` if given, otherwise the coarsest tier that meets `points`.
+    """
+    requested = resolution
+    resolution = resolution or choose_resolution(start, end, points)
+    if resolution not in RESOLUTIONS:
+        raise ValueError(f"Unknown resolution: {resolution}")
+
+    if resolution == 'tick':
+        # Picked automatically, raw ticks are only worth sending while they
+        # stay near the requested density; past that, daily rollups win
+        limit = MAX_TICK_POINTS if requested else min(points * 10, MAX_TICK_POINTS)
+        ticks = _query_ticks(conn, mineral, start, end, limit)
+        if ticks is None:
+            if requested:
+                raise ValueError("Range holds too many ticks; request a coarser resolution.")
+            return query_series(conn, mineral, start, end, resolution='day')
+        ts, px = ticks
+        return {'mineral': mineral, 'resolution': 'tick', 't': ts,
+                'open': px, 'high': px, 'low': px, 'close': px, 'mean': px, 'count': [1] * len(ts)}
+
+    rows = conn.execute(
+        ROLLUP_QUERY, (mineral, resolution, int(period_start(resolution, [start])[0]), end)
+    ).fetchall()
+    return {
+        'mineral': mineral,
+        'resolution': resolution,
+        't': [r[0] for r in rows],
+        'open': [r[1] for r in rows],
+        'high': [r[2] for r in rows],
+        'low': [r[3] for r in rows],
+        'close': [r[4] for r in rows],
+        'mean': [r[5] / r[6] for r in rows],
+        'count': [r[6] for r in rows],
+    }
+
+
+if __name__ == '__main__':
+    import argparse
+
+    from db import connect
+    from migrations import run_migrations
+
+    parser = argparse.ArgumentParser(description="Load price ticks into the time-series store.")
+    parser.add_argument("command", choices=["load"])
+    parser.add_argument("path", help="CSV or Parquet file with MineralName, Timestamp, Price")
+    parser.add_argument("--chunksize", type=int, default=1000000, help="ticks read per chunk")
+    args = parser.parse_args()
+
+    conn = connect()
+    run_migrations(conn)
+    total = load_ticks(conn, args.path, chunksize=args.chunksize)
+    conn.close()
+    print(f"Loaded {total:,} ticks from {args.path}.")
@@ -0,0 +1,139 @@
+import re
+import sqlite3
+import sys
+
+from auth import LOGIN_QUERY
+from cache import DATA_VERSIONS_QUERY
+from compare import COMPARE_QUERY
+from country_summaries import COUNTRY_QUERY, COUNTRY_REFRESH_QUERY, MINERAL_BREAKDOWN_QUERY, TREND_QUERY
+from insights import feed_query
+from migrations import run_migrations
+from pagination import DEFAULT_PAGE_SIZE, cursor_clause, keyset_query, sortable_columns
+from price_analytics import MINERAL_PRICES_QUERY, PRICE_STATS_QUERY
+from price_series import ROLLUP_QUERY, TICKS_QUERY
+from site_geo import CANDIDATE_QUERY, SITE_DETAILS_QUERY
+
+# -------------------------
+# Query Plan Checks
+# -------------------------
+# Runs EXPLAIN QUERY PLAN over the queries routes issue against tables that
+# are expected to grow, and reports any that fall back to a full table scan
+# or a temporary sort. Plans are taken on an empty in-memory copy of the
+# schema, so the result does not depend on how much data is loaded locally.
+#
+#     python query_plans.py      # exits 1 if any query regressed
+
+LARGE_TABLES = {'users', 'sites', 'production_stats', 'mineral_prices', 'mineral_insights',
+                'price_tick_blocks', 'price_rollups', 'country_production_trend', 'site_rtree'}
+
+# (route, sql, tables allowed to be scanned in full). The statements are
+# imported from the modules that run them, so the checks cannot drift.
+ROUTE_QUERIES = [
+    ('login', LOGIN_QUERY, ()),
+    ('view_country_profile', COUNTRY_QUERY, ()),
+    ('compare_countries', COMPARE_QUERY, ()),
+    ('view_country_profile (minerals)', MINERAL_BREAKDOWN_QUERY, ()),
+    ('view_country_profile (trend)', TREND_QUERY, ()),
+    ('refresh_country_summaries', COUNTRY_REFRESH_QUERY, ()),
+    ('sites_near (candidates)',
+     CANDIDATE_QUERY + " AND MineralID IN (?) AND CountryID IN (?)", ()),
+    ('sites_near (details)',
+     SITE_DETAILS_QUERY.format(placeholders='?, ?, ?'), ()),
+    ('get_map_data_version', DATA_VERSIONS_QUERY.format(placeholders='?, ?, ?'), ()),
+    ('investor_analyze_prices', PRICE_STATS_QUERY, ()),
+    ('refresh_mineral_stats', MINERAL_PRICES_QUERY, ()),
+    ('investor_price_series', ROLLUP_QUERY, ()),
+    ('investor_price_series (ticks)', TICKS_QUERY, ()),
+    # The first page walks the table backwards from the newest row and stops at LIMIT
+    ('researcher_insights', feed_query()[0], ('mineral_insights',)),
+    ('researcher_insights_feed', feed_query(before=0)[0], ()),
+    ('researcher_insights_feed (by mineral)', feed_query(mineral_id=0, before=0)[0], ()),
+]
+
+# Tables listed page by page on the admin menus (see pagination.py)
+PAGINATED_TABLES = ('users', 'minerals', 'countries', 'sites', 'production_stats', 'mineral_prices', 'roles')
+
+_SQL_KEYWORDS = {'WHERE', 'JOIN', 'ON', 'ORDER', 'GROUP', 'LEFT', 'INNER', 'CROSS',
+                 'LIMIT', 'USING', 'NATURAL', 'HAVING', 'UNION'}
+
+
+def _aliases(sql):
+    """Maps every name a table is referred to by in the query to the table."""
+    aliases = {}
+    for table, alias in re.findall(r'\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?', sql, re.I):
+        aliases[table] = table
+        if alias and alias.upper() not in _SQL_KEYWORDS:
+            aliases[alias] = table
+    return aliases
+
+
+def explain(conn, sql):
+    params = (None,) * sql.count('?')
+    return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+
+
+def check_query(conn, sql, allowed_scans=()):
+    """Returns a list of problems found in the query's plan (empty if fine)."""
+    aliases = _aliases(sql)
+    problems = []
+    for detail in explain(conn, sql):
+        scan = re.match(r'SCAN (\w+)(.*)', detail)
+        if scan:
+            table = aliases.get(scan.group(1), scan.group(1))
+            # SCAN ... USING [COVERING] INDEX still reads every row, just in
+            # index order; only a virtual table scan with constraints (an
+            # R*Tree box lookup) is a search
+            constrained = re.search(r'VIRTUAL TABLE INDEX \d+:\S', scan.group(2))
+            if table in LARGE_TABLES and table not in allowed_scans and not constrained:
+                problems.append(f"full scan of {table}: {detail}")
+        elif detail.startswith('USE TEMP B-TREE') and LARGE_TABLES & set(aliases.values()):
+            problems.append(f"temporary sort: {detail}")
+    return problems
+
+
+def page_queries(conn, tables=PAGINATED_TABLES):
+    """
+    (route, sql, allowed scans) for every sortable column of every admin
+    list, both directions. The first page walks the sort index from one end
+    and stops at LIMIT; later pages must search from their cursor.
+    """
+    queries = []
+    for table in tables:
+        key, sortable = sortable_columns(conn, table)
+        for sort in sortable:
+            for ascending in (True, False):
+                route = f"paginate {table} by {sort} {'asc' if ascending else 'desc'}"
+                queries.append((route, keyset_query(table, key, sort, ascending, [], DEFAULT_PAGE_SIZE),
+                                (table,)))
+                queries.append((route + " (next page)",
+                                keyset_query(table, key, sort, ascending,
+                                             [cursor_clause(key, sort, ascending)], DEFAULT_PAGE_SIZE),
+                                ()))
+    return queries
+
+
+def check_route_queries(queries=ROUTE_QUERIES):
+    """
+    Checks every registered query and admin list page; returns
+    ({route: [problems]} for failures, number of queries checked).
+    """
+    conn = sqlite3.connect(':memory:')
+    run_migrations(conn)
+    queries = list(queries) + page_queries(conn)
+    failures = {}
+    for route, sql, allowed_scans in queries:
+        problems = check_query(conn, sql, allowed_scans)
+        if problems:
+            failures.setdefault(route, []).extend(problems)
+    conn.close()
+    return failures, len(queries)
+
+
+if __name__ == '__main__':
+    failures, checked = check_route_queries()
+    for route, problems in failures.items():
+        for problem in problems:
+            print(f"{route}: {problem}")
+    if failures:
+        sys.exit(1)
+    print(f"All {checked} route queries use indexes.")
@@ -0,0 +1,157 @@
+import html
+import re
+
+# -------------------------
+# Full-Text Search
+# -------------------------
+# One FTS5 index covers minerals, countries, sites and researcher insights.
+# Triggers on the source tables keep it in sync, so every write path
+# (admin routes, insight forms, bulk loads) updates it without extra code.
+# Each document's rowid encodes its source (id * 4 + kind code), which lets
+# the triggers replace or remove a document by rowid instead of searching
+# the index for it.
+
+# kind -> (code, table, key, title column, body column)
+SEARCH_SOURCES = {
+    'mineral': (0, 'minerals', 'MineralID', 'MineralName', 'Description'),
+    'country': (1, 'countries', 'CountryID', 'CountryName', 'KeyProjects'),
+    'site': (2, 'sites', 'SiteID', 'SiteName', None),
+    'insight': (3, 'mineral_insights', 'InsightID', None, 'Insight'),
+}
+KIND_CODES = len(SEARCH_SOURCES)
+
+SEARCH_PAGE_SIZE = 20
+MAX_SEARCH_PAGES = 50
+
+# Private-use markers wrapped around matches, swapped for <mark> after escaping
+_MARK_START, _MARK_END = '\ue000', '\ue001'
+
+
+def _document(kind, row='NEW'):
+    """SQL expressions (rowid, kind, ref, title, body) for a trigger row."""
+    code, _, key, title, body = SEARCH_SOURCES[kind]
+    return (f"{row}.{key} * {KIND_CODES} + {code}", f"'{kind}'", f"{row}.{key}",
+            f"COALESCE({row}.{title}, '')" if title else "''",
+            f"COALESCE({row}.{body}, '')" if body else "''")
+
+
+def create_search_index(conn):
+    conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(
+            Kind UNINDEXED,
+            RefID UNINDEXED,
+            Title,
+            Body,
+            tokenize = 'porter unicode61 remove_diacritics 2',
+            prefix = '2 3'
+        )
+    """)
+    for kind, (code, table, key, _, _) in SEARCH_SOURCES.items():
+        new_doc = ', '.join(_document(kind))
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS search_{table}_insert AFTER INSERT ON {table} BEGIN
+                INSERT INTO search_index (rowid, Kind, RefID, Title, Body) VALUES ({new_doc});
+            END
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS search_{table}_update AFTER UPDATE ON {table} BEGIN
+                DELETE FROM search_index WHERE rowid = OLD.{key} * {KIND_CODES} + {code};
+                INSERT INTO search_index (rowid, Kind, RefID, Title, Body) VALUES ({new_doc});
+            END
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS search_{table}_delete AFTER DELETE ON {table} BEGIN
+                DELETE FROM search_index WHERE rowid = OLD.{key} * {KIND_CODES} + {code};
+            END
+        """)
+
+
+def rebuild_search_index(conn):
+    """Re-indexes every source row; used by the migration and for repairs."""
+    conn.execute("DELETE FROM search_index")
+    for kind, (_, table, _, _, _) in SEARCH_SOURCES.items():
+        doc = ', '.join(_document(kind, row=table))
+        conn.execute(f"INSERT INTO search_index (rowid, Kind, RefID, Title, Body) SELECT {doc} FROM {table}")
+    conn.execute("INSERT INTO search_index (search_index) VALUES ('optimize')")
+
+
+def create_and_fill_search_index(conn):
+    create_search_index(conn)
+    rebuild_search_index(conn)
+
+
+def build_match_query(text):
+    """
+    Turns free text into an FTS5 query: every word must match, words
+    ending in * match as prefixes, and so does the last word (if it is
+    longer than one letter), so results follow the user as they type.
+    Returns None if there is nothing to match.
+    """
+    terms = re.findall(r'\w+\*?', text or '')
+    if not terms:
+        return None
+    parts = []
+    for i, term in enumerate(terms):
+        word = term.rstrip('*')
+        prefix = term.endswith('*') or (i == len(terms) - 1 and len(word) > 1 and not text[-1:].isspace())
+        parts.append(f'"{word}"' + ('*' if prefix else ''))
+    return ' '.join(parts)
+
+
+def _highlight(fragment):
+    return (html.escape(fragment or '')
+            .replace(_MARK_START, '<mark>')
+            .replace(_MARK_END, '</mark>'))
+
+
+def search(conn, text, kinds=None, page=1, page_size=SEARCH_PAGE_SIZE):
+    """
+    Ranked matches for `text`, best first. Returns (results, has_more);
+    each result has kind, id, and HTML-safe title and snippet with the
+    matched words wrapped in <mark>.
+    """
+    match = build_match_query(text)
+    if match is None:
+        return [], False
+    page = max(1, min(page, MAX_SEARCH_PAGES))
+
+    sql = f"""
+        SELECT Kind, RefID,
+               highlight(search_index, 2, '{_MARK_START}', '{_MARK_END}'),
+               snippet(search_index, 3, '{_MARK_START}', '{_MARK_END}', '…', 16)
+        FROM search_index
+        WHERE search_index MATCH ?
+    """
+    params = [match]
+    if kinds:
+        sql += f" AND Kind IN ({', '.join('?' * len(kinds))})"
+        params.extend(kinds)
+    # Title matches count for twice as much as body matches
+    sql += " ORDER BY bm25(search_index, 0, 0, 2.0, 1.0) LIMIT ? OFFSET ?"
+    params += [page_size + 1, (page - 1) * page_size]
+
+    rows = conn.execute(sql, params).fetchall()
+    results = [{
+        'kind': kind,
+        'id': ref_id,
+        'title': _highlight(title),
+        'snippet': _highlight(snippet),
+    } for kind, ref_id, title, snippet in rows[:page_size]]
+    _add_insight_titles(conn, results)
+    return results, len(rows) > page_size
+
+
+def _add_insight_titles(conn, results):
+    # Insights have no title of their own; show the mineral they are about
+    ids = [r['id'] for r in results if r['kind'] == 'insight']
+    if not ids:
+        return
+    names = dict(conn.execute(f"""
+        SELECT i.InsightID, m.MineralName
+        FROM mineral_insights i
+        LEFT JOIN minerals m ON m.MineralID = i.MineralID
+        WHERE i.InsightID IN ({', '.join('?' * len(ids))})
+    """, ids).fetchall())
+    for result in results:
+        if result['kind'] == 'insight':
+            result['title'] = html.escape(f"Insight on {names.get(result['id']) or 'unknown mineral'}")
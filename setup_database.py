@@ -1,121 +1,55 @@
-import pandas as pd
-import sqlite3
+import argparse
 import os
 
-# Create Data folder if missing
-os.makedirs("Data", exist_ok=True)
-
-# Required CSV files (must be inside /Data)
-required_files = [
-    "users.csv", "roles.csv", "minerals.csv",
-    "sites.csv", "countries.csv", "production_stats.csv"
-]
-
-for file in required_files:
-    path = os.path.join("Data", file)
-    if not os.path.exists(path):
-        raise FileNotFoundError(f"Missing file: {path}")
-
-# Load CSV files
-users_df = pd.read_csv("Data/users.csv")
-roles_df = pd.read_csv("Data/roles.csv")
-minerals_df = pd.read_csv("Data/minerals.csv")
-sites_df = pd.read_csv("Data/sites.csv")
-countries_df = pd.read_csv("Data/countries.csv")
-production_stats_df = pd.read_csv("Data/production_stats.csv")
-
-# Connect to SQLite database
-conn = sqlite3.connect("Data/userdata.db")
-cur = conn.cursor()
-
-# Create tables
-cur.execute("""
-CREATE TABLE IF NOT EXISTS roles (
-    RoleID INTEGER PRIMARY KEY,
-    RoleName TEXT NOT NULL,
-    Permissions TEXT NOT NULL
-)
-""")
-
-cur.execute("""
-CREATE TABLE IF NOT EXISTS users (
-    UserID INTEGER PRIMARY KEY,
-    Username TEXT NOT NULL UNIQUE,
-    PasswordHash TEXT NOT NULL,
-    RoleID INTEGER,
-    FOREIGN KEY(RoleID) REFERENCES roles(RoleID)
-)
-""")
+from bulk_load import LOAD_MODES, find_source, load_table
+from db import DB_PATH, connect
+from migrations import run_migrations
+
+# Tables in load order (parents before the tables that reference them)
+TABLES = ["roles", "users", "minerals", "countries", "sites", "production_stats"]
+
+parser = argparse.ArgumentParser(description="Create the schema and bulk-load the Data/ feeds.")
+parser.add_argument("--data-dir", default="Data",
+                    help="folder holding <table>.csv or <table>.parquet files")
+parser.add_argument("--mode", choices=LOAD_MODES, default="ignore",
+                    help="upsert: overwrite rows with matching primary keys; "
+                         "ignore: only insert new keys (default)")
+parser.add_argument("--chunksize", type=int, default=50000, help="rows read per chunk")
+parser.add_argument("--commit-every", type=int, default=500000, help="rows per transaction")
+parser.add_argument("--strict", action="store_true", help="abort on the first invalid row")
+parser.add_argument("tables", nargs="*", default=TABLES, help="tables to load (default: all)")
+args = parser.parse_args()
 
-cur.execute("""
-CREATE TABLE IF NOT EXISTS minerals (
-    MineralID INTEGER PRIMARY KEY,
-    MineralName TEXT NOT NULL,
-    Description TEXT NOT NULL,
-    MarketPriceUSD_per_tonne REAL NOT NULL
-)
-""")
-
-cur.execute("""
-CREATE TABLE IF NOT EXISTS countries (
-    CountryID INTEGER PRIMARY KEY,
-    CountryName TEXT NOT NULL,
-    GDP_BillionUSD REAL NOT NULL,
-    MiningRevenue_BillionUSD REAL NOT NULL,
-    KeyProjects TEXT NOT NULL
-)
-""")
-
-cur.execute("""
-CREATE TABLE IF NOT EXISTS sites (
-    SiteID INTEGER PRIMARY KEY,
-    SiteName TEXT NOT NULL,
-    CountryID INTEGER,
-    MineralID INTEGER,
-    Latitude REAL NOT NULL,
-    Longitude REAL NOT NULL,
-    Production_tonnes REAL NOT NULL,
-    FOREIGN KEY(CountryID) REFERENCES countries(CountryID),
-    FOREIGN KEY(MineralID) REFERENCES minerals(MineralID)
-)
-""")
-
-cur.execute("""
-CREATE TABLE IF NOT EXISTS production_stats (
-    StatID INTEGER PRIMARY KEY,
-    Year INTEGER NOT NULL,
-    CountryID INTEGER,
-    MineralID INTEGER,
-    Production_tonnes REAL NOT NULL,
-    ExportValue_BillionUSD REAL NOT NULL,
-    FOREIGN KEY(CountryID) REFERENCES countries(CountryID),
-    FOREIGN KEY(MineralID) REFERENCES minerals(MineralID)
-)
-""")
-
-# Insert data if empty
-def insert_if_empty(df, table_name, columns):
-    cur.execute(f"SELECT COUNT(*) FROM {table_name}")
-    count = cur.fetchone()[0]
-    if count == 0:
-        placeholders = ','.join(['?'] * len(columns))
-        for _, row in df.iterrows():
-            cur.execute(
-                f"INSERT INTO {table_name} ({','.join(columns)}) VALUES ({placeholders})",
-                tuple(row[col] for col in columns)
-            )
-        print(f"Inserted data into {table_name}.")
-    else:
-        print(f"Skipped {table_name} — already filled.")
-
-insert_if_empty(roles_df, "roles", ["RoleID", "RoleName", "Permissions"])
-insert_if_empty(users_df, "users", ["UserID", "Username", "PasswordHash", "RoleID"])
-insert_if_empty(minerals_df, "minerals", ["MineralID", "MineralName", "Description", "MarketPriceUSD_per_tonne"])
-insert_if_empty(countries_df, "countries", ["CountryID", "CountryName", "GDP_BillionUSD", "MiningRevenue_BillionUSD", "KeyProjects"])
-insert_if_empty(sites_df, "sites", ["SiteID", "SiteName", "CountryID", "MineralID", "Latitude", "Longitude", "Production_tonnes"])
-insert_if_empty(production_stats_df, "production_stats", ["StatID", "Year", "CountryID", "MineralID", "Production_tonnes", "ExportValue_BillionUSD"])
+# Create Data folder if missing
+os.makedirs(args.data_dir, exist_ok=True)
+
+# Every requested feed must be present as CSV or Parquet
+sources = {}
+for table in args.tables:
+    if table not in TABLES:
+        raise SystemExit(f"Unknown table: {table}")
+    path = find_source(args.data_dir, table)
+    if path is None:
+        raise FileNotFoundError(f"Missing file: {os.path.join(args.data_dir, table + '.csv')}")
+    sources[table] = path
+
+# Connect to SQLite database and bring the schema up to date
+conn = connect()
+run_migrations(conn)
+
+reports = []
+for table in args.tables:
+    print(f"Loading {sources[table]} into {table} ({args.mode})...")
+    reports.append(load_table(conn, table, sources[table], mode=args.mode,
+                              chunksize=args.chunksize, commit_every=args.commit_every,
+                              strict=args.strict))
 
-conn.commit()
 conn.close()
 
-print("✅ Database setup complete! Data loaded into Data/userdata.db.")
+print()
+for report in reports:
+    print(report)
+    for error in report.errors:
+        print(f"  {error}")
+
+print(f"✅ Database setup complete! Data loaded into {DB_PATH}.")
@@ -0,0 +1,264 @@
+import math
+
+from lazy_imports import lazy_module
+from site_index import DEFAULT_MARKER_LIMIT, split_bbox
+
+np = lazy_module("numpy")
+
+# -------------------------
+# Geospatial Site Queries
+# -------------------------
+# An SQLite R*Tree holds one point box per site, plus the site's exact
+# coordinates, mineral and country as auxiliary columns. Triggers on sites
+# keep it in sync, so every write path (admin routes, bulk loads) updates
+# it one row at a time instead of rebuilding anything.
+#
+# Queries take candidates from the R*Tree by bounding boxes, filtered by
+# mineral or country inside the same scan, and then refine them with a
+# vectorized haversine distance. Nearest-site search widens its radius
+# until it has found enough sites.
+
+EARTH_RADIUS_KM = 6371.0088
+MAX_DISTANCE_KM = math.pi * EARTH_RADIUS_KM   # half way round the earth
+# Up to here circle_boxes() follows the circle; beyond, it covers whole bands
+TIGHT_RADIUS_KM = 0.99 * MAX_DISTANCE_KM / 2
+KNN_START_KM = 25.0
+MAX_CIRCLE_STRIPS = 64
+KNN_MAX_CANDIDATES = 5000
+MAX_NEAREST = 500
+
+CANDIDATE_QUERY = """
+    SELECT SiteID, Latitude, Longitude FROM site_rtree
+    WHERE MinLat <= ? AND MaxLat >= ? AND MinLon <= ? AND MaxLon >= ?
+"""
+
+SITE_DETAILS_QUERY = """
+    SELECT s.SiteID, s.SiteName, s.Production_tonnes, s.Latitude, s.Longitude,
+           c.CountryName, m.MineralName
+    FROM sites s
+    LEFT JOIN countries c ON c.CountryID = s.CountryID
+    LEFT JOIN minerals m ON m.MineralID = s.MineralID
+    WHERE s.SiteID IN ({placeholders})
+"""
+
+_POINT = "{row}.SiteID, {row}.Latitude, {row}.Latitude, {row}.Longitude, {row}.Longitude, " \
+         "{row}.Latitude, {row}.Longitude, {row}.MineralID, {row}.CountryID"
+_HAS_POINT = "{row}.Latitude IS NOT NULL AND {row}.Longitude IS NOT NULL"
+
+
+def create_site_rtree(conn):
+    conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS site_rtree USING rtree(
+            SiteID,
+            MinLat, MaxLat,
+            MinLon, MaxLon,
+            +Latitude, +Longitude, +MineralID, +CountryID
+        )
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS site_rtree_insert AFTER INSERT ON sites
+        WHEN {_HAS_POINT.format(row='NEW')} BEGIN
+            INSERT INTO site_rtree VALUES ({_POINT.format(row='NEW')});
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS site_rtree_update AFTER UPDATE ON sites BEGIN
+            DELETE FROM site_rtree WHERE SiteID = OLD.SiteID;
+            INSERT INTO site_rtree SELECT {_POINT.format(row='NEW')} WHERE {_HAS_POINT.format(row='NEW')};
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS site_rtree_delete AFTER DELETE ON sites BEGIN
+            DELETE FROM site_rtree WHERE SiteID = OLD.SiteID;
+        END
+    """)
+
+
+def rebuild_site_rtree(conn):
+    """Re-indexes every site; used by the migration and for repairs."""
+    conn.execute("DELETE FROM site_rtree")
+    conn.execute(f"INSERT INTO site_rtree SELECT {_POINT.format(row='sites')} FROM sites "
+                 f"WHERE {_HAS_POINT.format(row='sites')}")
+
+
+def create_and_fill_site_rtree(conn):
+    create_site_rtree(conn)
+    rebuild_site_rtree(conn)
+
+
+# -------------------------
+# Distance Helpers
+# -------------------------
+
+def haversine_km(lat, lon, lat0, lon0):
+    """Great-circle distances in km from (lat0, lon0) to arrays of points."""
+    lat, lon = np.radians(lat), np.radians(lon)
+    lat0, lon0 = math.radians(lat0), math.radians(lon0)
+    a = np.sin((lat - lat0) / 2) ** 2 + math.cos(lat0) * np.cos(lat) * np.sin((lon - lon0) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def circle_boxes(lat, lon, radius_km):
+    """
+    (west, south, east, north) boxes that together cover every point within
+    radius_km of (lat, lon): one per horizontal strip of the circle (about a
+    degree of latitude each), each only as wide as the circle is within it. A single box around a large
+    circle away from the equator would take in far more than the circle.
+    west > east where a box crosses the antimeridian.
+    """
+    angle = radius_km / EARTH_RADIUS_KM
+    south = max(lat - math.degrees(angle), -90.0)
+    north = min(lat + math.degrees(angle), 90.0)
+    cos_lat = math.cos(math.radians(lat))
+    if angle >= math.pi / 2 or cos_lat < 1e-9:
+        return [(-180.0, south, 180.0, north)]
+
+    # The circle is widest at this latitude, and narrows away from it
+    widest = math.degrees(math.asin(max(-1.0, min(1.0, math.sin(math.radians(lat)) / math.cos(angle)))))
+    strips = max(1, min(MAX_CIRCLE_STRIPS, math.ceil(north - south)))
+    step = (north - south) / strips
+    boxes = []
+    for i in range(strips):
+        strip_south, strip_north = south + i * step, south + (i + 1) * step
+        phi = math.radians(max(strip_south, min(widest, strip_north)))
+        if math.cos(phi) < 1e-9:
+            boxes.append((-180.0, strip_south, 180.0, strip_north))
+            continue
+        cos_dlon = (math.cos(angle) - math.sin(phi) * math.sin(math.radians(lat))) / (math.cos(phi) * cos_lat)
+        if cos_dlon <= -1.0:
+            # The strip goes round a pole: every longitude is in range
+            boxes.append((-180.0, strip_south, 180.0, strip_north))
+            continue
+        dlon = math.degrees(math.acos(min(1.0, cos_dlon)))
+        west, east = lon - dlon, lon + dlon
+        if dlon >= 180.0:
+            west, east = -180.0, 180.0
+        elif west < -180.0:
+            west += 360.0
+        elif east > 180.0:
+            east -= 360.0
+        boxes.append((west, strip_south, east, strip_north))
+    return boxes
+
+
+# -------------------------
+# Queries
+# -------------------------
+
+def _candidates(conn, boxes, mineral_ids=(), country_ids=(), limit=None):
+    """(ids, lat, lon) arrays of the indexed sites inside any of the boxes."""
+    sql, params = CANDIDATE_QUERY, []
+    for column, values in (('MineralID', mineral_ids), ('CountryID', country_ids)):
+        if values:
+            sql += f" AND {column} IN ({','.join(['?'] * len(values))})"
+            params.extend(values)
+
+    rows = []
+    for west, south, east, north in (part for box in boxes for part in split_bbox(box)):
+        box_rows = conn.execute(
+            sql + (f" LIMIT {int(limit) - len(rows)}" if limit else ""),
+            [north, south, east, west] + params
+        ).fetchall()
+        rows.extend(box_rows)
+        if limit and len(rows) >= limit:
+            break
+
+    if not rows:
+        empty = np.empty(0)
+        return empty.astype(np.int64), empty, empty
+    ids, lat, lon = zip(*rows)
+    return np.array(ids, dtype=np.int64), np.array(lat, dtype=np.float64), np.array(lon, dtype=np.float64)
+
+
+def _details(conn, ids, distances=None):
+    """Site records for ids, in the order given, with distance_km if known."""
+    ids = [int(i) for i in ids]
+    if not ids:
+        return []
+    rows = conn.execute(SITE_DETAILS_QUERY.format(placeholders=','.join(['?'] * len(ids))), ids).fetchall()
+    by_id = {row[0]: row for row in rows}
+
+    sites = []
+    for i, site_id in enumerate(ids):
+        row = by_id.get(site_id)
+        if row is None:
+            continue
+        site = {
+            'id': row[0],
+            'name': row[1],
+            'country': row[5] or "Unknown Country",
+            'mineral': row[6] or "Unknown Mineral",
+            'production': row[2],
+            'lat': row[3],
+            'lon': row[4],
+        }
+        if distances is not None:
+            site['distance_km'] = round(float(distances[i]), 3)
+        sites.append(site)
+    return sites
+
+
+def sites_in_bbox(conn, bbox, mineral_ids=(), country_ids=(), limit=DEFAULT_MARKER_LIMIT):
+    """
+    Sites inside a (west, south, east, north) box. Returns up to `limit`
+    sites and whether more matched.
+    """
+    ids, _, _ = _candidates(conn, [bbox], mineral_ids, country_ids, limit=limit + 1)
+    return _details(conn, ids[:limit]), len(ids) > limit
+
+
+def sites_within(conn, lat, lon, radius_km, mineral_ids=(), country_ids=(), limit=DEFAULT_MARKER_LIMIT):
+    """
+    Sites within radius_km of (lat, lon), nearest first. Returns up to
+    `limit` sites and whether more matched.
+    """
+    ids, site_lat, site_lon = _candidates(conn, circle_boxes(lat, lon, radius_km), mineral_ids, country_ids)
+    distances = haversine_km(site_lat, site_lon, lat, lon)
+    inside = np.flatnonzero(distances <= radius_km)
+    order = inside[np.argsort(distances[inside], kind='stable')][:limit]
+    return _details(conn, ids[order], distances[order]), len(inside) > limit
+
+
+def nearest_sites(conn, lat, lon, k, mineral_ids=(), country_ids=(), max_km=MAX_DISTANCE_KM):
+    """
+    The k sites nearest (lat, lon), nearest first, none further than max_km.
+    The search radius starts small and doubles until it holds k sites. A
+    radius that takes in more than KNN_MAX_CANDIDATES sites (as a point far
+    from all the data would after its last doubling) is halved back
+    towards the last one that held too few, so no step reads much more
+    than it needs.
+    """
+    cap = max(KNN_MAX_CANDIDATES, k * 20)
+    too_few, radius = 0.0, min(KNN_START_KM, max_km)
+    while True:
+        boxes = circle_boxes(lat, lon, radius)
+        tight = radius <= TIGHT_RADIUS_KM
+        ids, site_lat, site_lon = _candidates(conn, boxes, mineral_ids, country_ids, limit=cap if tight else None)
+        if tight and len(ids) >= cap:
+            if radius - too_few > radius / 64:
+                radius = (too_few + radius) / 2
+                continue
+            # So many sites so close together that only reading them all will do
+            ids, site_lat, site_lon = _candidates(conn, boxes, mineral_ids, country_ids)
+        distances = haversine_km(site_lat, site_lon, lat, lon)
+        inside = np.flatnonzero(distances <= radius)
+        # Sites outside the circle may be further than ones not yet
+        # fetched, so only those inside it count towards k
+        if len(inside) >= k or radius >= max_km:
+            break
+        too_few = radius
+        if len(distances) >= k:
+            # The boxes already hold k sites, so the k nearest are no
+            # further than the k-th of those
+            radius = min(float(np.partition(distances, k - 1)[k - 1]), max_km)
+        elif radius < TIGHT_RADIUS_KM < radius * 2:
+            # Try the widest radius the cap still works for before reading
+            # everything further away
+            radius = min(TIGHT_RADIUS_KM, max_km)
+        else:
+            radius = min(radius * 2, max_km)
+
+    if len(inside) > k:
+        inside = inside[np.argpartition(distances[inside], k - 1)[:k]]
+    order = inside[np.argsort(distances[inside], kind='stable')]
+    return _details(conn, ids[order], distances[order])
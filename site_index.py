@@ -0,0 +1,189 @@
+from lazy_imports import lazy_module
+
+np = lazy_module("numpy")
+
+# -------------------------
+# Grid Spatial Index for Mineral Sites
+# -------------------------
+# Sites are bucketed into a lat/lon grid whose cell size halves at every zoom
+# level (one cell is roughly CELL_PX screen pixels wide), so the clusters for
+# zoom z are just the cells of zoom z+1 merged in groups of 2x2. Only the
+# finest level is built from the raw rows; every coarser level is aggregated
+# from the one below it.
+
+CELL_PX = 60
+MAX_CLUSTER_ZOOM = 12
+DEFAULT_MARKER_LIMIT = 2000
+
+
+def cell_size(zoom):
+    """Width of a grid cell in degrees at the given zoom level."""
+    return CELL_PX * 360.0 / (256 * 2 ** zoom)
+
+
+def parse_bbox(value):
+    """
+    Parses a 'west,south,east,north' string into a tuple of floats.
+    Returns None when the value is missing or malformed.
+    """
+    if not value:
+        return None
+    try:
+        west, south, east, north = (float(v) for v in value.split(','))
+    except ValueError:
+        return None
+    if south > north:
+        return None
+    return west, max(south, -90.0), east, min(north, 90.0)
+
+
+def split_bbox(bbox):
+    # A bbox crossing the antimeridian (west > east) becomes two plain boxes
+    west, south, east, north = bbox
+    if west <= east:
+        return [(max(west, -180.0), south, min(east, 180.0), north)]
+    return [(max(west, -180.0), south, 180.0, north),
+            (-180.0, south, min(east, 180.0), north)]
+
+
+class _Level:
+    """Cells of one zoom level as parallel arrays."""
+
+    def __init__(self, cx, cy, count, lat_sum, lon_sum, single):
+        self.cx = cx
+        self.cy = cy
+        self.count = count
+        self.lat_sum = lat_sum
+        self.lon_sum = lon_sum
+        self.single = single  # marker index for one-site cells, -1 otherwise
+
+    def mask(self, bbox, size):
+        mask = np.zeros(len(self.cx), dtype=bool)
+        for west, south, east, north in split_bbox(bbox):
+            x0, x1 = (west + 180.0) // size, (east + 180.0) // size
+            y0, y1 = (south + 90.0) // size, (north + 90.0) // size
+            mask |= (self.cx >= x0) & (self.cx <= x1) & (self.cy >= y0) & (self.cy <= y1)
+        return mask
+
+
+def _group(cx, cy, weights_lat, weights_lon, counts, single):
+    """Merges rows sharing a (cx, cy) cell, summing counts and coordinates."""
+    keys = (cx << 32) | cy
+    unique, inverse = np.unique(keys, return_inverse=True)
+    count = np.bincount(inverse, weights=counts).astype(np.int64)
+    lat_sum = np.bincount(inverse, weights=weights_lat)
+    lon_sum = np.bincount(inverse, weights=weights_lon)
+    merged_single = np.full(len(unique), -1, dtype=np.int64)
+    merged_single[inverse] = single
+    merged_single[count != 1] = -1
+    return _Level(unique >> 32, unique & 0xFFFFFFFF, count, lat_sum, lon_sum, merged_single)
+
+
+class SiteIndex:
+    """
+    Precomputed clusters for every zoom level plus cell buckets for
+    viewport-bounded marker lookups.
+    """
+
+    def __init__(self, sites, country_lookup, mineral_lookup):
+        markers = []
+        for site in sites:
+            markers.append({
+                'id': site['SiteID'],
+                'name': site['SiteName'],
+                'country': country_lookup.get(site['CountryID'], "Unknown Country"),
+                'mineral': mineral_lookup.get(site['MineralID'], "Unknown Mineral"),
+                'production': site['Production_tonnes'],
+                'lat': site['Latitude'],
+                'lon': site['Longitude'],
+            })
+        self._build(markers,
+                    np.array([site['MineralID'] or 0 for site in sites], dtype=np.int64),
+                    np.array([site['CountryID'] or 0 for site in sites], dtype=np.int64))
+
+    def _build(self, markers, mineral_ids, country_ids):
+        self.markers = markers
+        self.mineral_ids = mineral_ids
+        self.country_ids = country_ids
+        self.lat = np.array([m['lat'] for m in self.markers], dtype=np.float64)
+        self.lon = np.array([m['lon'] for m in self.markers], dtype=np.float64)
+
+        # Finest level, with marker indices sorted by cell so each cell's
+        # members are one contiguous slice of self.order
+        size = cell_size(MAX_CLUSTER_ZOOM)
+        cx = ((self.lon + 180.0) // size).astype(np.int64)
+        cy = ((self.lat + 90.0) // size).astype(np.int64)
+        finest = _group(cx, cy, self.lat, self.lon,
+                        np.ones(len(self.markers)), np.arange(len(self.markers)))
+        self.order = np.argsort((cx << 32) | cy, kind='stable')
+        self.starts = np.concatenate(([0], np.cumsum(finest.count)))
+
+        self.levels = {MAX_CLUSTER_ZOOM: finest}
+        for zoom in range(MAX_CLUSTER_ZOOM - 1, -1, -1):
+            child = self.levels[zoom + 1]
+            self.levels[zoom] = _group(child.cx >> 1, child.cy >> 1,
+                                       child.lat_sum, child.lon_sum,
+                                       child.count, child.single)
+
+    def __len__(self):
+        return len(self.markers)
+
+    def filtered(self, mineral_ids=(), country_ids=()):
+        """A new index over just the sites of the given minerals and countries."""
+        mask = np.ones(len(self.markers), dtype=bool)
+        if mineral_ids:
+            mask &= np.isin(self.mineral_ids, list(mineral_ids))
+        if country_ids:
+            mask &= np.isin(self.country_ids, list(country_ids))
+        selected = np.flatnonzero(mask)
+        subset = SiteIndex.__new__(SiteIndex)
+        subset._build([self.markers[i] for i in selected], self.mineral_ids[selected], self.country_ids[selected])
+        return subset
+
+    def clusters(self, zoom, bbox=None, limit=DEFAULT_MARKER_LIMIT):
+        """
+        Returns up to `limit` clusters visible at a zoom level. Cells holding
+        a single site carry that site's marker so the client can draw it
+        directly.
+        """
+        zoom = max(0, min(int(zoom), MAX_CLUSTER_ZOOM))
+        level = self.levels[zoom]
+        if bbox is None:
+            selected = np.arange(len(level.cx))
+        else:
+            selected = np.flatnonzero(level.mask(bbox, cell_size(zoom)))
+
+        result = []
+        for i in selected[:limit]:
+            count = int(level.count[i])
+            cluster = {
+                'lat': round(float(level.lat_sum[i]) / count, 5),
+                'lon': round(float(level.lon_sum[i]) / count, 5),
+                'count': count,
+            }
+            if level.single[i] >= 0:
+                cluster['site'] = self.markers[level.single[i]]
+            result.append(cluster)
+        return result
+
+    def markers_in(self, bbox, limit=DEFAULT_MARKER_LIMIT):
+        """
+        Returns up to `limit` markers inside the bbox, plus a flag telling
+        whether more matched than were returned.
+        """
+        finest = self.levels[MAX_CLUSTER_ZOOM]
+        cells = np.flatnonzero(finest.mask(bbox, cell_size(MAX_CLUSTER_ZOOM)))
+        if not len(cells):
+            return [], False
+        if len(cells) * 8 > len(self.markers):
+            # Viewport covers most of the index; a flat scan is cheaper
+            candidates = np.arange(len(self.markers))
+        else:
+            candidates = np.concatenate([self.order[self.starts[c]:self.starts[c + 1]] for c in cells])
+
+        inside = np.zeros(len(candidates), dtype=bool)
+        for west, south, east, north in split_bbox(bbox):
+            lat, lon = self.lat[candidates], self.lon[candidates]
+            inside |= (lat >= south) & (lat <= north) & (lon >= west) & (lon <= east)
+        hits = candidates[inside]
+        return [self.markers[i] for i in hits[:limit]], len(hits) > limit
@@ -0,0 +1,91 @@
+import folium
+from branca.element import MacroElement
+from jinja2 import Template
+
+# -------------------------
+# Mineral Sites Map Shell
+# -------------------------
+# Builds the Folium page for the sites map. Only the map route imports this
+# module, so folium (and the pandas it pulls in) loads on the first map
+# request rather than at app startup.
+
+
+class SiteLayer(MacroElement):
+    """Loads the GeoJSON tile for each visible grid cell and drops it when it scrolls away."""
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        (function () {
+            var map = {{ this._parent.get_name() }};
+            var tileUrl = {{ this.tile_url|tojson }};
+            var groups = {};
+            function esc(v) {
+                return String(v).replace(/[&<>"']/g, function (c) {
+                    return {'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'}[c];
+                });
+            }
+            function siteMarker(s, lat, lon) {
+                return L.marker([lat, lon]).bindPopup(
+                    "<div style='font-size:14px'>" +
+                    "<strong>Site:</strong> " + esc(s.name) + "<br>" +
+                    "<strong>Country:</strong> " + esc(s.country) + "<br>" +
+                    "<strong>Mineral:</strong> " + esc(s.mineral) + "<br>" +
+                    "<strong>Production:</strong> " + esc(s.production) + " tonnes</div>",
+                    {maxWidth: 250}
+                );
+            }
+            function clusterMarker(count, lat, lon) {
+                var size = 28 + Math.min(4 * Math.log(count), 32);
+                return L.marker([lat, lon], {icon: L.divIcon({
+                    className: '',
+                    html: "<div style='background:rgba(79,70,229,0.8);color:#fff;border-radius:50%;" +
+                          "width:" + size + "px;height:" + size + "px;line-height:" + size + "px;" +
+                          "text-align:center;font-weight:bold'>" + count + "</div>",
+                    iconSize: [size, size]
+                })}).on('click', function () {
+                    map.setView([lat, lon], map.getZoom() + 2);
+                });
+            }
+            function tileKey(c) { return c.z + '/' + c.x + '/' + c.y; }
+            var SiteTiles = L.GridLayer.extend({
+                createTile: function (coords, done) {
+                    var tile = document.createElement('div');
+                    var key = tileKey(coords);
+                    var url = tileUrl.replace('{z}', coords.z).replace('{x}', coords.x).replace('{y}', coords.y);
+                    fetch(url)
+                        .then(function (r) { return r.json(); })
+                        .then(function (data) {
+                            var group = L.layerGroup(data.features.map(function (f) {
+                                var lon = f.geometry.coordinates[0], lat = f.geometry.coordinates[1];
+                                return f.properties.count
+                                    ? clusterMarker(f.properties.count, lat, lon)
+                                    : siteMarker(f.properties, lat, lon);
+                            }));
+                            // The tile may have been dropped while it loaded
+                            if (tile.isConnected) { groups[key] = group.addTo(map); }
+                            done(null, tile);
+                        })
+                        .catch(function (e) { done(e, tile); });
+                    return tile;
+                }
+            });
+            var layer = new SiteTiles({noWrap: true, keepBuffer: 1});
+            layer.on('tileunload', function (e) {
+                var key = tileKey(e.coords);
+                if (groups[key]) { map.removeLayer(groups[key]); delete groups[key]; }
+            });
+            layer.addTo(map);
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, tile_url):
+        super().__init__()
+        self._name = 'SiteLayer'
+        self.tile_url = tile_url
+
+
+def render_site_map(tile_url):
+    """HTML of the Africa map; sites are loaded tile by tile by SiteLayer."""
+    africa_map = folium.Map(location=[-2.0, 23.5], zoom_start=4)
+    SiteLayer(tile_url).add_to(africa_map)
+    return africa_map._repr_html_()
@@ -0,0 +1,116 @@
+import json
+import math
+
+from site_index import MAX_CLUSTER_ZOOM
+
+# -------------------------
+# Site Tiles and GeoJSON Feed
+# -------------------------
+# The map fetches sites as z/x/y tiles in the Web Mercator scheme Leaflet
+# uses, each a GeoJSON FeatureCollection: the SiteIndex clusters of that
+# zoom up to MAX_CLUSTER_ZOOM, single sites beyond it. Every cluster or
+# site belongs to exactly one tile (the one its point falls in), so
+# adjacent tiles never draw it twice. Web Mercator stops at about 85.05
+# degrees, so the top and bottom rows of tiles also take the sites
+# beyond it, up to the poles. Tiles are cached compressed by data
+# version (see http_cache.py), and the map asks for them with the version
+# in the URL so the browser can keep them.
+#
+# /sites.geojson is the whole site list as one FeatureCollection, streamed
+# from SQLite a batch at a time.
+
+MAX_TILE_ZOOM = 18
+# Cells are looked up in a slightly larger box than the tile, so a cluster
+# whose rounded centre lands just over the tile edge is still found
+EDGE_MARGIN_DEG = 1e-4
+
+SITE_FEATURES_QUERY = """
+    SELECT s.SiteID, s.SiteName, c.CountryName, m.MineralName, s.Production_tonnes,
+           s.Latitude, s.Longitude
+    FROM sites s
+    LEFT JOIN countries c ON c.CountryID = s.CountryID
+    LEFT JOIN minerals m ON m.MineralID = s.MineralID
+    WHERE s.Latitude IS NOT NULL AND s.Longitude IS NOT NULL
+"""
+
+
+def valid_tile(z, x, y):
+    return 0 <= z <= MAX_TILE_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+
+def tile_bbox(z, x, y):
+    """(west, south, east, north) of a Web Mercator tile, in degrees."""
+    n = 2 ** z
+    west = x / n * 360.0 - 180.0
+    east = (x + 1) / n * 360.0 - 180.0
+    north = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+    south = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 1) / n))))
+    return west, south, east, north
+
+
+def _feature(lat, lon, properties):
+    return {'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': [lon, lat]},
+            'properties': properties}
+
+
+def site_feature(marker):
+    return _feature(marker['lat'], marker['lon'],
+                    {k: v for k, v in marker.items() if k not in ('lat', 'lon')})
+
+
+def tile_features(index, z, x, y):
+    """The FeatureCollection for tile z/x/y of a SiteIndex."""
+    west, south, east, north = tile_bbox(z, x, y)
+    if y == 0:
+        north = 90.0
+    if y == 2 ** z - 1:
+        south = -90.0
+
+    def owns(lat, lon):
+        # West and north edges are inclusive, east and south exclusive, so
+        # a point on a shared edge belongs to one tile only
+        return ((west <= lon < east or lon == east == 180.0)
+                and (south < lat <= north or lat == south == -90.0))
+
+    search = (west - EDGE_MARGIN_DEG, south - EDGE_MARGIN_DEG, east + EDGE_MARGIN_DEG, north + EDGE_MARGIN_DEG)
+    features = []
+    if z <= MAX_CLUSTER_ZOOM:
+        for cluster in index.clusters(z, search, limit=None):
+            if not owns(cluster['lat'], cluster['lon']):
+                continue
+            if 'site' in cluster:
+                features.append(site_feature(cluster['site']))
+            else:
+                features.append(_feature(cluster['lat'], cluster['lon'], {'count': cluster['count']}))
+    else:
+        markers, _ = index.markers_in(search, limit=max(len(index), 1))
+        features = [site_feature(m) for m in markers if owns(m['lat'], m['lon'])]
+    return {'type': 'FeatureCollection', 'features': features}
+
+
+def features_query(mineral_ids=(), country_ids=()):
+    sql, params = SITE_FEATURES_QUERY, []
+    for column, values in (('s.MineralID', mineral_ids), ('s.CountryID', country_ids)):
+        if values:
+            sql += f" AND {column} IN (SELECT value FROM json_each(?))"
+            params.append(json.dumps(list(values)))
+    return sql + " ORDER BY s.SiteID", params
+
+
+def iter_geojson(batches):
+    yield '{"type": "FeatureCollection", "features": ['
+    first = True
+    for rows in batches:
+        parts = []
+        for site_id, name, country, mineral, production, lat, lon in rows:
+            feature = _feature(lat, lon, {
+                'id': site_id,
+                'name': name,
+                'country': country or "Unknown Country",
+                'mineral': mineral or "Unknown Mineral",
+                'production': production,
+            })
+            parts.append(('\n' if first else ',\n') + json.dumps(feature))
+            first = False
+        yield ''.join(parts)
+    yield '\n]}\n'
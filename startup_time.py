@@ -0,0 +1,91 @@
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+from lazy_imports import HEAVY_MODULES
+
+# -------------------------
+# Startup Time Check
+# -------------------------
+# Imports app.py in fresh interpreters with `python -X importtime` and
+# reports the wall time of the import plus the modules that cost the most.
+# Fails if app startup pulls in one of the heavy libraries that are meant to
+# load lazily (see lazy_imports.py), or if the median import time exceeds
+# the budget.
+#
+#     python startup_time.py                  # 5 runs, 500 ms budget
+#     python startup_time.py --runs 10 --top 25 --budget-ms 300
+
+IMPORT_LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)')
+
+
+def measure_import(module="app"):
+    """
+    Imports `module` in a new interpreter. Returns (total_us, modules) where
+    modules maps each imported module to its (self_us, cumulative_us).
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+
+    modules, total = {}, 0
+    for line in result.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, name = match.groups()
+        modules[name] = (int(self_us), int(cumulative_us))
+        if name == module and not indent:
+            total = int(cumulative_us)
+    return total, modules
+
+
+def heavy_modules_loaded(modules):
+    packages = {name.split('.')[0] for name in HEAVY_MODULES}
+    return sorted(packages & {name.split('.')[0] for name in modules})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure how long importing the app takes.")
+    parser.add_argument("--module", default="app", help="module to import (default: app)")
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters to time")
+    parser.add_argument("--top", type=int, default=15, help="slowest modules to list")
+    parser.add_argument("--budget-ms", type=float, default=500, help="fail above this median")
+    args = parser.parse_args()
+
+    totals, slowest = [], {}
+    for _ in range(args.runs):
+        total, modules = measure_import(args.module)
+        totals.append(total)
+        for name, (self_us, cumulative_us) in modules.items():
+            best = slowest.get(name, (float('inf'), float('inf')))
+            # Keep each module's fastest run, which is the least noisy one
+            slowest[name] = (min(best[0], self_us), min(best[1], cumulative_us))
+
+    median_ms = statistics.median(totals) / 1000
+    print(f"import {args.module}: median {median_ms:.0f} ms, "
+          f"min {min(totals) / 1000:.0f} ms, max {max(totals) / 1000:.0f} ms over {args.runs} runs")
+    print(f"\n{'self ms':>9} {'cumul. ms':>10}  module")
+    for name, (self_us, cumulative_us) in sorted(slowest.items(), key=lambda m: -m[1][0])[:args.top]:
+        print(f"{self_us / 1000:>9.1f} {cumulative_us / 1000:>10.1f}  {name}")
+
+    failed = False
+    heavy = heavy_modules_loaded(slowest)
+    if heavy:
+        print(f"\nHeavy modules imported at startup: {', '.join(heavy)}")
+        failed = True
+    if median_ms > args.budget_ms:
+        print(f"\nMedian startup {median_ms:.0f} ms is over the {args.budget_ms:.0f} ms budget")
+        failed = True
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,28 @@
+import os
+
+from lazy_imports import preload
+
+# -------------------------
+# Production Entry Point
+# -------------------------
+# Served by gunicorn with the settings in gunicorn.conf.py:
+#
+#     gunicorn -c gunicorn.conf.py
+#
+# The master imports this module once before forking: the heavy libraries,
+# the app (which runs migrations) and the site index are loaded here, so
+# every worker starts with them already in (copy-on-write shared) memory
+# instead of paying for them again.
+
+# The app loads these lazily (see lazy_imports.py); a long-lived server
+# would rather pay for them once, here, than in every worker
+preload()
+
+from app import app, get_site_index  # noqa: E402
+
+if os.environ.get("PRELOAD_SITE_INDEX", "1") == "1":
+    # Built outside a request, so it uses a standalone connection that is
+    # closed again rather than a pooled one the workers would inherit
+    get_site_index()
+
+application = app